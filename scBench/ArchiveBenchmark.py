@@ -0,0 +1,114 @@
+"""Compares saving a session as one PNG file per screenshot with adding it to a session archive: time per screenshot,
+size on disk, and the time to export the archive back to PNG files.
+
+Run with: python -m scBench.ArchiveBenchmark
+"""
+from scCore.CaptureBackend import SyntheticBackend
+from scCore.SessionArchive import SessionArchive, ArchiveReader
+from scCore.Encoders import createEncoder
+from pathlib import Path
+import tempfile
+import argparse
+import shutil
+import time
+
+# Scenes: 'static' is a still window where only a cursor and a small counter change, as in a burst of a mostly idle
+# screen. 'sweep' is the synthetic backend's bar sweeping across the whole frame, the worst case for deltas.
+SCENES = ('static', 'sweep')
+
+def sceneFrames(scene:str, size:tuple, frames:int) -> list:
+    """
+    Returns:
+        list: frames images of the scene
+    """
+    backend = SyntheticBackend()
+    if scene == 'sweep':
+        return [backend.grab((0, 0) + size) for i in range(frames)]
+    background = backend._background(size)
+    images = []
+    for i in range(frames):
+        image = background.copy()
+        cursor = (40 + i * 7) % (size[0] - 16)
+        image.paste((0, 0, 0), (cursor, size[1] // 2, cursor + 16, size[1] // 2 + 24))
+        # A counter in a corner, as a clock or a progress figure would be
+        image.paste(((i * 37) % 256, 0, 0), (size[0] - 80, 10, size[0] - 10, 30))
+        images.append(image)
+    return images
+
+def measureFiles(folder:Path, images:list) -> dict:
+    encoder = createEncoder('png')
+    size = 0
+    start = time.perf_counter()
+    for i, image in enumerate(images):
+        path = folder / f'{i}.png'
+        with open(path, 'wb') as f:
+            encoder.encode(image, f)
+        size += path.stat().st_size
+    return {'msPerShot': (time.perf_counter() - start) / len(images) * 1000, 'bytes': size}
+
+def measureArchive(folder:Path, images:list, keyframeInterval:int) -> dict:
+    archive = SessionArchive(folder, keyframeInterval)
+    archive.open()
+    start = time.perf_counter()
+    for image in images:
+        archive.append(image)
+    summary = archive.close()
+    elapsed = time.perf_counter() - start
+    reader = ArchiveReader(archive.path)
+    start = time.perf_counter()
+    for i in range(len(reader)):
+        reader.image(i)
+    readTime = time.perf_counter() - start
+    # Random access pays for the deltas since the keyframe
+    start = time.perf_counter()
+    for i in range(len(reader) - 1, -1, -max(1, keyframeInterval // 3)):
+        reader._cache.clear()
+        reader.image(i)
+    randomTime = time.perf_counter() - start
+    randomCount = len(range(len(reader) - 1, -1, -max(1, keyframeInterval // 3)))
+    reader.close()
+    return {'msPerShot': elapsed / len(images) * 1000, 'bytes': summary['bytes'], 'keyframes': summary['keyframes'],
+            'estimatedRatio': summary['ratio'], 'readMsPerShot': readTime / len(images) * 1000,
+            'randomReadMs': randomTime / randomCount * 1000}
+
+def run(size:tuple=(1920, 1080), frames:int=60, keyframeInterval:int=30, folder:Path=None) -> dict:
+    """Save each scene as files and as an archive
+    Args:
+        size (tuple, optional): Frame size. Defaults to (1920, 1080).
+        frames (int, optional): Screenshots per session. Defaults to 60.
+        keyframeInterval (int, optional): See SessionArchive. Defaults to 30.
+        folder (Path, optional): Where to write, for instance a network share. Defaults to a temporary folder.
+    Returns:
+        dict: Results per scene, with the ratio of the PNG files' size to the archive's
+    """
+    if folder:
+        folder.mkdir(parents=True, exist_ok=True)
+    results = {'size': list(size), 'frames': frames, 'keyframeInterval': keyframeInterval, 'scenes': {}}
+    for scene in SCENES:
+        images = sceneFrames(scene, size, frames)
+        workDir = Path(tempfile.mkdtemp(dir=folder))
+        try:
+            files = measureFiles(workDir, images)
+            archive = measureArchive(workDir, images, keyframeInterval)
+        finally:
+            shutil.rmtree(workDir, ignore_errors=True)
+        results['scenes'][scene] = {'files': files, 'archive': archive, 'ratio': files['bytes'] / archive['bytes']}
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m scBench.ArchiveBenchmark", description='Compare PNG files and session archives')
+    parser.add_argument("-W", "--width", type=int, default=1920, help="Frame width. Default: 1920")
+    parser.add_argument("-H", "--height", type=int, default=1080, help="Frame height. Default: 1080")
+    parser.add_argument("-n", "--frames", type=int, default=60, help="Screenshots per session. Default: 60")
+    parser.add_argument("-k", "--keyframe-interval", dest="keyframeInterval", type=int, default=30, help="Default: 30")
+    parser.add_argument("-d", "--dir", type=Path, default=None, help="Folder to run in. Default: a temporary folder")
+    args = parser.parse_args()
+    results = run((args.width, args.height), args.frames, args.keyframeInterval, args.dir)
+    for scene, result in results['scenes'].items():
+        files, archive = result['files'], result['archive']
+        print(f"{scene:>7}: PNG files {files['bytes'] / 1024:9.0f} KB, {files['msPerShot']:6.1f} ms/shot | "
+              f"archive {archive['bytes'] / 1024:9.0f} KB, {archive['msPerShot']:6.1f} ms/shot, read {archive['readMsPerShot']:5.1f} ms/shot in order, "
+              f"{archive['randomReadMs']:5.1f} ms at random | {result['ratio']:.1f}x smaller (estimated {archive['estimatedRatio']:.1f}x)")
+
+if __name__ == "__main__":
+    main()
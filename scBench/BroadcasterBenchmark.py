@@ -0,0 +1,45 @@
+"""Measures how long reporting an event takes as the number of subscribers grows.
+Only the cost paid by the reporting thread is measured. Delivery to subscribers happens elsewhere.
+
+Run with: python -m scBench.BroadcasterBenchmark
+"""
+from scCore.Broadcaster import Broadcaster, Subscriber, Event, EventType
+import argparse
+import time
+
+class CountingSubscriber(Subscriber):
+    """A subscriber that does as little as possible
+    """
+    def __init__(self):
+        self.count = 0
+
+    def trigger(self, event:Event) -> None:
+        self.count += 1
+
+def measureFanOut(subscriberCount:int, events:int) -> dict:
+    """
+    Returns:
+        dict: Mean time spent in Broadcaster.report, in microseconds
+    """
+    broadcaster = Broadcaster()
+    for i in range(subscriberCount):
+        # Polled, so that a thousand subscribers don't start a thousand delivery threads
+        broadcaster.subscribe(CountingSubscriber(), polled=True)
+    start = time.perf_counter()
+    for i in range(events):
+        broadcaster.report(EventType.SCREENSHOT, 'Screenshot saved')
+    elapsed = time.perf_counter() - start
+    return {'subscribers': subscriberCount, 'events': events, 'reportUs': elapsed / events * 1000000}
+
+def run(subscriberCounts:tuple=(1, 10, 100, 1000), events:int=1000) -> dict:
+    return {str(count): measureFanOut(count, events) for count in subscriberCounts}
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m scBench.BroadcasterBenchmark", description='Measure the cost of reporting events to many subscribers')
+    parser.add_argument("-n", "--events", type=int, default=1000, help="Events reported per subscriber count. Default: 1000")
+    args = parser.parse_args()
+    for count, result in run(events=args.events).items():
+        print(f"{count:>5} subscribers: {result['reportUs']:10.1f} us per event")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Measures the capture-to-disk path headless: synthetic frames go through the real pipeline, namer and encoder,
+and are written to disk.
+
+Run with: python -m scBench.CaptureBenchmark
+"""
+from scCore.CapturePipeline import CapturePipeline, Backpressure
+from scCore.CaptureBackend import SyntheticBackend
+from scCore.ScreenshotNamer import ScreenShotNamer
+from scCore.Broadcaster import Broadcaster, Subscriber, Event, EventType
+from scCore.Encoders import createEncoder
+from pathlib import Path
+import threading
+import tempfile
+import argparse
+import shutil
+import time
+
+REGION_SIZES = {
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4K': (3840, 2160),
+    'ultrawide': (3440, 1440)
+}
+
+class SaveRecorder(Subscriber):
+    """Records the latency of every saved screenshot, and lets callers wait until a number of them are saved
+    """
+    def __init__(self):
+        self.latencies = []
+        self.failures = 0
+        self._condition = threading.Condition()
+
+    def trigger(self, event:Event) -> None:
+        with self._condition:
+            if event.type == EventType.SCREENSHOT and event.data and 'latency' in event.data:
+                self.latencies.append(event.data['latency'])
+            elif event.type == EventType.FAILURE:
+                self.failures += 1
+            else:
+                return
+            self._condition.notify_all()
+
+    def waitFor(self, count:int, timeout:float=60) -> bool:
+        """Wait until count screenshots have been saved or have failed
+        Returns:
+            bool: False if the timeout expired first
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.latencies) + self.failures >= count, timeout)
+
+def percentile(values:list, p:float) -> float:
+    """Nearest-rank percentile of values, p between 0 and 100
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def createPipeline(folder:Path, recorder:SaveRecorder, format:str, workers:int, queueSize:int) -> CapturePipeline:
+    broadcaster = Broadcaster()
+    broadcaster.subscribe(recorder)
+    encoder = createEncoder(format)
+    pipeline = CapturePipeline(ScreenShotNamer(folder, encoder.suffix), broadcaster, workers, 'thread', queueSize, Backpressure.BLOCK, encoder)
+    pipeline.start()
+    return pipeline
+
+def measureLatency(folder:Path, shots:int=100, rate:float=5, size:tuple=REGION_SIZES['1080p'], format:str='png', workers:int=2) -> dict:
+    """Trigger shots at a steady rate, below what the pipeline can sustain, and measure the time from trigger to file on disk
+    Returns:
+        dict: p50, p95 and p99 latencies in milliseconds
+    """
+    backend = SyntheticBackend()
+    recorder = SaveRecorder()
+    pipeline = createPipeline(folder, recorder, format, workers, shots)
+    region = (0, 0) + size
+    nextTime = time.perf_counter()
+    for i in range(shots):
+        # Same steps as ScreenShotEventHandler.takeScreenshot
+        triggerTime = time.perf_counter()
+        pipeline.submit(backend.grab(region), triggerTime=triggerTime)
+        nextTime += 1 / rate
+        time.sleep(max(0, nextTime - time.perf_counter()))
+    recorder.waitFor(shots)
+    pipeline.stop()
+    latencies = [latency * 1000 for latency in recorder.latencies]
+    return {
+        'shots': shots,
+        'rate': rate,
+        'size': list(size),
+        'format': format,
+        'p50Ms': percentile(latencies, 50),
+        'p95Ms': percentile(latencies, 95),
+        'p99Ms': percentile(latencies, 99),
+        'failures': recorder.failures
+    }
+
+def measureThroughput(folder:Path, size:tuple, shots:int=50, format:str='png', workers:int=2) -> dict:
+    """Submit shots as fast as the pipeline accepts them, and measure how many are written per second
+    Returns:
+        dict: Shots per second, grab included
+    """
+    backend = SyntheticBackend()
+    recorder = SaveRecorder()
+    pipeline = createPipeline(folder, recorder, format, workers, workers * 2)
+    region = (0, 0) + size
+    start = time.perf_counter()
+    for i in range(shots):
+        pipeline.submit(backend.grab(region))
+    recorder.waitFor(shots)
+    elapsed = time.perf_counter() - start
+    pipeline.stop()
+    return {
+        'shots': shots,
+        'size': list(size),
+        'format': format,
+        'workers': workers,
+        'shotsPerSecond': shots / elapsed,
+        'failures': recorder.failures
+    }
+
+def run(folder:Path=None, quick:bool=False, format:str='png', workers:int=2) -> dict:
+    """Run the latency and throughput benchmarks
+    Args:
+        folder (Path, optional): Where screenshots are written. Defaults to a temporary folder.
+        quick (bool, optional): Take fewer shots. Defaults to False.
+        format (str, optional): The format screenshots are saved in. Defaults to 'png'.
+        workers (int, optional): Number of pipeline workers. Defaults to 2.
+    Returns:
+        dict: The results
+    """
+    if folder:
+        folder.mkdir(parents=True, exist_ok=True)
+    workDir = Path(tempfile.mkdtemp(dir=folder))
+    try:
+        results = {'latency': measureLatency(workDir, 20 if quick else 100, format=format, workers=workers)}
+        results['throughput'] = {}
+        for name, size in REGION_SIZES.items():
+            results['throughput'][name] = measureThroughput(workDir, size, 10 if quick else 50, format, workers)
+        return results
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m scBench.CaptureBenchmark", description='Measure capture-to-disk latency and throughput')
+    parser.add_argument("-d", "--dir", type=Path, default=None, help="Folder screenshots are written to. Default: a temporary folder")
+    parser.add_argument("-f", "--format", default='png', help="Format screenshots are saved in. Default: png")
+    parser.add_argument("--workers", type=int, default=2, help="Number of pipeline workers. Default: 2")
+    parser.add_argument("--quick", action='store_true', help="Take fewer shots")
+    args = parser.parse_args()
+    results = run(args.dir, args.quick, args.format, args.workers)
+    latency = results['latency']
+    print(f"Latency at {latency['rate']:g} shots/s: p50 {latency['p50Ms']:.1f} ms, p95 {latency['p95Ms']:.1f} ms, p99 {latency['p99Ms']:.1f} ms")
+    for name, throughput in results['throughput'].items():
+        print(f"{name:>10}: {throughput['shotsPerSecond']:.1f} shots/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Measures the time each encoder takes on a frame, and the size of its output.
+
+Run with: python -m scBench.EncoderBenchmark
+"""
+from scCore.CaptureBackend import SyntheticBackend
+from scCore.Encoders import FORMATS, PRESETS, createEncoder, missingPackages
+import argparse
+import time
+import io
+
+def measureEncoder(encoder, images:list) -> dict:
+    """Encode every image in memory
+    Returns:
+        dict: Mean encode time in milliseconds and mean output size in bytes
+    """
+    totalTime = 0.0
+    totalSize = 0
+    for image in images:
+        buffer = io.BytesIO()
+        start = time.perf_counter()
+        encoder.encode(image, buffer)
+        totalTime += time.perf_counter() - start
+        totalSize += buffer.tell()
+    return {'encodeMs': totalTime / len(images) * 1000, 'bytes': totalSize // len(images)}
+
+def run(size:tuple=(1920, 1080), frames:int=5) -> dict:
+    """Run every format and preset on synthetic frames
+    Args:
+        size (tuple, optional): Frame size. Defaults to (1920, 1080).
+        frames (int, optional): Number of frames encoded per format. Defaults to 5.
+    Returns:
+        dict: Results per format, and per preset
+    """
+    backend = SyntheticBackend()
+    images = [backend.grab((0, 0) + size) for i in range(frames)]
+    results = {'size': list(size), 'formats': {}, 'presets': {}}
+    for format in FORMATS:
+        missing = missingPackages(format)
+        if missing:
+            results['formats'][format] = {'skipped': 'missing ' + ', '.join(missing)}
+            continue
+        results['formats'][format] = measureEncoder(createEncoder(format), images)
+    for preset in PRESETS:
+        results['presets'][preset] = measureEncoder(createEncoder('png', preset=preset), images)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m scBench.EncoderBenchmark", description='Measure encode time and output size of each format')
+    parser.add_argument("-W", "--width", type=int, default=1920, help="Frame width. Default: 1920")
+    parser.add_argument("-H", "--height", type=int, default=1080, help="Frame height. Default: 1080")
+    parser.add_argument("-n", "--frames", type=int, default=5, help="Frames encoded per format. Default: 5")
+    args = parser.parse_args()
+    results = run((args.width, args.height), args.frames)
+    for kind in ('formats', 'presets'):
+        for name, result in results[kind].items():
+            if 'skipped' in result:
+                print(f"{name:>10}: skipped, {result['skipped']}")
+                continue
+            print(f"{name:>10}: {result['encodeMs']:8.1f} ms, {result['bytes']:>10} bytes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Fires captures at a listening screenshot cropper through its control port, at a fixed rate, and measures the
+end-to-end throughput and latency: from the moment each capture was due to its files being on disk.
+Captures are sent on a schedule, whether or not the previous ones were answered, so a cropper that falls behind
+shows up as growing latencies rather than as a lower request rate.
+
+Start the cropper with a control port first, for instance with generated frames:
+    python screenshot-cropper.py -b synthetic --control-port 8765
+Then run: python -m scBench.LoadGenerator --port 8765 --rate 20 --duration 10
+"""
+from scCore.ControlClient import ControlClient, ControlError
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import argparse
+import time
+
+def percentile(values:list, p:float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+class LoadGenerator(object):
+    """Sends captures at a fixed rate from a pool of clients, one connection per client thread
+    """
+    def __init__(self, port:int, rate:float, duration:float, concurrency:int=4, key:str=None):
+        """
+        Args:
+            port (int): Control port of the cropper
+            rate (float): Captures sent per second
+            duration (float): Seconds captures are sent for
+            concurrency (int, optional): Maximum number of captures waiting for an answer. Defaults to 4.
+            key (str, optional): Region key to capture. Defaults to the F12 capture.
+        """
+        self.port = port
+        self.rate = rate
+        self.duration = duration
+        self.concurrency = concurrency
+        self.key = key
+        self._local = threading.local()
+        self._clients = []
+        self._lock = threading.Lock()
+        # Seconds from when each capture was due to its answer
+        self.latencies = []
+        self.serverLatencies = []
+        self.files = 0
+        self.skipped = 0
+        self.errors = {}
+
+    def run(self) -> dict:
+        """Send the captures. Blocks for about duration seconds, plus the time taken by the last answers.
+        Returns:
+            dict: See summary
+        """
+        count = int(self.rate * self.duration)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            for i in range(count):
+                due = start + i / self.rate
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._capture, due)
+        elapsed = time.perf_counter() - start
+        for client in self._clients:
+            client.close()
+        return self.summary(count, elapsed)
+
+    def _capture(self, due:float) -> None:
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = ControlClient(self.port)
+            with self._lock:
+                self._clients.append(client)
+        try:
+            result = client.capture(self.key)
+            with self._lock:
+                self.latencies.append(time.perf_counter() - due)
+                self.serverLatencies.append(result['ms'] / 1000)
+                self.files += len(result['paths'])
+                self.skipped += result['skipped']
+        except (ControlError, OSError) as e:
+            with self._lock:
+                self.errors[str(e)] = self.errors.get(str(e), 0) + 1
+
+    def summary(self, sent:int, elapsed:float) -> dict:
+        """
+        Returns:
+            dict: Captures sent, answered and failed, files written per second, and latency percentiles in ms
+        """
+        return {
+            'sent': sent,
+            'answered': len(self.latencies),
+            'failed': sum(self.errors.values()),
+            'files': self.files,
+            'skipped': self.skipped,
+            'filesPerSecond': self.files / elapsed if elapsed > 0 else 0.0,
+            'p50Ms': percentile(self.latencies, 50) * 1000,
+            'p95Ms': percentile(self.latencies, 95) * 1000,
+            'p99Ms': percentile(self.latencies, 99) * 1000,
+            'maxMs': max(self.latencies, default=0) * 1000,
+            'serverP50Ms': percentile(self.serverLatencies, 50) * 1000,
+            'errors': self.errors
+        }
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m scBench.LoadGenerator", description='Fire captures at a listening screenshot cropper and measure throughput and latency')
+    parser.add_argument("-P", "--port", type=int, required=True, help="Control port of the listening screenshot cropper")
+    parser.add_argument("-r", "--rate", type=float, default=10, help="Captures sent per second. Default: 10")
+    parser.add_argument("-d", "--duration", type=float, default=10, help="Seconds to send captures for. Default: 10")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Maximum number of captures waiting for an answer. Default: 4")
+    parser.add_argument("-k", "--key", default=None, help="Region key to capture. Default: the F12 capture")
+    args = parser.parse_args()
+    result = LoadGenerator(args.port, args.rate, args.duration, args.concurrency, args.key).run()
+    errors = result.pop('errors')
+    print(', '.join(f'{key} {value:.1f}' if isinstance(value, float) else f'{key} {value}' for key, value in result.items()))
+    for error, count in errors.items():
+        print(f'{count} x {error}')
+    client = ControlClient(args.port)
+    try:
+        stages = client.stats()['stages']
+        for stage, stats in stages.items():
+            print(f"{stage:>8}: p50 {stats['p50']:.1f} ms, p99 {stats['p99']:.1f} ms")
+    except (ControlError, OSError) as e:
+        print(f'Could not get the stats: {e}')
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Measures the peak memory used while saving a single shot, for large regions, with and without strip encoding.
+Memory is measured as the peak resident memory of the process, so that it includes the buffers Pillow and the encoders
+allocate on their own, which tracemalloc doesn't see. Each shot is saved in a fresh process, so that memory freed by
+an earlier shot and kept by the allocator can't hide the next one. The grabbed frame itself is allocated before the
+shot is measured: it always holds the whole area, width x height x 3 bytes, and strip encoding doesn't change that.
+Frames are made noisy, so that they compress about as badly as game or photo screenshots.
+
+Measuring needs Linux, or the psutil package elsewhere.
+Run with: python -m scBench.MemoryBenchmark
+To fail when saving a shot of a region needs more than a given amount of memory on top of the grabbed frame:
+    python -m scBench.MemoryBenchmark --region 7680x2160 --assert-mb 16
+"""
+from scCore.CapturePipeline import CapturePipeline
+from scCore.CaptureBackend import SyntheticBackend
+from scCore.ScreenshotNamer import ScreenShotNamer
+from scCore.Broadcaster import Broadcaster
+from scCore.Encoders import createEncoder
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from PIL import Image
+import multiprocessing
+import threading
+import tempfile
+import logging
+import argparse
+import sys
+import gc
+import os
+
+REGION_SIZES = {
+    '1080p': (1920, 1080),
+    '4K': (3840, 2160),
+    'dual 4K': (7680, 2160),
+    '8K': (7680, 4320)
+}
+FORMATS = ('png', 'raw')
+# Standard deviation of the noise added to frames
+NOISE = 32
+# Seconds between two samples of the resident memory, where the peak can't be read from the system
+SAMPLE_INTERVAL = 0.001
+# Size of the shot saved before measuring, so that the encoder and numpy are loaded
+WARMUP_SIZE = (64, 64)
+
+def noisyFrame(width:int, height:int):
+    """A synthetic frame with noise in its red channel
+    """
+    image = SyntheticBackend().grab((0, 0, width, height))
+    return Image.merge('RGB', (Image.effect_noise((width, height), NOISE),) + image.split()[1:])
+
+def peakResident(action) -> int:
+    """Run action, and measure the peak resident memory of the process meanwhile
+    Returns:
+        int: Peak resident memory above the level before action, in bytes
+    Raises:
+        RuntimeError: If memory can't be measured on this system
+    """
+    if os.path.exists('/proc/self/clear_refs'):
+        # Linux keeps the peak itself, and resets it on request
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        before = procStatus('VmRSS')
+        action()
+        return procStatus('VmHWM') - before
+    try:
+        import psutil
+    except ImportError:
+        raise RuntimeError('Measuring memory needs Linux, or the psutil package')
+    process = psutil.Process()
+    before = process.memory_info().rss
+    peak = [before]
+    done = threading.Event()
+    def sample():
+        while not done.wait(SAMPLE_INTERVAL):
+            peak[0] = max(peak[0], process.memory_info().rss)
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        action()
+    finally:
+        done.set()
+        sampler.join()
+    return max(peak[0], process.memory_info().rss) - before
+
+def procStatus(key:str) -> int:
+    """
+    Returns:
+        int: A memory figure of /proc/self/status, in bytes
+    """
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(key + ':'):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError(f'{key} missing from /proc/self/status')
+
+def measureShot(width:int, height:int, format:str='png', streamed:bool=True, folder:Path=None) -> float:
+    """Save one synthetic shot through the pipeline in this process, and measure the memory used meanwhile. Run it in a
+    fresh process, see peakPerShot.
+    Returns:
+        float: Peak resident memory above the level before the shot, grabbed frame excluded, in MB
+    """
+    with tempfile.TemporaryDirectory(dir=folder) as tempFolder:
+        encoder = createEncoder(format, 1, 'rle')
+        namer = ScreenShotNamer(Path(tempFolder), encoder.suffix)
+        pipeline = CapturePipeline(namer, Broadcaster(), workers=1, encoder=encoder, streamMinPixels=1 if streamed else sys.maxsize)
+        pipeline.start()
+        try:
+            # A small first shot loads the encoder and names the folder, without leaving large buffers behind
+            pipeline.submit(Image.new('RGB', WARMUP_SIZE)).result()
+            image = noisyFrame(width, height)
+            gc.collect()
+            peak = peakResident(lambda: pipeline.submit(image).result())
+        finally:
+            pipeline.stop()
+    return peak / (1024 * 1024)
+
+def peakPerShot(width:int, height:int, format:str='png', streamed:bool=True, folder:Path=None) -> float:
+    """Save one synthetic shot through the pipeline in a fresh process, and measure the memory used meanwhile
+    Args:
+        width (int): Width of the region
+        height (int): Height of the region
+        format (str, optional): One of Encoders.FORMATS. Defaults to 'png'.
+        streamed (bool, optional): Encode straight into the file a few rows at a time, rather than in memory. Defaults to True.
+        folder (Path, optional): Where the shot is written. Defaults to a temporary folder.
+    Returns:
+        float: Peak resident memory used to save the shot, on top of the grabbed frame, in MB
+    Raises:
+        RuntimeError: If memory can't be measured on this system
+    """
+    if folder:
+        folder.mkdir(parents=True, exist_ok=True)
+    # A spawned process doesn't inherit the logging set up here
+    level = logging.getLogger().getEffectiveLevel()
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'), initializer=logging.getLogger().setLevel, initargs=(level,)) as pool:
+        return pool.submit(measureShot, width, height, format, streamed, folder).result()
+
+def frameMb(width:int, height:int) -> float:
+    """
+    Returns:
+        float: Memory held by a grabbed frame of the region, in MB
+    """
+    return width * height * 3 / (1024 * 1024)
+
+def run(folder:Path=None, sizes:dict=REGION_SIZES) -> list:
+    """
+    Returns:
+        list: MB held by the grabbed frame, and peak MB per shot on top of it, of each region size and format, buffered and streamed
+    """
+    results = []
+    for name, (width, height) in sizes.items():
+        for format in FORMATS:
+            results.append({
+                'region': name,
+                'format': format,
+                'frameMb': frameMb(width, height),
+                'bufferedMb': peakPerShot(width, height, format, False, folder),
+                'streamedMb': peakPerShot(width, height, format, True, folder)
+                })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m scBench.MemoryBenchmark", description='Measure the peak memory used per shot of large regions')
+    parser.add_argument("--region", help="Only measure this region, such as 7680x2160. Default: 1080p to 8K", default=None)
+    parser.add_argument("-f", "--format", choices=FORMATS, help="With --region, the format to measure. Default: png", default='png')
+    parser.add_argument("--assert-mb", dest="assertMb", type=float, help="With --region, fail if a streamed shot needs more than this many MB on top of the grabbed frame", default=None)
+    args = parser.parse_args()
+    if args.region:
+        width, height = (int(value) for value in args.region.lower().split('x'))
+        peak = peakPerShot(width, height, args.format)
+        print(f'{args.region} {args.format}: {peak:.1f} MB per shot, on top of the {frameMb(width, height):.1f} MB frame')
+        if args.assertMb is not None and peak > args.assertMb:
+            sys.exit(f'A {args.region} shot needed {peak:.1f} MB, more than {args.assertMb:g} MB')
+        return
+    print(f"{'region':>8} {'format':>6} {'frame':>7} {'buffered':>9} {'streamed':>9}  (MB per shot, on top of the frame)")
+    for result in run():
+        print(f"{result['region']:>8} {result['format']:>6} {result['frameMb']:7.1f} {result['bufferedMb']:9.1f} {result['streamedMb']:9.1f}")
+
+if __name__ == "__main__":
+    main()
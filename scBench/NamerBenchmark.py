@@ -0,0 +1,117 @@
+"""Compares the cost of naming screenshots with the original ScreenShotNamer, which probes the disk on every shot and
+globs the whole folder on a collision, and the current one, which scans once and creates files exclusively.
+
+Run with: python -m scBench.NamerBenchmark
+"""
+from scCore.ScreenshotNamer import ScreenShotNamer, PREFIX, SUFFIX, SIDECAR_NAME
+from pathlib import Path
+from datetime import datetime
+import tempfile
+import argparse
+import shutil
+import json
+import time
+import re
+
+class LegacyNamer(object):
+    """ The namer as it was before names were allocated from memory. Kept only as a point of comparison.
+    """
+    def __init__(self, parentDir:Path):
+        self.parent = parentDir
+        self.date = None
+
+    def nextName(self) -> str:
+        today = datetime.today().date()
+        if self.date != today:
+            self.date = today
+            self.dateStr = datetime.today().strftime('%Y-%m-%d')
+            self.nameIdx = 0
+        self.nameIdx += 1
+        return self.fileNamePattern(str(self.nameIdx))
+
+    def nextFreePath(self) -> Path:
+        nextPath = self.parent / self.nextName()
+        if not nextPath.exists():
+            return nextPath
+        conflicts = self.parent.glob(pattern=self.fileNamePattern('*'))
+        self.nameIdx = self.getHighestIndex(conflicts)
+        nextPath = self.parent / self.nextName()
+        if nextPath.exists():
+            raise ValueError('Unable to find free path for screenshot!')
+        return nextPath
+
+    def getHighestIndex(self, paths: list) -> int:
+        pat = re.compile(self.fileNamePattern(r'(\d+)'))
+        maxIdx = self.nameIdx
+        for path in paths:
+            m = pat.match(path.name)
+            if m:
+                maxIdx = max(maxIdx, int(m.group(1)))
+        return maxIdx
+
+    def fileNamePattern(self, idxStr: str) -> str:
+        return PREFIX + self.dateStr + '_' + idxStr + SUFFIX
+
+def populate(folder:Path, fileCount:int) -> None:
+    """Fill folder with fileCount empty screenshots dated today
+    """
+    dateStr = datetime.today().strftime('%Y-%m-%d')
+    for i in range(1, fileCount + 1):
+        (folder / f'{PREFIX}{dateStr}_{i}{SUFFIX}').touch()
+
+def timeNamer(namer, shots:int) -> dict:
+    """Time the first shot, which pays for any scan, and the average of the following ones.
+    Each path is touched, as the screenshot would be written there, and deleted once timing is done.
+    """
+    paths = []
+    start = time.perf_counter()
+    paths.append(namer.nextFreePath())
+    paths[-1].touch()
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(shots):
+        paths.append(namer.nextFreePath())
+        paths[-1].touch()
+    following = (time.perf_counter() - start) / shots
+    for path in paths:
+        path.unlink()
+    return {'firstShotMs': first * 1000, 'perShotMs': following * 1000}
+
+def run(fileCount:int=100000, shots:int=200, folder:Path=None) -> dict:
+    """Compare the namers in a folder holding fileCount screenshots
+    Args:
+        fileCount (int, optional): Number of screenshots already in the folder. Defaults to 100000.
+        shots (int, optional): Number of names allocated after the first one. Defaults to 200.
+        folder (Path, optional): Where to create the screenshots, for instance a network share. Defaults to a temporary folder.
+    Returns:
+        dict: Timings of each namer
+    """
+    if folder:
+        folder.mkdir(parents=True, exist_ok=True)
+    workDir = Path(tempfile.mkdtemp(dir=folder))
+    try:
+        populate(workDir, fileCount)
+        results = {'fileCount': fileCount}
+        results['legacy'] = timeNamer(LegacyNamer(workDir), shots)
+        results['indexed'] = timeNamer(ScreenShotNamer(workDir), shots)
+        # As if a previous run had left its sidecar behind
+        with open(workDir / SIDECAR_NAME, 'w') as f:
+            json.dump({datetime.today().strftime('%Y-%m-%d'): fileCount}, f)
+        results['indexedWithSidecar'] = timeNamer(ScreenShotNamer(workDir, sidecar=True), shots)
+        return results
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m scBench.NamerBenchmark", description='Compare the original and indexed screenshot namers')
+    parser.add_argument("-n", "--files", type=int, default=100000, help="Number of screenshots already in the folder. Default: 100000")
+    parser.add_argument("--shots", type=int, default=200, help="Number of names allocated after the first. Default: 200")
+    parser.add_argument("-d", "--dir", type=Path, default=None, help="Folder to run in, for instance a network share. Default: a temporary folder")
+    args = parser.parse_args()
+    results = run(args.files, args.shots, args.dir)
+    print(f"{results['fileCount']} screenshots in the folder")
+    for name in ('legacy', 'indexed', 'indexedWithSidecar'):
+        print(f"{name:>20}: first shot {results[name]['firstShotMs']:9.2f} ms, then {results[name]['perShotMs']:.3f} ms per shot")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Measures how long the programs take to become usable: time until the GUI window is shown, time until the CLI is
+listening, and the latency of the first screenshot with and without prewarming. Each run starts a new Python process.
+The CLI runs use the synthetic backend. The GUI needs a display, and the CLI needs pynput to be able to listen.
+
+Run with: python -m scBench.StartupBenchmark
+"""
+from pathlib import Path
+import subprocess
+import statistics
+import tempfile
+import argparse
+import time
+import sys
+
+ROOT = Path(__file__).resolve().parent.parent
+GUI_SCRIPT = ROOT / 'screenshot-cropper-gui.py'
+CLI_SCRIPT = ROOT / 'screenshot-cropper.py'
+# Must match the lines printed by the scripts' --startup-probe
+PROBE_WINDOW = 'startup-probe: window'
+PROBE_LISTENING = 'startup-probe: listening'
+PROBE_FIRST_SHOT = 'startup-probe: first-shot'
+TIMEOUT = 60
+
+def probe(command:list, folder:Path) -> dict:
+    """Run command, and time the lines it prints from when the process is started
+    Args:
+        command (list): The command, which must print probe lines
+        folder (Path): Working folder of the process, so that it doesn't pick up saved options or write logs elsewhere
+    Raises:
+        RuntimeError: If the process fails
+    Returns:
+        dict: Probe line -> seconds since the process was started, and the text after the probe name
+    """
+    lines = {}
+    output = []
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=folder, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        for line in process.stdout:
+            elapsed = time.perf_counter() - start
+            for name in (PROBE_WINDOW, PROBE_LISTENING, PROBE_FIRST_SHOT):
+                if line.startswith(name):
+                    lines[name] = (elapsed, line[len(name):].strip())
+            output.append(line.strip())
+        process.wait(TIMEOUT)
+    finally:
+        if process.poll() is None:
+            process.kill()
+    if process.returncode != 0 or not lines:
+        # The CLI prints its errors on stdout
+        error = process.stderr.read().strip().splitlines() or output
+        raise RuntimeError(error[-1] if error else f'exited with code {process.returncode}')
+    return lines
+
+def measureGui(runs:int) -> dict:
+    """
+    Returns:
+        dict: Median and best time until the window is shown, in ms
+    """
+    times = []
+    with tempfile.TemporaryDirectory() as folder:
+        for i in range(runs):
+            times.append(probe([sys.executable, str(GUI_SCRIPT), '--startup-probe'], Path(folder))[PROBE_WINDOW][0])
+    return {'windowMs': statistics.median(times) * 1000, 'bestWindowMs': min(times) * 1000}
+
+def measureCli(runs:int, prewarm:bool) -> dict:
+    """
+    Returns:
+        dict: Median time until listening, and median latency of the first screenshot, in ms
+    """
+    listening = []
+    firstShots = []
+    with tempfile.TemporaryDirectory() as folder:
+        command = [sys.executable, str(CLI_SCRIPT), '-b', 'synthetic', '--prewarm' if prewarm else '--no-prewarm', '--startup-probe']
+        for i in range(runs):
+            lines = probe(command, Path(folder))
+            listening.append(lines[PROBE_LISTENING][0])
+            firstShots.append(float(lines[PROBE_FIRST_SHOT][1]))
+    return {'listeningMs': statistics.median(listening) * 1000, 'firstShotMs': statistics.median(firstShots)}
+
+def run(runs:int=5) -> dict:
+    """Measure every startup. Measurements that can't run in this environment are replaced by their error.
+    """
+    results = {}
+    for name, measure in (('gui', lambda: measureGui(runs)),
+                          ('cli', lambda: measureCli(runs, True)),
+                          ('cliNoPrewarm', lambda: measureCli(runs, False))):
+        try:
+            results[name] = measure()
+        except RuntimeError as e:
+            results[name] = {'error': str(e)}
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m scBench.StartupBenchmark", description='Measure startup times of the GUI and the CLI')
+    parser.add_argument("-n", "--runs", type=int, default=5, help="Processes started per measurement. Default: 5")
+    args = parser.parse_args()
+    for name, result in run(args.runs).items():
+        print(f"{name:>12}: " + ', '.join(f'{key} {value:.1f}' if isinstance(value, float) else f'{key} {value}' for key, value in result.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+from scCore.ScreenshotNamer import ScreenShotNamer
+from scCore.Encoders import Encoder
+from scCore.Processing import StageChain
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from pathlib import Path
+from PIL import Image
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Extensions of the files picked up in the input folder
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp', '.qoi', '.ppm')
+# Remembers which input files are done, in the output folder, so that an interrupted batch can be resumed
+MANIFEST_NAME = '.batch-manifest.jsonl'
+# Files handed to the pool per job. Files beyond this wait in the folder, so memory doesn't grow with the folder size.
+IN_FLIGHT_PER_JOB = 2
+# Seconds between two progress reports
+PROGRESS_INTERVAL = 2
+
+class BatchCropper(object):
+    """Crops every image of a folder to the configured regions, applies the processing stages, and saves the results
+    with screenshot names. Files are read one at a time from the folder listing and cropped in a process pool, with a
+    fixed number of files in flight.
+    """
+    def __init__(self, inputDir:Path, outputDir:Path, regions:list, encoder:Encoder, jobs:int=None, resume:bool=True, processing:StageChain=None):
+        """
+        Args:
+            inputDir (Path): Folder the images are read from. Sub-folders are ignored.
+            outputDir (Path): Folder the cropped images are written to
+            regions (list): (label, (x, y, width, height)) of each region to crop out of every image. A label of None
+                gives files named like single screenshots, a box of None keeps the whole image.
+            encoder (Encoder): The format cropped images are saved in
+            jobs (int, optional): Number of processes. Defaults to the number of CPUs.
+            resume (bool, optional): Skip input files that a previous batch into outputDir already did. Defaults to True.
+            processing (StageChain, optional): Stages applied to each crop before it is saved, as they are to screenshots.
+                Each image is stamped with its modification time. Defaults to none.
+        """
+        self.inputDir = inputDir
+        self.outputDir = outputDir
+        self.regions = regions
+        self.encoder = encoder
+        self.jobs = jobs or os.cpu_count() or 1
+        self.resume = resume
+        self.processing = processing
+        self.namer = ScreenShotNamer(outputDir, encoder.suffix)
+        self.done = 0
+        self.skipped = 0
+        self.failed = 0
+        self.duration = 0.0
+        # Label of each processing stage -> seconds spent in it, over all files
+        self.stageSeconds = {}
+
+    def run(self, onProgress=None) -> dict:
+        """Crop all images. Blocks until done.
+        Args:
+            onProgress (Callable, optional): Called regularly with a line describing the progress
+        Returns:
+            dict: The number of files done, skipped and failed, the duration in seconds, the throughput, and the seconds
+                spent in each processing stage
+        """
+        manifestPath = self.outputDir / MANIFEST_NAME
+        finished = readManifest(manifestPath) if self.resume else {}
+        start = time.perf_counter()
+        lastReport = start
+        inFlight = {}
+        maxInFlight = self.jobs * IN_FLIGHT_PER_JOB
+        with ProcessPoolExecutor(self.jobs) as pool, open(manifestPath, 'a' if self.resume else 'w') as manifest:
+            for entry in self.imageEntries():
+                source = os.path.abspath(entry.path)
+                stat = entry.stat()
+                if finished.get(source) == stat.st_mtime_ns:
+                    self.skipped += 1
+                    continue
+                if len(inFlight) >= maxInFlight:
+                    self._collect(inFlight, manifest, FIRST_COMPLETED)
+                day = datetime.fromtimestamp(stat.st_mtime).date()
+                try:
+                    targets = self._allocate(day)
+                except Exception:
+                    logger.exception(f'Failed to name the crops of {source}')
+                    self.failed += 1
+                    continue
+                future = pool.submit(cropFile, source, targets, self.encoder, self.processing, stat.st_mtime)
+                inFlight[future] = (source, stat.st_mtime_ns, targets)
+                now = time.perf_counter()
+                if onProgress and now - lastReport >= PROGRESS_INTERVAL:
+                    lastReport = now
+                    onProgress(self.progress())
+            self._collect(inFlight, manifest)
+        self.duration = time.perf_counter() - start
+        return self.summary()
+
+    def imageEntries(self):
+        """
+        Yields:
+            os.DirEntry: The image files of the input folder, in the order the folder lists them
+        """
+        with os.scandir(self.inputDir) as entries:
+            for entry in entries:
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_SUFFIXES:
+                    yield entry
+
+    def progress(self) -> str:
+        return f'{self.done} files cropped, {self.skipped} skipped, {self.failed} failed'
+
+    def filesPerSecond(self) -> float:
+        if self.duration <= 0:
+            return 0.0
+        return self.done / self.duration
+
+    def summary(self) -> dict:
+        return {
+            'done': self.done,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'seconds': self.duration,
+            'filesPerSecond': self.filesPerSecond(),
+            'stages': dict(self.stageSeconds)
+        }
+
+    def _allocate(self, day) -> list:
+        """Create the output files of one input file
+        Returns:
+            list: (box, path) for each region, box being (left, upper, right, lower), or None for the whole image
+        """
+        targets = []
+        groupId = object()
+        for label, region in self.regions:
+            path = self.namer.nextFreePath(groupId, label=label, day=day)
+            box = (region[0], region[1], region[0] + region[2], region[1] + region[3]) if region else None
+            targets.append((box, str(path)))
+        return targets
+
+    def _collect(self, inFlight:dict, manifest, returnWhen:str='ALL_COMPLETED') -> None:
+        """Wait for files in flight, and record the ones that are done in the manifest
+        """
+        completed, _ = wait(inFlight, return_when=returnWhen)
+        for future in completed:
+            source, mtime, targets = inFlight.pop(future)
+            try:
+                timings = future.result()
+            except Exception as e:
+                logger.error(f'Failed to crop {source}: {e}')
+                self.failed += 1
+                for _, path in targets:
+                    Path(path).unlink(missing_ok=True)
+                continue
+            self.done += 1
+            for label, seconds in timings.items():
+                self.stageSeconds[label] = self.stageSeconds.get(label, 0) + seconds
+            manifest.write(json.dumps({'source': source, 'mtime': mtime, 'outputs': [path for _, path in targets]}) + '\n')
+        manifest.flush()
+
+def cropFile(source:str, targets:list, encoder:Encoder, processing:StageChain=None, mtime:float=None) -> dict:
+    """Crop an image file to each target box, process and save the crops. Module level so that it can be run in a
+    process pool.
+    Args:
+        source (str): Path of the image
+        targets (list): (box, path) of each crop, box being (left, upper, right, lower), or None for the whole image
+        encoder (Encoder): The format crops are saved in
+        processing (StageChain, optional): Stages applied to each crop. Defaults to none.
+        mtime (float, optional): Modification time of the image, stamped by timestamp stages. Defaults to now.
+    Returns:
+        dict: Label of each processing stage -> seconds spent in it
+    Raises:
+        ValueError: If a box doesn't fit in the image
+    """
+    timings = {}
+    def record(label, seconds):
+        timings[label] = timings.get(label, 0) + seconds
+    captured = datetime.fromtimestamp(mtime) if mtime is not None else None
+    with Image.open(source) as image:
+        for box, _ in targets:
+            if box and (box[2] > image.width or box[3] > image.height):
+                raise ValueError(f'Region {box} does not fit in the {image.width}x{image.height} image')
+        image = image.convert('RGB')
+        for box, path in targets:
+            crop = image.crop(box) if box else image
+            if processing:
+                crop = processing.apply(crop, captured, record)
+            with open(path, 'wb') as f:
+                encoder.encode(crop, f)
+    return timings
+
+def readManifest(path:Path) -> dict:
+    """
+    Returns:
+        dict: Path of each input file done by previous batches -> its modification time when it was done, in ns
+    """
+    finished = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    finished[record['source']] = record['mtime']
+                except (ValueError, KeyError):
+                    # The last line can be cut short if a batch was interrupted
+                    logger.warning(f'Ignoring bad line in batch manifest: {line!r}')
+    except FileNotFoundError:
+        pass
+    return finished
@@ -1,7 +1,15 @@
 from enum import Enum
 from typing import List
 from abc import ABC, abstractmethod
+from collections import deque
 import datetime as dt
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of undelivered events per subscriber. Older events are dropped beyond this.
+DEFAULT_QUEUE_SIZE = 1000
 
 class EventType(Enum):
     START_LISTENING = 1
@@ -9,19 +17,26 @@ class EventType(Enum):
     SCREENSHOT = 3
     FAILURE = 4
     WAITING = 5
+    METRICS = 6
+    SKIPPED = 7
+    BACKLOG = 8
+    OPTIONS = 9
+    SUPPRESSED = 10
 
 class Event:
     """A broadcasted event
     """
-    def __init__(self, type:EventType, text:str):
+    def __init__(self, type:EventType, text:str, data:dict=None):
         """
         Args:
             type (EventType):
             text (str): A human-readable description of the event
+            data (dict, optional): Machine-readable details of the event
         """
         self.time = dt.datetime.now()
         self.type = type
         self.text = text
+        self.data = data
     
 class Subscriber(ABC):
     """Abstract class representing a subscriber to the broadcaster.
@@ -34,26 +49,128 @@ class Subscriber(ABC):
             event (Event):
         """
         pass
+    
+    def triggerAll(self, events:List[Event]) -> None:
+        """ Inform the subscriber of several events at once, oldest first.
+        Subscribers that only care about the latest state can override this to coalesce them.
+        Args:
+            events (List[Event]):
+        """
+        for event in events:
+            self.trigger(event)
+            
+class Subscription:
+    """The queue of events waiting to be delivered to a subscriber. 
+    When full, the oldest events are dropped, so that a slow subscriber never holds up whoever reports events.
+    """
+    def __init__(self, subscriber:Subscriber, maxSize:int=DEFAULT_QUEUE_SIZE):
+        self.subscriber = subscriber
+        self.dropped = 0
+        self._events = deque(maxlen=maxSize)
+        self._condition = threading.Condition()
+        self._closed = False
+        # Delivers the events of subscriptions that aren't polled
+        self._thread = None
+        
+    def put(self, event:Event) -> None:
+        """ Queue an event. Never blocks.
+        """
+        with self._condition:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            self._condition.notify()
+            
+    def drain(self) -> List[Event]:
+        """ Take all queued events without waiting
+        Returns:
+            List[Event]: The events, oldest first. May be empty.
+        """
+        with self._condition:
+            events = list(self._events)
+            self._events.clear()
+            return events
+        
+    def deliver(self) -> int:
+        """ Hand all queued events to the subscriber, on the calling thread
+        Returns:
+            int: Number of events delivered
+        """
+        events = self.drain()
+        if events:
+            self.subscriber.triggerAll(events)
+        return len(events)
+        
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            
+    def join(self, timeout:float=None) -> None:
+        """ Wait for a closed subscription to deliver its last events. Polled subscriptions deliver them on the calling thread.
+        Args:
+            timeout (float, optional): Seconds to wait for the delivery thread at most. Defaults to no limit.
+        """
+        if self._thread:
+            self._thread.join(timeout)
+        else:
+            self.deliver()
+            
+    def _deliverUntilClosed(self) -> None:
+        """ Delivery thread loop for subscriptions that aren't polled
+        """
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._events or self._closed)
+                if self._closed and not self._events:
+                    return
+            try:
+                self.deliver()
+            except Exception:
+                logger.exception('Subscriber failed to handle events')
 
 class Broadcaster:
-    """Broadcasts events to all subscribers
+    """Broadcasts events to all subscribers. 
+    Reporting only queues the event for each subscriber, so it is cheap and safe to call from any thread.
     """
     def __init__(self):
-        self.subscribers:List[Subscriber] = []
+        self.subscriptions:List[Subscription] = []
+        self._lock = threading.Lock()
         
-    def subscribe(self, subscriber:Subscriber) -> None:
+    def subscribe(self, subscriber:Subscriber, polled:bool=False, maxSize:int=DEFAULT_QUEUE_SIZE) -> Subscription:
         """ Add a subscriber which will be informed of events
         Args:
             subscriber (Subscriber):
+            polled (bool, optional): If True, events are only delivered when the owner of the subscription calls 
+                deliver() on it, for instance from a GUI main loop. Otherwise they are delivered on a dedicated thread.
+                Defaults to False.
+            maxSize (int, optional): Maximum number of undelivered events. Defaults to DEFAULT_QUEUE_SIZE.
+        Returns:
+            Subscription: The subscriber's queue of events
+        """
+        subscription = Subscription(subscriber, maxSize)
+        with self._lock:
+            # Replaced rather than modified, so that report can iterate without locking
+            self.subscriptions = self.subscriptions + [subscription]
+        if not polled:
+            subscription._thread = threading.Thread(target=subscription._deliverUntilClosed, name='EventDelivery', daemon=True)
+            subscription._thread.start()
+        return subscription
+    
+    def unsubscribe(self, subscription:Subscription) -> None:
+        """ Stop informing a subscriber of events. Events already queued are still delivered.
         """
-        self.subscribers.append(subscriber)
+        with self._lock:
+            self.subscriptions = [s for s in self.subscriptions if s is not subscription]
+        subscription.close()
         
-    def report(self, type:EventType, text:str) -> None:
+    def report(self, type:EventType, text:str, data:dict=None) -> None:
         """ Create an Event and transmit it to all subscribers
         Args:
             type (EventType):
             text (str): A human-readable description
+            data (dict, optional): Machine-readable details
         """
-        event = Event(type, text)
-        for subscriber in self.subscribers:
-            subscriber.trigger(event)
\ No newline at end of file
+        event = Event(type, text, data)
+        for subscription in self.subscriptions:
+            subscription.put(event)
\ No newline at end of file
@@ -0,0 +1,80 @@
+from scCore.CaptureBackend import CaptureBackend
+from scCore.CapturePipeline import CapturePipeline
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class BurstCapture(object):
+    """Grabs a region repeatedly at a target frame rate on its own thread, until stopped
+    """
+    def __init__(self, backend:CaptureBackend, region:tuple, pipeline:CapturePipeline, fps:float, burstId:int, boxes:list=None):
+        """
+        Args:
+            backend (CaptureBackend): Grabs the frames
+            region (tuple): The region to grab
+            pipeline (CapturePipeline): Receives the frames
+            fps (float): Target number of frames per second
+            burstId (int): Identifies the burst, so that its frames share an index when named
+            boxes (list, optional): (box, label) of each named region to cut out of every frame and save on its own,
+                box being relative to region. Defaults to None, saving whole frames.
+        """
+        self._backend = backend
+        self._region = region
+        self._boxes = boxes
+        self._pipeline = pipeline
+        self.fps = fps
+        self.burstId = burstId
+        self.frameCount = 0
+        self.duration = 0.0
+        self._stopEvent = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'Burst-{burstId}', daemon=True)
+
+    def start(self) -> None:
+        """Start grabbing. Does not block.
+        """
+        logger.info(f'Starting burst {self.burstId} at {self.fps} fps')
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop grabbing. Blocks until the frame being grabbed has been handed to the pipeline.
+        """
+        self._stopEvent.set()
+        self._thread.join()
+
+    def achievedFps(self) -> float:
+        if self.duration <= 0:
+            return 0.0
+        return self.frameCount / self.duration
+
+    def summary(self) -> str:
+        return f'Burst ended: {self.frameCount} screenshots in {self.duration:.1f}s, {self.achievedFps():.1f} fps (target {self.fps:g} fps)'
+
+    def _run(self) -> None:
+        """Grab frames on a fixed schedule. If a grab runs late, the schedule restarts from now rather than trying to catch up.
+        """
+        interval = 1 / self.fps
+        start = time.perf_counter()
+        nextTime = start
+        try:
+            while not self._stopEvent.is_set():
+                triggerTime = time.perf_counter()
+                image = self._backend.grab(self._region)
+                self._pipeline.metrics.record('grab', time.perf_counter() - triggerTime)
+                self.frameCount += 1
+                if self._boxes:
+                    for box, label in self._boxes:
+                        self._pipeline.submit(image, burstId=self.burstId, burstIdx=self.frameCount, triggerTime=triggerTime, box=box, label=label)
+                else:
+                    self._pipeline.submit(image, burstId=self.burstId, burstIdx=self.frameCount, triggerTime=triggerTime)
+                nextTime += interval
+                delay = nextTime - time.perf_counter()
+                if delay > 0:
+                    self._stopEvent.wait(delay)
+                else:
+                    nextTime = time.perf_counter()
+        except Exception:
+            logger.exception(f'Burst {self.burstId} failed')
+        finally:
+            self.duration = time.perf_counter() - start
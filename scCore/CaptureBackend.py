@@ -0,0 +1,193 @@
+from scCore.MonitorLayout import MonitorLayout, covers
+from abc import ABC, abstractmethod
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CaptureBackend(ABC):
+    """Abstract class representing a way of grabbing pixels from the screen.
+    Regions are (x offset, y offset, width, height) tuples measured from the top left of the capturable area.
+    """
+    # The monitors the backend can grab, if it knows them
+    layout:MonitorLayout = None
+
+    @abstractmethod
+    def grab(self, region:tuple):
+        """Grab the pixels in region
+        Args:
+            region (tuple): (x offset, y offset, width, height)
+        Returns:
+            PIL.Image.Image: An RGB image of the region
+        """
+        pass
+
+    def prewarm(self, region:tuple) -> None:
+        """Grab region once and throw the result away, so that libraries, platform resources and buffers of the right
+        size are set up before the first real grab
+        Args:
+            region (tuple): (x offset, y offset, width, height)
+        """
+        self.grab(region)
+
+    def close(self) -> None:
+        """Release any resource held by the backend
+        """
+        pass
+
+    def checkRegion(self, region:tuple, name:str='Area') -> None:
+        """Check that region can be grabbed, so that bad regions are reported before the first capture
+        Raises:
+            ValueError: If region is outside every monitor
+        """
+        if self.layout:
+            self.layout.check(region, name)
+
+class PyAutoGuiBackend(CaptureBackend):
+    """Grabs through pyautogui. Works everywhere pyautogui does, but may grab the whole screen before cropping it.
+    Only the primary monitor is known to pyautogui.
+    """
+    def __init__(self):
+        import pyautogui
+        self._pyautogui = pyautogui
+        self.layout = MonitorLayout(lambda: ((0, 0), [(0, 0) + tuple(pyautogui.size())]))
+
+    def grab(self, region:tuple):
+        return self._pyautogui.screenshot(region=region)
+
+class MssBackend(CaptureBackend):
+    """Grabs only the requested rectangle through the platform's native API, using mss.
+    mss handles can't be shared between threads, so one is kept per thread and reused between shots.
+    Regions are clipped to the monitors they intersect. Parts of a region outside every monitor, such as the gaps
+    between monitors of different sizes, are left black.
+    """
+    def __init__(self):
+        import mss
+        import mss.exception
+        from PIL import Image
+        self._mss = mss
+        self._image = Image
+        self._local = threading.local()
+        self._handles = []
+        self._lock = threading.Lock()
+        self.layout = MonitorLayout(self._readLayout)
+
+    def grab(self, region:tuple):
+        try:
+            return self._grabOnMonitors(region)
+        except self._mss.exception.ScreenShotError:
+            # A monitor may have been removed since the layout was read
+            if not self.layout.refresh():
+                raise
+            return self._grabOnMonitors(region)
+
+    def _grabOnMonitors(self, region:tuple):
+        """Grab region in one go if it is all on screen, otherwise grab each of its parts and stitch them together
+        Raises:
+            ValueError: If region is outside every monitor
+        """
+        parts = self.layout.split(region)
+        if covers(parts, region):
+            return self._grabRectangle(region)
+        if not parts:
+            self.layout.check(region)
+        x, y, width, height = region
+        image = self._image.new('RGB', (width, height))
+        for part in parts:
+            image.paste(self._grabRectangle(part), (part[0] - x, part[1] - y))
+        return image
+
+    def _grabRectangle(self, region:tuple):
+        originX, originY = self.layout.origin()
+        x, y, width, height = region
+        shot = self._screen().grab({'left': originX + x, 'top': originY + y, 'width': width, 'height': height})
+        return self._image.frombuffer('RGB', shot.size, shot.bgra, 'raw', 'BGRX', 0, 1)
+
+    def _readLayout(self) -> tuple:
+        """Read the monitors with a new mss handle, as handles keep the layout they were created with
+        """
+        with self._mss.mss() as screen:
+            desktop = screen.monitors[0]
+            return (desktop['left'], desktop['top']), [(monitor['left'] - desktop['left'], monitor['top'] - desktop['top'], monitor['width'], monitor['height']) for monitor in screen.monitors[1:]]
+
+    def close(self) -> None:
+        with self._lock:
+            for handle in self._handles:
+                handle.close()
+            self._handles = []
+        self._local = threading.local()
+
+    def _screen(self):
+        """Get the mss handle belonging to the current thread, creating it if needed
+        """
+        screen = getattr(self._local, 'screen', None)
+        if screen is None:
+            screen = self._mss.mss()
+            self._local.screen = screen
+            with self._lock:
+                self._handles.append(screen)
+        return screen
+
+class SyntheticBackend(CaptureBackend):
+    """Generates frames in memory without touching the display, so that capture can be tested and benchmarked headless.
+    Frames are deterministic: the nth grab of a region always has the same pixels.
+    """
+    def __init__(self):
+        from PIL import Image
+        self._image = Image
+        self._backgrounds = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def grab(self, region:tuple):
+        x, y, width, height = region
+        with self._lock:
+            count = self._count
+            self._count += 1
+        image = self._background((width, height)).copy()
+        # A bar sweeping across the frame, so that consecutive frames differ
+        barWidth = max(1, width // 16)
+        left = (x + count * barWidth) % width
+        image.paste((255, 255, 255), (left, 0, min(width, left + barWidth), height))
+        return image
+
+    def reset(self) -> None:
+        """Restart the frame sequence from the beginning
+        """
+        with self._lock:
+            self._count = 0
+
+    def _background(self, size:tuple):
+        """A gradient of the given size. Cached, as generating it is slower than copying it.
+        """
+        background = self._backgrounds.get(size)
+        if background is None:
+            vertical = self._image.linear_gradient('L').resize(size)
+            horizontal = self._image.linear_gradient('L').transpose(self._image.Transpose.ROTATE_90).resize(size)
+            blue = self._image.new('L', size, 128)
+            background = self._image.merge('RGB', (horizontal, vertical, blue))
+            self._backgrounds[size] = background
+        return background
+
+def createBackend(name:str) -> CaptureBackend:
+    """Create the capture backend called name
+    Args:
+        name (str): One of 'auto', 'mss', 'pyautogui' or 'synthetic'. 'auto' uses mss if it is installed, and pyautogui otherwise.
+    Raises:
+        ValueError: If name is not a known backend
+    Returns:
+        CaptureBackend: The backend
+    """
+    if name == 'auto':
+        try:
+            return MssBackend()
+        except ImportError:
+            logger.info('mss is not installed, falling back to pyautogui')
+            return PyAutoGuiBackend()
+    if name == 'mss':
+        return MssBackend()
+    if name == 'pyautogui':
+        return PyAutoGuiBackend()
+    if name == 'synthetic':
+        return SyntheticBackend()
+    raise ValueError(f'Unknown capture backend: {name}')
@@ -0,0 +1,505 @@
+from scCore.ScreenshotNamer import ScreenShotNamer
+from scCore.Broadcaster import Broadcaster, EventType
+from scCore.Encoders import Encoder, PngEncoder
+from scCore.Metrics import Metrics, NullMetrics
+from scCore.Deduplicator import Deduplicator
+from scCore.SpoolMover import SpoolMover, PART_SUFFIX
+from scCore.SessionArchive import SessionArchive
+from scCore.Catalog import CatalogUpdater
+from scCore.Processing import StageChain
+from concurrent.futures import Future
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from enum import Enum
+import threading
+import io
+import os
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Frames of at least this many pixels are encoded straight into their file a few rows at a time, on the worker thread,
+# rather than being copied to a worker process or into an in-memory file. About two 1080p monitors.
+STREAM_MIN_PIXELS = 3840 * 1080
+
+class Backpressure(Enum):
+    """What to do with a new frame when the queue is full
+    """
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop-oldest'
+    DROP_NEWEST = 'drop-newest'
+
+class Frame(object):
+    """A grabbed screenshot waiting to be encoded and written to disk
+    """
+    def __init__(self, image, burstId:int=None, burstIdx:int=None, triggerTime:float=None, box:tuple=None, label:str=None):
+        """
+        Args:
+            image (PIL.Image.Image): The grabbed pixels
+            burstId (int, optional): Identifies the burst or region group the frame belongs to, if any
+            burstIdx (int, optional): Position of the frame in its burst
+            triggerTime (float, optional): time.perf_counter() when the capture was triggered. Defaults to now.
+            box (tuple, optional): (left, upper, right, lower) part of image to save. Defaults to all of it.
+            label (str, optional): Name of the region the frame shows, if any
+        """
+        self.image = image
+        # Resolved with the path the frame was saved to, or None if it was dropped or skipped
+        self.future = Future()
+        self.burstId = burstId
+        self.burstIdx = burstIdx
+        self.box = box
+        self.label = label
+        self.queuedTime = time.perf_counter()
+        self.time = self.queuedTime if triggerTime is None else triggerTime
+        # Wall clock time of the trigger, for the stages that stamp it
+        self.captured = datetime.fromtimestamp(time.time() - (self.queuedTime - self.time))
+
+    def pixels(self):
+        """The part of the image to save. Frames of a region group share the grabbed image, and are only cropped
+        here, on the worker that handles them.
+        Returns:
+            PIL.Image.Image: The image, cropped to box
+        """
+        if self.box:
+            self.image = self.image.crop(self.box)
+            self.box = None
+        return self.image
+
+    def pixelCount(self) -> int:
+        """
+        Returns:
+            int: Number of pixels that will be saved
+        """
+        if self.box:
+            return (self.box[2] - self.box[0]) * (self.box[3] - self.box[1])
+        return self.image.width * self.image.height
+
+class FrameQueue(object):
+    """A bounded FIFO of frames which applies a backpressure policy when full
+    """
+    def __init__(self, maxSize:int, policy:Backpressure):
+        self._frames = deque()
+        self._maxSize = maxSize
+        self._policy = policy
+        self._condition = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, frame:Frame, wait:bool=False) -> tuple:
+        """Add a frame to the queue, applying the backpressure policy if the queue is full
+        Args:
+            frame (Frame): The frame to add
+            wait (bool, optional): Wait for room in the queue whatever the policy. Defaults to False.
+        Returns:
+            tuple: (accepted, dropped). accepted is False if the queue was closed, and the frame was not added.
+                dropped is the frame that was dropped to respect the size limit, or None if nothing was dropped.
+        """
+        with self._condition:
+            if wait or self._policy == Backpressure.BLOCK:
+                while len(self._frames) >= self._maxSize and not self._closed:
+                    self._condition.wait()
+            if self._closed:
+                return False, None
+            dropped = None
+            if len(self._frames) >= self._maxSize:
+                self.dropped += 1
+                if self._policy == Backpressure.DROP_NEWEST:
+                    return True, frame
+                dropped = self._frames.popleft()
+            self._frames.append(frame)
+            self._condition.notify_all()
+            return True, dropped
+
+    def get(self) -> Frame:
+        """Take the oldest frame from the queue. Blocks until a frame is available.
+        Returns:
+            Frame: The oldest frame, or None if the queue was closed and is empty
+        """
+        with self._condition:
+            while not self._frames and not self._closed:
+                self._condition.wait()
+            if not self._frames:
+                return None
+            frame = self._frames.popleft()
+            self._condition.notify_all()
+            return frame
+
+    def isClosed(self) -> bool:
+        return self._closed
+
+    def close(self) -> None:
+        """Stop accepting frames. Frames already queued can still be taken.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._frames)
+
+class CapturePipeline(object):
+    """Encodes and writes grabbed frames on a pool of workers, so that the thread grabbing the
+    screen never waits on compression or disk access
+    """
+    def __init__(self, namer:ScreenShotNamer, broadcaster:Broadcaster, workers:int=2, workerType:str='thread', queueSize:int=8, backpressure:Backpressure=Backpressure.BLOCK, encoder:Encoder=PngEncoder(), metrics:Metrics=NullMetrics(), deduplicator:Deduplicator=None, spool:SpoolMover=None, streamMinPixels:int=STREAM_MIN_PIXELS, archive:SessionArchive=None, catalog:CatalogUpdater=None, processing:StageChain=None, mirrors:list=()):
+        """
+        Args:
+            namer (ScreenShotNamer): Provides the paths frames are saved to. Its suffix should match the encoder's.
+            broadcaster (Broadcaster): Informed of saved and dropped frames
+            workers (int, optional): Number of frames that can be encoded at the same time. Defaults to 2.
+            workerType (str, optional): 'thread' to encode on threads, 'process' to encode in a process pool. Defaults to 'thread'.
+            queueSize (int, optional): Maximum number of frames waiting to be encoded. Defaults to 8.
+            backpressure (Backpressure, optional): What to do when the queue is full. Defaults to Backpressure.BLOCK.
+            encoder (Encoder, optional): The file format frames are saved in. Defaults to PNG.
+            metrics (Metrics, optional): Records the time spent in each stage. Defaults to recording nothing.
+            deduplicator (Deduplicator, optional): Skips frames that match a recently saved one. Defaults to keeping every frame.
+            spool (SpoolMover, optional): When the namer's folder is a spool, moves saved frames to their destination.
+                Frames are then written to a temporary file first, so that the spool only ever holds complete screenshots.
+            streamMinPixels (int, optional): Frames of at least this many pixels are encoded straight into their file.
+                Defaults to STREAM_MIN_PIXELS.
+            archive (SessionArchive, optional): When given, frames are appended to this open archive rather than saved
+                to files of their own, and the namer, encoder and spool are not used.
+            catalog (CatalogUpdater, optional): Informed of each saved file, to add it to the catalog of its folder
+            processing (StageChain, optional): Stages applied to each frame before it is encoded. Defaults to none.
+            mirrors (list, optional): MirrorWriters of the other folders frames are copied to. Each frame is encoded
+                once, and the same bytes are handed to every mirror. Defaults to none.
+        """
+        self.namer = namer
+        self.encoder = encoder
+        self.metrics = metrics
+        self.deduplicator = deduplicator
+        self.spool = spool
+        self.archive = archive
+        self.catalog = catalog
+        self.processing = processing
+        self.mirrors = list(mirrors)
+        self.streamMinPixels = streamMinPixels
+        self.broadcaster = broadcaster
+        # Folder the spool moves frames to
+        self.destination = spool.destination if spool else None
+        self._workerCount = workers
+        self._workerType = workerType
+        self._queueSize = queueSize
+        self._backpressure = backpressure
+        self._queue = FrameQueue(queueSize, backpressure)
+        self._nameLock = threading.Lock()
+        # Frames are checked for duplicates and named in turns, in the order they were taken off the queue. The turn
+        # of each frame is handed out with it, and the frame waits for it once fingerprinted.
+        self._turn = threading.Condition()
+        self._nextTurn = 0
+        self._currentTurn = 0
+        # Guards the namer, encoder, deduplicator, destination, processing and mirrors, which reconfigure swaps while the workers run.
+        # Separate from _nameLock, which idle workers hold while waiting for a frame.
+        self._configLock = threading.Lock()
+        self._threads = []
+        self._processPool = None
+
+    def start(self) -> None:
+        """Start the workers. Does not block. A stopped pipeline can be started again.
+        """
+        if self._threads:
+            return
+        if self._queue.isClosed():
+            self._queue = FrameQueue(self._queueSize, self._backpressure)
+        if self._workerType == 'process':
+            # Imported here, as multiprocessing is slow to import and only needed for process workers
+            from concurrent.futures import ProcessPoolExecutor
+            self._processPool = ProcessPoolExecutor(self._workerCount)
+        for i in range(self._workerCount):
+            thread = threading.Thread(target=self._work, name=f'CaptureWorker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def prewarm(self) -> None:
+        """Do the work the first frame would otherwise pay for: find the next index, load the encoder, and start
+        the worker processes. Call after start.
+        """
+        from PIL import Image
+        self.namer.prewarm()
+        image = Image.new('RGB', (8, 8))
+        if self._processPool:
+            # Processes are only started when work is submitted
+            for future in [self._processPool.submit(encodeImage, self.encoder, image) for i in range(self._workerCount)]:
+                future.result()
+        else:
+            encodeImage(self.encoder, image)
+
+    def stop(self) -> None:
+        """Stop accepting frames, and wait for the frames already queued to be written
+        """
+        self._queue.close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self._processPool:
+            self._processPool.shutdown()
+            self._processPool = None
+        self.namer.close()
+
+    def reconfigure(self, namer:ScreenShotNamer, encoder:Encoder, deduplicator:Deduplicator=None, destination:Path=None, processing:StageChain=None, mirrors:list=()) -> None:
+        """Change where and how frames are saved, without stopping the workers. Frames named from now on use the new
+        settings, frames already named are saved as they would have been.
+        Args:
+            namer (ScreenShotNamer): Provides the paths frames are saved to. Its suffix should match the encoder's.
+            encoder (Encoder): The file format frames are saved in
+            deduplicator (Deduplicator, optional): Skips frames that match a recently saved one. Defaults to keeping every frame.
+            destination (Path, optional): With a spool, the folder frames are moved to. Defaults to the current one.
+            processing (StageChain, optional): Stages applied to each frame before it is encoded. Defaults to none.
+            mirrors (list, optional): MirrorWriters of the other folders frames are copied to. Defaults to none.
+        """
+        with self._configLock:
+            self.namer = namer
+            self.encoder = encoder
+            self.deduplicator = deduplicator
+            self.processing = processing
+            self.mirrors = list(mirrors)
+            if destination:
+                self.destination = destination
+
+    def submit(self, image, burstId:int=None, burstIdx:int=None, wait:bool=False, triggerTime:float=None, box:tuple=None, label:str=None) -> Future:
+        """Queue a grabbed image to be encoded and saved. May block if the backpressure policy is BLOCK.
+        Args:
+            image (PIL.Image.Image): The grabbed pixels
+            burstId (int, optional): Identifies the burst or region group the image belongs to, if any
+            burstIdx (int, optional): Position of the image in its burst
+            wait (bool, optional): Wait for room in the queue rather than dropping frames, whatever the policy. Defaults to False.
+            triggerTime (float, optional): time.perf_counter() when the capture was triggered. Defaults to now.
+            box (tuple, optional): (left, upper, right, lower) part of image to save. Defaults to all of it.
+            label (str, optional): Name of the region the image shows, if any
+        Returns:
+            Future: Resolved with the path of the saved file, or of the archive it was added to, or None if the image was dropped or skipped as a duplicate.
+                Fails with the error if the image could not be saved.
+        """
+        frame = Frame(image, burstId, burstIdx, triggerTime, box, label)
+        accepted, dropped = self._queue.put(frame, wait)
+        if not accepted:
+            frame.future.set_result(None)
+            self.report(EventType.FAILURE, 'Screenshot dropped, pipeline stopped')
+        elif dropped:
+            dropped.future.set_result(None)
+            self.report(EventType.FAILURE, f'Screenshot dropped, queue full ({self._queue.dropped} dropped in total)')
+        return frame.future
+
+    def queueDepth(self) -> int:
+        return len(self._queue)
+
+    def droppedCount(self) -> int:
+        return self._queue.dropped
+
+    def _work(self) -> None:
+        """Worker loop: take frames off the queue and save them until the queue is closed and empty
+        """
+        while True:
+            with self._nameLock:
+                frame = self._queue.get()
+                if not frame:
+                    return
+                turn = self._nextTurn
+                self._nextTurn += 1
+                start = time.perf_counter()
+                self.metrics.record('queue', start - frame.queuedTime)
+                # Taken once per frame, so that a reconfiguration can't change how a frame is saved halfway through
+                with self._configLock:
+                    namer, encoder, deduplicator, destination, processing, mirrors = self.namer, self.encoder, self.deduplicator, self.destination, self.processing, self.mirrors
+            # The costly part of the duplicate check is done before waiting for the frame's turn, so that workers do it in parallel
+            fingerprint = self._fingerprint(frame, deduplicator) if deduplicator else None
+            # Frames are named in the order they were taken off the queue, so names follow capture order
+            with self._turn:
+                self._turn.wait_for(lambda: self._currentTurn == turn)
+                try:
+                    # Checked before naming, so that skipped frames leave no gap in the names
+                    if fingerprint is not None and self._isDuplicate(frame, deduplicator, fingerprint):
+                        frame.future.set_result(None)
+                        continue
+                    if self.archive:
+                        # Only the frame's place is kept on its turn, so that deltas are taken between frames in
+                        # capture order while frames are processed and encoded in parallel
+                        slot = self.archive.reserve()
+                    else:
+                        slot = None
+                        # Queued before naming, so that the copies keep capture order even when this folder can't be written to
+                        copies = [mirror.reserve(frame.burstId, frame.burstIdx, frame.label, encoder.suffix) for mirror in mirrors]
+                        start = time.perf_counter()
+                        try:
+                            path = namer.nextFreePath(frame.burstId, frame.burstIdx, frame.label)
+                            self.metrics.record('name', time.perf_counter() - start)
+                        except Exception as e:
+                            logger.exception('Failed to name screenshot')
+                            self.report(EventType.FAILURE, 'Failed to find a name for the screenshot')
+                            frame.future.set_exception(e)
+                            if not copies:
+                                continue
+                            path = None
+                finally:
+                    self._currentTurn += 1
+                    self._turn.notify_all()
+            if slot is not None:
+                self._append(frame, slot, processing)
+            else:
+                self._save(frame, path, encoder, destination, processing, copies)
+
+    def _fingerprint(self, frame:Frame, deduplicator:Deduplicator):
+        """
+        Returns:
+            See Deduplicator.fingerprint, or None if it failed and the frame isn't checked for duplicates
+        """
+        start = time.perf_counter()
+        try:
+            return deduplicator.fingerprint(frame.pixels(), frame.label)
+        except Exception:
+            logger.exception('Failed to check screenshot for duplicates')
+            return None
+        finally:
+            self.metrics.record('dedupe', time.perf_counter() - start)
+
+    def _isDuplicate(self, frame:Frame, deduplicator:Deduplicator, fingerprint) -> bool:
+        try:
+            duplicate = deduplicator.isDuplicate(frame.pixels(), frame.label, fingerprint)
+        except Exception:
+            logger.exception('Failed to check screenshot for duplicates')
+            return False
+        if duplicate:
+            logger.info('Skipping duplicate screenshot')
+            self.broadcaster.report(EventType.SKIPPED, f'Screenshot skipped, same as a recent one ({deduplicator.skipped} skipped in total)', {'skipped': deduplicator.skipped})
+        return duplicate
+
+    def _save(self, frame:Frame, path:Path, encoder:Encoder, destination:Path=None, processing:StageChain=None, copies:list=()) -> None:
+        """Process, encode and write a frame
+        Args:
+            frame (Frame): The frame
+            path (Path): Where it is written, or None if it could not be named and is only copied
+            encoder (Encoder): The format it is written in
+            destination (Path, optional): With a spool, the folder the file is moved to
+            processing (StageChain, optional): Stages applied to the frame first
+            copies (list, optional): MirrorJobs resolved with the encoded frame
+        """
+        written = False
+        try:
+            start = self._process(frame, processing)
+            data = None
+            # Copies need the encoded bytes, so frames with copies are always encoded in memory
+            if frame.pixelCount() >= self.streamMinPixels and not copies:
+                # Encoding and writing overlap, so they are timed together
+                self._writeFile(path, lambda f: encoder.encodeRegion(frame.image, frame.box, f), destination)
+                written = True
+                end = time.perf_counter()
+                self.metrics.record('encode', end - start)
+            else:
+                image = frame.pixels()
+                if self._processPool:
+                    data = self._processPool.submit(encodeImage, encoder, image).result()
+                else:
+                    data = encodeImage(encoder, image)
+                encoded = time.perf_counter()
+                self.metrics.record('encode', encoded - start)
+                # Handed over before writing, so that this folder being slow doesn't hold up the copies
+                for copy in copies:
+                    copy.resolve(data)
+                if not path:
+                    return
+                self._writeFile(path, lambda f: f.write(data), destination)
+                written = True
+                end = time.perf_counter()
+                self.metrics.record('write', end - encoded)
+            latency = end - frame.time
+            self.metrics.record('total', latency)
+            self.report(EventType.SCREENSHOT, f'Screenshot saved to {path} (queue: {self.queueDepth()})', {'path': str(path), 'latency': latency})
+            if self.catalog:
+                self.catalog.add(path, destination, frame.image, frame.box, data, frame.captured)
+            frame.future.set_result(path)
+        except Exception as e:
+            target = path or 'its copies'
+            logger.exception(f'Failed to save screenshot to {target}')
+            if path and not written:
+                # Named files are created empty up front, so an empty or cut short file would be left behind
+                removeQuietly(path)
+            self.report(EventType.FAILURE, f'Failed to save screenshot to {target}')
+            if not frame.future.done():
+                frame.future.set_exception(e)
+        finally:
+            # Copies of a frame that could not be encoded are skipped
+            for copy in copies:
+                copy.resolve(None)
+
+    def _append(self, frame:Frame, slot:int, processing:StageChain=None) -> None:
+        """Process a frame and add it to the archive
+        Args:
+            slot (int): The frame's place in the archive, from SessionArchive.reserve
+        """
+        try:
+            try:
+                start = self._process(frame, processing)
+                image = frame.pixels()
+            except BaseException:
+                # Frames of later slots wait for this one
+                self.archive.skip(slot)
+                raise
+            number = self.archive.append(image, frame.burstId, frame.burstIdx, frame.label, slot, frame.captured)
+            end = time.perf_counter()
+            self.metrics.record('encode', end - start)
+            latency = end - frame.time
+            self.metrics.record('total', latency)
+            path = self.archive.path
+            self.report(EventType.SCREENSHOT, f'Screenshot {number} added to {path} (queue: {self.queueDepth()})', {'path': str(path), 'frame': number, 'latency': latency})
+            frame.future.set_result(path)
+        except Exception as e:
+            logger.exception('Failed to add screenshot to the session archive')
+            self.report(EventType.FAILURE, 'Failed to add screenshot to the session archive')
+            frame.future.set_exception(e)
+
+    def _process(self, frame:Frame, processing:StageChain=None) -> float:
+        """Apply the processing stages to a frame, recording the time of each stage and of the whole chain
+        Returns:
+            float: time.perf_counter() once done
+        """
+        start = time.perf_counter()
+        if not processing:
+            return start
+        frame.image = processing.apply(frame.pixels(), frame.captured, self.metrics.record)
+        end = time.perf_counter()
+        self.metrics.record('process', end - start)
+        return end
+
+    def _writeFile(self, path:Path, write, destination:Path=None) -> None:
+        """Open path and let write fill it. In a spool, the file is written under a temporary name, and handed to the
+        spool once complete.
+        Args:
+            path (Path): The file to write
+            write (Callable): Called with the open file
+            destination (Path, optional): With a spool, the folder the file is moved to
+        """
+        if not self.spool:
+            with open(path, 'wb') as f:
+                write(f)
+            return
+        partPath = path.with_name(path.name + PART_SUFFIX)
+        try:
+            with open(partPath, 'wb') as f:
+                write(f)
+            os.replace(partPath, path)
+        except BaseException:
+            removeQuietly(partPath)
+            raise
+        self.spool.add(path, destination)
+
+    def report(self, eventType:EventType, text:str, data:dict=None) -> None:
+        logger.warning(text)
+        self.broadcaster.report(eventType, text=text, data=data)
+
+def removeQuietly(path:Path) -> None:
+    """Remove a file that was not written completely. Failures are only logged.
+    """
+    try:
+        path.unlink(missing_ok=True)
+    except OSError:
+        logger.exception(f'Failed to remove {path}')
+
+def encodeImage(encoder:Encoder, image) -> bytes:
+    """Encode image in memory. Module level so that it can be run in a process pool.
+    """
+    buffer = io.BytesIO()
+    encoder.encode(image, buffer)
+    return buffer.getvalue()
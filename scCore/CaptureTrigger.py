@@ -0,0 +1,150 @@
+from scCore.Broadcaster import Broadcaster, EventType
+from scCore.RateLimiter import RateLimiter
+from typing import Callable
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between two reports of suppressed triggers
+REPORT_INTERVAL = 1
+# Why a trigger was suppressed
+SUPPRESSED_INTERVAL = 'interval'
+SUPPRESSED_RATE = 'rate'
+SUPPRESSED_COALESCED = 'coalesced'
+
+class CaptureTrigger(object):
+    """Runs the captures triggered by keys on a thread of their own, so that the keyboard listener never waits for a
+    grab, and keeps a flood of triggers, such as a stuck key or a macro tool, from saturating the CPU and the disk:
+    - A key triggering again less than minInterval seconds after the trigger of its last capture is ignored
+    - Captures are limited to rate per second on average, with up to bucket in quick succession
+    - While a capture runs, triggers are coalesced: each key has at most one capture waiting, which grabs the screen
+      as it is when it runs
+    Suppressed triggers are counted, and reported at most once per REPORT_INTERVAL.
+    """
+    def __init__(self, capture:Callable, broadcaster:Broadcaster, minInterval:float=0, rate:float=0, bucket:int=1):
+        """
+        Args:
+            capture (Callable): Called with the key of each capture to run
+            broadcaster (Broadcaster): Informed of suppressed triggers
+            minInterval (float, optional): Minimum seconds between two captures of the same key. Defaults to 0.
+            rate (float, optional): Captures per second allowed on average. 0 allows any rate. Defaults to 0.
+            bucket (int, optional): Captures allowed in quick succession. Defaults to 1.
+        """
+        self._capture = capture
+        self.broadcaster = broadcaster
+        self.minInterval = minInterval
+        self._limiter = RateLimiter(rate, bucket)
+        self._condition = threading.Condition()
+        # Keys with a capture waiting to run, oldest first
+        self._pending = {}
+        self._lastCapture = {}
+        self._suppressed = {SUPPRESSED_INTERVAL: 0, SUPPRESSED_RATE: 0, SUPPRESSED_COALESCED: 0}
+        self._reported = 0
+        self._lastReport = 0
+        self._stopping = False
+        self._thread = None
+
+    def start(self) -> None:
+        """Start running captures. Does not block. A stopped trigger can be started again.
+        """
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='CaptureTrigger', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop running captures. Blocks until the running capture is done. Waiting captures are dropped.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        with self._condition:
+            self._pending.clear()
+        self._report(force=True)
+
+    def configure(self, minInterval:float, rate:float, bucket:int) -> None:
+        """Change the limits. See __init__.
+        """
+        with self._condition:
+            self.minInterval = minInterval
+            self._limiter = RateLimiter(rate, bucket)
+
+    def fire(self, key=None) -> bool:
+        """Ask for a capture of key. Does not block.
+        Args:
+            key (optional): Passed to the capture. Defaults to None.
+        Returns:
+            bool: True if a capture will run, False if the trigger was suppressed
+        """
+        now = time.monotonic()
+        with self._condition:
+            if key in self._pending:
+                reason = SUPPRESSED_COALESCED
+            elif now - self._lastCapture.get(key, -self.minInterval) < self.minInterval:
+                reason = SUPPRESSED_INTERVAL
+            elif not self._limiter.tryAcquire(now):
+                reason = SUPPRESSED_RATE
+            else:
+                self._lastCapture[key] = now
+                self._pending[key] = now
+                self._condition.notify_all()
+                return True
+            self._suppressed[reason] += 1
+        logger.debug(f'Capture trigger suppressed ({reason}): {key}')
+        self._report()
+        return False
+
+    def suppressed(self) -> dict:
+        """
+        Returns:
+            dict: Number of suppressed triggers by reason: interval, rate and coalesced
+        """
+        with self._condition:
+            return dict(self._suppressed)
+
+    def suppressedCount(self) -> int:
+        with self._condition:
+            return sum(self._suppressed.values())
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if not self._pending and not self._stopping:
+                    # Wakes up while triggers are being suppressed, so that the last ones are reported too
+                    self._condition.wait(REPORT_INTERVAL if self._unreported() else None)
+                if self._stopping:
+                    return
+                keys = list(self._pending)[:1]
+                for key in keys:
+                    del self._pending[key]
+            for key in keys:
+                try:
+                    self._capture(key)
+                except Exception:
+                    logger.exception('Capture failed')
+                    self.broadcaster.report(EventType.FAILURE, 'Failed to take screenshot')
+            self._report()
+
+    def _unreported(self) -> bool:
+        """Must be called while holding _condition
+        """
+        return sum(self._suppressed.values()) != self._reported
+
+    def _report(self, force:bool=False) -> None:
+        """Broadcast the suppressed triggers if there are new ones, at most once per REPORT_INTERVAL unless forced
+        """
+        now = time.monotonic()
+        with self._condition:
+            if not self._unreported() or (not force and now - self._lastReport < REPORT_INTERVAL):
+                return
+            self._lastReport = now
+            self._reported = total = sum(self._suppressed.values())
+            counts = dict(self._suppressed)
+        text = (f'{total} capture triggers suppressed ({counts[SUPPRESSED_INTERVAL]} too soon after the previous one, '
+                f'{counts[SUPPRESSED_RATE]} over the rate limit, {counts[SUPPRESSED_COALESCED]} while a capture was waiting)')
+        logger.warning(text)
+        self.broadcaster.report(EventType.SUPPRESSED, text, dict(counts, suppressed=total))
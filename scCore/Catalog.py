@@ -0,0 +1,438 @@
+"""A catalog of the screenshots of a folder, in a SQLite file in the folder, so that screenshots can be searched and
+previewed without opening the images.
+
+Each screenshot has a row with its name, the time it was taken, the region it shows, its format, size and content
+hash, and a small PNG thumbnail. Screenshots are added as they are saved, by a CatalogUpdater, and existing folders are
+indexed by a CatalogIndexer.
+"""
+from scCore.ScreenshotNamer import NAME_REGEX
+from scCore.BatchCropper import IMAGE_SUFFIXES
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+import threading
+import hashlib
+import sqlite3
+import logging
+import time
+import io
+import os
+
+logger = logging.getLogger(__name__)
+
+CATALOG_NAME = '.screenshot-catalog.sqlite'
+# Thumbnails fit in this box, keeping the proportions of the screenshot
+THUMBNAIL_SIZE = (160, 120)
+# Screenshots whose pixels the updater keeps in memory while they wait for a thumbnail. Screenshots saved while this
+# many are waiting get their thumbnail from their file instead, so that a burst can't fill the memory.
+MAX_PENDING_IMAGES = 16
+# Rows written per transaction
+COMMIT_EVERY = 100
+# Files handed to the indexer's pool per job
+IN_FLIGHT_PER_JOB = 4
+# Seconds between two progress reports of the indexer
+PROGRESS_INTERVAL = 2
+# Added to the niceness of the updater's thread, where the platform allows it
+BACKGROUND_NICENESS = 10
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS screenshots (
+    name TEXT PRIMARY KEY,
+    captured TEXT NOT NULL,
+    region TEXT,
+    format TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS thumbnails (
+    name TEXT PRIMARY KEY,
+    png BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS screenshotsByTime ON screenshots (mtime);
+CREATE INDEX IF NOT EXISTS screenshotsByRegion ON screenshots (region, mtime);
+CREATE INDEX IF NOT EXISTS screenshotsByHash ON screenshots (hash);
+'''
+# Columns of the screenshots table. Thumbnails are in a table of their own, so that searches scan a small table.
+COLUMNS = ('name', 'captured', 'region', 'format', 'width', 'height', 'bytes', 'mtime', 'hash')
+
+class Catalog(object):
+    """The catalog of one folder. Thread safe.
+    """
+    def __init__(self, folder:Path, readOnly:bool=False):
+        """
+        Args:
+            folder (Path): The screenshot folder
+            readOnly (bool, optional): Only read the catalog, which must exist. Defaults to False.
+        Raises:
+            FileNotFoundError: If readOnly and the folder has no catalog
+        """
+        self.folder = folder
+        self.path = folder / CATALOG_NAME
+        if readOnly:
+            if not self.path.exists():
+                raise FileNotFoundError(f'No catalog in {folder}')
+            self._connection = sqlite3.connect(self.path.resolve().as_uri() + '?mode=ro', uri=True, check_same_thread=False)
+        else:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            # Readers, such as the GUI, don't wait for the updater's transactions
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def put(self, rows:list) -> None:
+        """Add or replace screenshots, in one transaction
+        Args:
+            rows (list): A dict per screenshot, with the keys of COLUMNS and its thumbnail. See describe.
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(f"INSERT OR REPLACE INTO screenshots ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                                         [tuple(row[column] for column in COLUMNS) for row in rows])
+            self._connection.executemany('INSERT OR REPLACE INTO thumbnails (name, png) VALUES (?, ?)',
+                                         [(row['name'], row['thumbnail']) for row in rows])
+
+    def remove(self, names:list) -> None:
+        with self._lock, self._connection:
+            self._connection.executemany('DELETE FROM screenshots WHERE name = ?', [(name,) for name in names])
+            self._connection.executemany('DELETE FROM thumbnails WHERE name = ?', [(name,) for name in names])
+
+    def known(self) -> dict:
+        """
+        Returns:
+            dict: Name of each screenshot in the catalog -> (size in bytes, modification time in ns) when it was added
+        """
+        with self._lock:
+            return {name: (size, mtime) for name, size, mtime in self._connection.execute('SELECT name, bytes, mtime FROM screenshots')}
+
+    def search(self, text:str='', region:str=None, limit:int=500, offset:int=0) -> list:
+        """Find screenshots, most recent first. See thumbnail for their thumbnails.
+        Args:
+            text (str, optional): Part of the name or of the capture time, such as a date. Defaults to all screenshots.
+            region (str, optional): Only screenshots of this region. '' for screenshots of no region. Defaults to any.
+            limit (int, optional): Maximum number of screenshots returned. Defaults to 500.
+            offset (int, optional): Number of matching screenshots skipped. Defaults to 0.
+        Returns:
+            list: A dict per screenshot, with the keys of COLUMNS
+        """
+        where, parameters = self._filter(text, region)
+        with self._lock:
+            cursor = self._connection.execute(f"SELECT {', '.join(COLUMNS)} FROM screenshots{where} ORDER BY mtime DESC, name DESC LIMIT ? OFFSET ?",
+                                              parameters + [limit, offset])
+            return [dict(zip(COLUMNS, row)) for row in cursor]
+
+    def count(self, text:str='', region:str=None) -> int:
+        """
+        Returns:
+            int: Number of screenshots search would find without a limit
+        """
+        where, parameters = self._filter(text, region)
+        with self._lock:
+            return self._connection.execute(f'SELECT COUNT(*) FROM screenshots{where}', parameters).fetchone()[0]
+
+    def regions(self) -> list:
+        """
+        Returns:
+            list: Names of the regions that have screenshots, sorted
+        """
+        with self._lock:
+            return [row[0] for row in self._connection.execute('SELECT DISTINCT region FROM screenshots WHERE region IS NOT NULL ORDER BY region')]
+
+    def thumbnail(self, name:str) -> bytes:
+        """
+        Returns:
+            bytes: The thumbnail of a screenshot as a PNG, or None if it has none
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT png FROM thumbnails WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _filter(self, text:str, region:str) -> tuple:
+        """
+        Returns:
+            tuple: The WHERE clause matching text and region, and its parameters
+        """
+        conditions = []
+        parameters = []
+        if text:
+            conditions.append("(name LIKE ? ESCAPE '\\' OR captured LIKE ? ESCAPE '\\')")
+            pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            parameters += [pattern, pattern]
+        if region == '':
+            conditions.append('region IS NULL')
+        elif region is not None:
+            conditions.append('region = ?')
+            parameters.append(region)
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), parameters
+
+class CatalogUpdater(object):
+    """Adds the screenshots being saved to the catalog of their folder, on a background thread of low priority, so
+    that hashing, thumbnails and database writes never hold up a capture.
+    """
+    def __init__(self, maxPendingImages:int=MAX_PENDING_IMAGES):
+        """
+        Args:
+            maxPendingImages (int, optional): See MAX_PENDING_IMAGES. Defaults to MAX_PENDING_IMAGES.
+        """
+        self.maxPendingImages = maxPendingImages
+        self._condition = threading.Condition()
+        self._pending = deque()
+        self._pendingImages = 0
+        self._stopping = False
+        self._thread = None
+        # Folder -> Catalog, opened by the updater's thread as screenshots are saved there
+        self._catalogs = {}
+        self.added = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        """Start adding screenshots. Does not block. A stopped updater can be started again.
+        """
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='CatalogUpdater', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Add the screenshots still waiting, then stop. Blocks until they are added.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for catalog in self._catalogs.values():
+            catalog.close()
+        self._catalogs = {}
+
+    def add(self, path:Path, folder:Path=None, image=None, box:tuple=None, data:bytes=None, captured:datetime=None) -> None:
+        """Queue a saved screenshot to be added to the catalog. Does not block.
+        Args:
+            path (Path): The screenshot file
+            folder (Path, optional): The folder whose catalog it goes in, if the file is being moved there, such as from
+                a spool. Defaults to the folder of path.
+            image (PIL.Image.Image, optional): The screenshot's pixels, to make the thumbnail without reading the file
+            box (tuple, optional): (left, upper, right, lower) part of image that was saved. Defaults to all of it.
+            data (bytes, optional): The contents of the file, to hash without reading the file
+            captured (datetime, optional): When the screenshot was taken. Defaults to the time the file was last modified.
+        """
+        with self._condition:
+            if image is not None and self._pendingImages >= self.maxPendingImages:
+                image = None
+                data = None
+            if image is not None:
+                self._pendingImages += 1
+            self._pending.append((path, folder or path.parent, image, box, data, captured))
+            self._condition.notify_all()
+
+    def pendingCount(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def _run(self) -> None:
+        lowerThreadPriority()
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopping:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                batch = [self._pending.popleft() for i in range(min(COMMIT_EVERY, len(self._pending)))]
+            # Rows by folder
+            rows = {}
+            for path, folder, image, box, data, captured in batch:
+                try:
+                    rows.setdefault(folder, []).append(describe(findFile(path, folder), image, box, data, captured))
+                except Exception as e:
+                    logger.warning(f'Failed to catalog {path}: {e}')
+                    self.failed += 1
+                if image is not None:
+                    with self._condition:
+                        self._pendingImages -= 1
+            for folder, folderRows in rows.items():
+                try:
+                    catalog = self._catalogs.get(folder)
+                    if catalog is None:
+                        catalog = self._catalogs[folder] = Catalog(folder)
+                    catalog.put(folderRows)
+                    self.added += len(folderRows)
+                except Exception:
+                    logger.exception(f'Failed to update the catalog of {folder}')
+                    self.failed += len(folderRows)
+
+class CatalogIndexer(object):
+    """Adds the images already in a folder to its catalog, in a process pool. Images that are in the catalog with the
+    same size and modification time are skipped, so an interrupted run picks up where it stopped. Rows of files that
+    no longer exist are removed.
+    """
+    def __init__(self, folder:Path, jobs:int=None, restart:bool=False):
+        """
+        Args:
+            folder (Path): The screenshot folder. Sub-folders are ignored.
+            jobs (int, optional): Number of processes. Defaults to the number of CPUs.
+            restart (bool, optional): Index every image again, even those already in the catalog. Defaults to False.
+        """
+        self.folder = folder
+        self.jobs = jobs or os.cpu_count() or 1
+        self.restart = restart
+        self.done = 0
+        self.skipped = 0
+        self.removed = 0
+        self.failed = 0
+        self.duration = 0.0
+
+    def run(self, onProgress=None) -> dict:
+        """Index the folder. Blocks until done.
+        Args:
+            onProgress (Callable, optional): Called regularly with a line describing the progress
+        Returns:
+            dict: The number of images done, skipped and failed, of rows removed, the duration in seconds and the throughput
+        """
+        catalog = Catalog(self.folder)
+        start = time.perf_counter()
+        lastReport = start
+        try:
+            known = {} if self.restart else catalog.known()
+            seen = set()
+            rows = []
+            inFlight = {}
+            maxInFlight = self.jobs * IN_FLIGHT_PER_JOB
+            with ProcessPoolExecutor(self.jobs) as pool:
+                for entry in self.imageEntries():
+                    seen.add(entry.name)
+                    stat = entry.stat()
+                    if known.get(entry.name) == (stat.st_size, stat.st_mtime_ns):
+                        self.skipped += 1
+                        continue
+                    if len(inFlight) >= maxInFlight:
+                        self._collect(inFlight, rows, catalog, FIRST_COMPLETED)
+                    inFlight[pool.submit(describe, Path(entry.path))] = entry.name
+                    now = time.perf_counter()
+                    if onProgress and now - lastReport >= PROGRESS_INTERVAL:
+                        lastReport = now
+                        onProgress(self.progress())
+                self._collect(inFlight, rows, catalog)
+            if rows:
+                catalog.put(rows)
+            gone = [name for name in catalog.known() if name not in seen]
+            catalog.remove(gone)
+            self.removed = len(gone)
+        finally:
+            catalog.close()
+        self.duration = time.perf_counter() - start
+        return self.summary()
+
+    def imageEntries(self):
+        """
+        Yields:
+            os.DirEntry: The image files of the folder, in the order the folder lists them
+        """
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_SUFFIXES:
+                    yield entry
+
+    def progress(self) -> str:
+        return f'{self.done} images indexed, {self.skipped} already done, {self.failed} failed'
+
+    def filesPerSecond(self) -> float:
+        if self.duration <= 0:
+            return 0.0
+        return self.done / self.duration
+
+    def summary(self) -> dict:
+        return {
+            'done': self.done,
+            'skipped': self.skipped,
+            'removed': self.removed,
+            'failed': self.failed,
+            'seconds': self.duration,
+            'filesPerSecond': self.filesPerSecond()
+        }
+
+    def _collect(self, inFlight:dict, rows:list, catalog:Catalog, returnWhen:str='ALL_COMPLETED') -> None:
+        """Wait for images in flight, and write their rows every COMMIT_EVERY images
+        """
+        completed, _ = wait(inFlight, return_when=returnWhen)
+        for future in completed:
+            name = inFlight.pop(future)
+            try:
+                rows.append(future.result())
+                self.done += 1
+            except Exception as e:
+                logger.error(f'Failed to index {name}: {e}')
+                self.failed += 1
+        if len(rows) >= COMMIT_EVERY:
+            catalog.put(rows)
+            rows.clear()
+
+def describe(path:Path, image=None, box:tuple=None, data:bytes=None, captured:datetime=None) -> dict:
+    """Make the catalog row of a screenshot. Module level so that it can be run in a process pool.
+    Args:
+        path (Path): The screenshot file
+        image (PIL.Image.Image, optional): Its pixels. Defaults to reading the file.
+        box (tuple, optional): (left, upper, right, lower) part of image that was saved. Defaults to all of it.
+        data (bytes, optional): The contents of the file. Defaults to reading the file.
+        captured (datetime, optional): When the screenshot was taken. Defaults to the time the file was last modified.
+    Returns:
+        dict: The row, with the keys of COLUMNS, and its thumbnail as a PNG
+    """
+    from PIL import Image
+    stat = path.stat()
+    if data is None:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+    else:
+        digest = hashlib.blake2b(data, digest_size=16)
+    if image is not None:
+        box = box or (0, 0) + image.size
+        width, height = box[2] - box[0], box[3] - box[1]
+        scale = min(THUMBNAIL_SIZE[0] / width, THUMBNAIL_SIZE[1] / height, 1)
+        thumbnail = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.Resampling.BILINEAR, box=box, reducing_gap=2.0)
+    else:
+        with Image.open(path) as file:
+            width, height = file.size
+            # Lets JPEGs be decoded at a fraction of their size
+            file.draft('RGB', THUMBNAIL_SIZE)
+            thumbnail = file.convert('RGB')
+        thumbnail.thumbnail(THUMBNAIL_SIZE, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, 'png', compress_level=1)
+    m = NAME_REGEX.fullmatch(path.name)
+    return {
+        'name': path.name,
+        'captured': (captured or datetime.fromtimestamp(stat.st_mtime)).isoformat(sep=' ', timespec='seconds'),
+        'region': m.group(3) if m else None,
+        'format': path.suffix[1:].lower(),
+        'width': width,
+        'height': height,
+        'bytes': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'hash': digest.hexdigest(),
+        'thumbnail': buffer.getvalue()
+        }
+
+def findFile(path:Path, folder:Path) -> Path:
+    """
+    Returns:
+        Path: path if it exists, or the file of the same name in folder, where it may have been moved since
+    """
+    return path if path.exists() else folder / path.name
+
+def lowerThreadPriority() -> None:
+    """Lower the scheduling priority of the calling thread, on platforms that allow it per thread, such as Linux
+    """
+    try:
+        threadId = threading.get_native_id()
+        os.setpriority(os.PRIO_PROCESS, threadId, os.getpriority(os.PRIO_PROCESS, threadId) + BACKGROUND_NICENESS)
+    except (AttributeError, OSError):
+        pass
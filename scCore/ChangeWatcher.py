@@ -0,0 +1,87 @@
+from scCore.CaptureBackend import CaptureBackend
+from typing import Callable
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Frames are shrunk to about this width before being compared
+SAMPLE_WIDTH = 240
+# Difference in grey level above which a sampled pixel counts as changed
+PIXEL_THRESHOLD = 24
+
+class ChangeWatcher(object):
+    """Samples the region at a low rate, and calls onChange with the frame when enough of it changed since the previous sample.
+    Frames are compared as small greyscale arrays with NumPy, so sampling costs little more than the grab itself.
+    """
+    def __init__(self, backend:CaptureBackend, region:tuple, threshold:float, rate:float, cooldown:float, onChange:Callable):
+        """
+        Args:
+            backend (CaptureBackend): Grabs the samples
+            region (tuple): The region to watch
+            threshold (float): Fraction of the region, between 0 and 1, that must change to trigger onChange
+            rate (float): Samples per second
+            cooldown (float): Minimum number of seconds between two calls to onChange
+            onChange (Callable): Called with the changed frame (PIL.Image.Image), the changed fraction (float) and
+                the time.perf_counter() when the sample was taken (float)
+        """
+        import numpy
+        self._numpy = numpy
+        self._backend = backend
+        self._region = region
+        self.threshold = threshold
+        self.rate = rate
+        self.cooldown = cooldown
+        self._onChange = onChange
+        self._previous = None
+        self._stopEvent = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='ChangeWatcher', daemon=True)
+
+    def start(self) -> None:
+        """Start sampling. Does not block.
+        """
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling. Blocks until the current sample has been handled.
+        """
+        self._stopEvent.set()
+        self._thread.join()
+
+    def changedFraction(self, image) -> float:
+        """Compare image with the previous sample, and remember it for the next comparison
+        Args:
+            image (PIL.Image.Image): The new sample
+        Returns:
+            float: Fraction of the image that changed, between 0 and 1. 0 for the first sample.
+        """
+        factor = max(1, image.width // SAMPLE_WIDTH)
+        sample = self._numpy.asarray(image.reduce(factor).convert('L'), dtype=self._numpy.int16)
+        previous = self._previous
+        self._previous = sample
+        if previous is None or previous.shape != sample.shape:
+            return 0.0
+        changed = self._numpy.count_nonzero(self._numpy.abs(sample - previous) > PIXEL_THRESHOLD)
+        return int(changed) / sample.size
+
+    def _run(self) -> None:
+        interval = 1 / self.rate
+        lastChange = -self.cooldown
+        nextTime = time.perf_counter()
+        while not self._stopEvent.is_set():
+            try:
+                sampleTime = time.perf_counter()
+                image = self._backend.grab(self._region)
+                fraction = self.changedFraction(image)
+                if fraction >= self.threshold and sampleTime - lastChange >= self.cooldown:
+                    lastChange = sampleTime
+                    self._onChange(image, fraction, sampleTime)
+            except Exception:
+                logger.exception('Change detection failed')
+            nextTime += interval
+            delay = nextTime - time.perf_counter()
+            if delay > 0:
+                self._stopEvent.wait(delay)
+            else:
+                nextTime = time.perf_counter()
@@ -0,0 +1,77 @@
+from scCore.ControlServer import HOST, DEFAULT_CAPTURE_TIMEOUT
+from urllib.parse import urlencode
+import http.client
+import json
+
+class ControlError(Exception):
+    """The control server refused or failed a command
+    """
+    def __init__(self, status:int, message:str):
+        super().__init__(f'{message} (HTTP {status})')
+        self.status = status
+
+class ControlClient(object):
+    """Sends commands to the ControlServer of a running screenshot cropper. Keeps its connection open between commands,
+    so a client must not be shared between threads.
+    """
+    def __init__(self, port:int, host:str=HOST, timeout:float=DEFAULT_CAPTURE_TIMEOUT + 5):
+        """
+        Args:
+            port (int): Port the control server listens on
+            host (str, optional): Defaults to HOST.
+            timeout (float, optional): Seconds to wait for an answer. Defaults to a little more than the capture timeout.
+        """
+        self._connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def capture(self, key:str=None, timeout:float=None) -> dict:
+        """Take a screenshot, and wait for it to be written
+        Args:
+            key (str, optional): A region key, to capture its regions instead. Defaults to the F12 capture.
+            timeout (float, optional): Seconds the server waits for the files. Defaults to the server's default.
+        Returns:
+            dict: 'paths' of the saved files, number of screenshots 'skipped' as duplicates or dropped, and the 'ms' taken
+        """
+        query = {}
+        if key:
+            query['key'] = key
+        if timeout:
+            query['timeout'] = timeout
+        return self._request('POST', '/capture' + ('?' + urlencode(query) if query else ''))
+
+    def startBurst(self) -> str:
+        return self._request('POST', '/burst/start')['text']
+
+    def stopBurst(self) -> str:
+        """
+        Returns:
+            str: A summary of the burst
+        """
+        return self._request('POST', '/burst/stop')['text']
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: See ScreenShotEventHandler.stats
+        """
+        return self._request('GET', '/stats')
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def _request(self, method:str, path:str) -> dict:
+        """
+        Raises:
+            ControlError: If the server answered with an error
+            OSError: If the server could not be reached
+        """
+        try:
+            self._connection.request(method, path)
+            response = self._connection.getresponse()
+            body = json.loads(response.read() or b'{}')
+        except (http.client.HTTPException, OSError):
+            # The connection may have been closed by the server, so don't reuse it
+            self._connection.close()
+            raise
+        if response.status >= 400:
+            raise ControlError(response.status, body.get('error', response.reason))
+        return body
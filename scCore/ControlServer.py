@@ -0,0 +1,166 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit, parse_qs
+import threading
+import logging
+import json
+import time
+
+logger = logging.getLogger(__name__)
+
+# Only local programs may trigger captures
+HOST = '127.0.0.1'
+# Seconds a capture request waits for its screenshots to be written
+DEFAULT_CAPTURE_TIMEOUT = 10
+
+class ControlServer(object):
+    """Serves a small HTTP API on localhost, so that captures can be triggered by scripts rather than by F12.
+    Requests are answered once the screenshots are on disk, with their paths.
+
+    POST /capture            Take a screenshot, like F12. ?key=KEY captures the regions of that key instead.
+                             ?timeout=SECONDS limits the wait for the files, 10s by default.
+    POST /burst/start        Start a burst, like the burst key
+    POST /burst/stop         Stop the burst, and return its summary
+    GET  /stats              Stage timings, queue depth and dropped, skipped and spooled screenshot counts
+
+    Answers are JSON objects. Errors have status 4xx or 5xx and an 'error' message.
+    """
+    def __init__(self, handler, port:int):
+        """
+        Args:
+            handler (ScreenShotEventHandler): Takes the screenshots
+            port (int): Port listened on, on 127.0.0.1. 0 picks a free port, see address().
+        """
+        self.handler = handler
+        self._server = ThreadingHTTPServer((HOST, port), ControlRequestHandler)
+        self._server.daemon_threads = True
+        self._server.control = self
+        # Grabs happen on a single thread, as backends keep a screen handle per thread
+        self._grabber = None
+        self._thread = None
+
+    def address(self) -> tuple:
+        """
+        Returns:
+            tuple: (host, port) the server listens on
+        """
+        return self._server.server_address[:2]
+
+    def start(self) -> None:
+        """Start answering requests. Does not block.
+        """
+        self._grabber = ThreadPoolExecutor(1, thread_name_prefix='ControlGrab')
+        self._thread = threading.Thread(target=self._server.serve_forever, name='ControlServer', daemon=True)
+        self._thread.start()
+        logger.warning(f'Control server listening on http://{HOST}:{self.address()[1]}')
+
+    def stop(self) -> None:
+        """Stop answering requests, and close the port
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._grabber.shutdown()
+
+    def capture(self, key:str=None, timeout:float=DEFAULT_CAPTURE_TIMEOUT) -> dict:
+        """Take a screenshot and wait for it to be written
+        Args:
+            key (str, optional): Name of a region key, to capture its regions. Defaults to the F12 capture.
+            timeout (float, optional): Seconds to wait for the files. Defaults to DEFAULT_CAPTURE_TIMEOUT.
+        Raises:
+            KeyError: If no regions are captured by key
+            TimeoutError: If the files weren't written in time
+        Returns:
+            dict: paths of the saved files, number of screenshots skipped or dropped, and the time taken in ms
+        """
+        start = time.perf_counter()
+        trigger = None
+        if key:
+            # Imported here, as the handler imports this module
+            from scCore.ScreenshotEventHandler import toKey
+            trigger = toKey(key.lower())
+            if trigger not in self.handler.regionGroups:
+                raise KeyError(f'No region is captured by {key}')
+        futures = self._grabber.submit(self.handler.takeScreenshot, trigger).result(timeout)
+        done, notDone = wait(futures, timeout - (time.perf_counter() - start))
+        if notDone:
+            raise TimeoutError(f'{len(notDone)} screenshots were not written within {timeout:g}s')
+        paths = [future.result() for future in futures]
+        return {
+            'paths': [str(path) for path in paths if path],
+            'skipped': sum(1 for path in paths if not path),
+            'ms': (time.perf_counter() - start) * 1000
+            }
+
+class ControlRequestHandler(BaseHTTPRequestHandler):
+    """Handles one request of the control API. See ControlServer.
+    """
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, which Nagle's algorithm would delay by up to 40 ms on a kept-alive connection
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        if not self._allowed():
+            return
+        path, query = self._route()
+        if path == '/stats':
+            self._reply(200, self.server.control.handler.stats())
+        else:
+            self._reply(404, {'error': f'Unknown command: GET {path}'})
+
+    def do_POST(self) -> None:
+        if not self._allowed():
+            return
+        path, query = self._route()
+        handler = self.server.control.handler
+        try:
+            if path == '/capture':
+                timeout = float(query.get('timeout', [DEFAULT_CAPTURE_TIMEOUT])[0])
+                self._reply(200, self.server.control.capture(query.get('key', [None])[0], timeout))
+            elif path == '/burst/start':
+                if handler.burstFps <= 0:
+                    self._reply(409, {'error': 'Bursts are disabled, set burst fps above 0'})
+                elif handler.startBurst():
+                    self._reply(200, {'text': f'Burst started at {handler.burstFps:g} fps'})
+                else:
+                    self._reply(409, {'error': 'A burst is already running'})
+            elif path == '/burst/stop':
+                summary = handler.stopBurst()
+                if summary:
+                    self._reply(200, {'text': summary})
+                else:
+                    self._reply(409, {'error': 'No burst is running'})
+            else:
+                self._reply(404, {'error': f'Unknown command: POST {path}'})
+        except (KeyError, ValueError) as e:
+            self._reply(400, {'error': str(e).strip("'")})
+        except TimeoutError as e:
+            self._reply(504, {'error': str(e)})
+        except Exception as e:
+            logger.exception(f'Control command failed: {path}')
+            self._reply(500, {'error': str(e)})
+
+    def _allowed(self) -> bool:
+        """Browsers send an Origin header with requests made by web pages, which must not be able to take screenshots
+        """
+        # Unread request bodies would be taken for the next request on this connection
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Origin'):
+            self._reply(403, {'error': 'Requests from web pages are not allowed'})
+            return False
+        return True
+
+    def _route(self) -> tuple:
+        url = urlsplit(self.path)
+        return url.path.rstrip('/'), parse_qs(url.query)
+
+    def _reply(self, status:int, body:dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format:str, *args) -> None:
+        logger.debug('Control request: ' + format % args)
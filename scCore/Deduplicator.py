@@ -0,0 +1,148 @@
+from collections import deque, OrderedDict
+from PIL import Image
+import threading
+import hashlib
+import zlib
+
+# Size of the greyscale thumbnail the perceptual hash is computed from. Its bits compare adjacent columns, so the thumbnail is one column wider.
+HASH_WIDTH = 8
+HASH_HEIGHT = 8
+# The frame is sampled down to this many pixels per hash cell before being averaged, which is much faster than averaging every pixel
+SAMPLES_PER_CELL = 8
+# Size of the grid of pixels the exact fingerprint samples. Frames are only compared in full when their samples match.
+SAMPLE_SIZE = (240, 135)
+# Regions and sizes whose recent frames are remembered at most. The least recently seen are forgotten beyond this.
+MAX_GROUPS = 64
+
+class Fingerprint(object):
+    """What exact mode compares a frame by: a cheap sample of its pixels, and a digest of all of them, only computed
+    once a frame with the same sample comes along. The image is kept until then, but only for the last frame of each
+    region and size, so a digest that was never needed is never computed.
+    """
+    __slots__ = ('sample', 'digest', 'image')
+
+    def __init__(self, sample:int, image:Image.Image=None):
+        self.sample = sample
+        self.digest = None
+        self.image = image
+
+    def full(self) -> bytes:
+        """
+        Returns:
+            bytes: The digest of every pixel, or None if it wasn't computed before the image was let go
+        """
+        image = self.image
+        if self.digest is None and image is not None:
+            self.digest = digest(image)
+        return self.digest
+
+class Deduplicator(object):
+    """Remembers the last saved frames, so that frames which would produce the same file can be skipped before encoding.
+    Frames are only compared with recent frames of the same region and size, so that a region is never skipped for
+    looking like another one.
+    In exact mode, frames are first compared by a sample of their pixels, which takes a fraction of a millisecond, and
+    only frames with matching samples are compared by a digest of every pixel. Only the last frame of each region and
+    size is kept in memory, until the next one is saved. An older frame is matched by its digest, so only if its
+    digest was computed while it was the last one, that is if a frame with the same sample came along meanwhile.
+    """
+    def __init__(self, mode:str, distance:int=0, history:int=8):
+        """
+        Args:
+            mode (str): 'exact' or 'perceptual'. See Options.DEDUPE_MODES.
+            distance (int, optional): In perceptual mode, the number of differing hash bits up to which two frames count as duplicates. Defaults to 0.
+            history (int, optional): Number of recent frames of each region compared against. Defaults to 8.
+        """
+        self.mode = mode
+        self.distance = distance
+        self.history = history
+        # (label, mode, size) -> fingerprints of the recent frames of that region and size
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self.skipped = 0
+
+    def fingerprint(self, image:Image.Image, label:str=None):
+        """Compute what a frame is compared by. Call it outside of any lock, as it does the costly part of the check:
+        in exact mode, the digests of the frame and of the recent frames with the same sample, if there are any.
+        Args:
+            image (Image.Image): A grabbed frame
+            label (str, optional): The region the frame was captured from. Defaults to the main area.
+        Returns:
+            The fingerprint to hand to isDuplicate
+        """
+        if self.mode == 'perceptual':
+            return perceptualHash(image)
+        fingerprint = Fingerprint(sampleHash(image), image)
+        with self._lock:
+            matches = [other for other in self._recent.get((label, image.mode, image.size), ()) if other.sample == fingerprint.sample]
+        if matches:
+            fingerprint.full()
+            for other in matches:
+                other.full()
+        return fingerprint
+
+    def isDuplicate(self, image:Image.Image, label:str=None, fingerprint=None) -> bool:
+        """Check a frame against the recent ones of the same region and size. Frames that are not duplicates are remembered.
+        Args:
+            image (Image.Image): A grabbed frame
+            label (str, optional): The region the frame was captured from. Defaults to the main area.
+            fingerprint (optional): From fingerprint, computed now if not given
+        Returns:
+            bool: True if the frame matches one of the recent frames and should be skipped
+        """
+        if fingerprint is None:
+            fingerprint = self.fingerprint(image, label)
+        key = (label, image.mode, image.size)
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent is None:
+                recent = self._recent[key] = deque(maxlen=self.history)
+                if len(self._recent) > MAX_GROUPS:
+                    self._recent.popitem(last=False)
+            else:
+                self._recent.move_to_end(key)
+            if self.mode == 'perceptual':
+                duplicate = any(bin(fingerprint ^ other).count('1') <= self.distance for other in recent)
+            else:
+                # Usually computed by fingerprint already. A digest that is still missing can only be a frame that
+                # was saved in between, so it is the last one, and its image is still there.
+                matches = [other for other in recent if other.sample == fingerprint.sample]
+                duplicate = bool(matches) and any(other.full() == fingerprint.full() for other in matches)
+            if duplicate:
+                self.skipped += 1
+            else:
+                if self.mode != 'perceptual' and recent:
+                    # Only the last frame keeps its image, for a digest that may still be needed
+                    recent[-1].image = None
+                recent.append(fingerprint)
+            return duplicate
+
+def digest(image:Image.Image) -> bytes:
+    """A digest of every pixel. sha256 is used as it is accelerated by most CPUs, and faster than blake2b there.
+    Returns:
+        bytes: A value that is equal for identical frames, and different for any others in practice
+    """
+    return hashlib.sha256(image.tobytes()).digest()
+
+def sampleHash(image:Image.Image) -> int:
+    """
+    Returns:
+        int: A checksum of a grid of pixels of image, equal for identical frames of the same size. Frames that only
+            differ between the sampled pixels also share it.
+    """
+    size = (min(SAMPLE_SIZE[0], image.width), min(SAMPLE_SIZE[1], image.height))
+    return zlib.crc32(image.resize(size, Image.NEAREST).tobytes())
+
+def perceptualHash(image:Image.Image) -> int:
+    """A 64 bit difference hash: each bit tells whether a cell of a small greyscale thumbnail is brighter than its right neighbour.
+    Args:
+        image (Image.Image): The frame to hash
+    Returns:
+        int: The hash
+    """
+    sampled = image.resize(((HASH_WIDTH + 1) * SAMPLES_PER_CELL, HASH_HEIGHT * SAMPLES_PER_CELL), Image.NEAREST)
+    pixels = sampled.convert('L').resize((HASH_WIDTH + 1, HASH_HEIGHT), Image.BOX).tobytes()
+    hash = 0
+    for row in range(0, len(pixels), HASH_WIDTH + 1):
+        for col in range(row, row + HASH_WIDTH):
+            hash = (hash << 1) | (pixels[col] > pixels[col + 1])
+    return hash
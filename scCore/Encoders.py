@@ -0,0 +1,162 @@
+from abc import ABC, abstractmethod
+import importlib.util
+import logging
+
+logger = logging.getLogger(__name__)
+
+# zlib strategies, as accepted by Pillow's PNG encoder
+PNG_STRATEGIES = {
+    'default': 0,
+    'filtered': 1,
+    'huffman': 2,
+    'rle': 3,
+    'fixed': 4
+}
+
+# Preset name -> (format, compress level, png strategy, quality). None keeps the value from the options.
+PRESETS = {
+    'fastest': ('raw', None, None, None),
+    'fast': ('png', 1, 'rle', None),
+    'balanced': ('png', 6, 'default', None),
+    'smallest': ('png', 9, 'default', None)
+}
+
+# Packages a format needs on top of Pillow
+FORMAT_PACKAGES = {
+    'qoi': ('qoi', 'numpy')
+}
+
+class Encoder(ABC):
+    """Abstract class representing an image file format
+    """
+    suffix = ''
+
+    @abstractmethod
+    def encode(self, image, fp) -> None:
+        """Encode image and write the result to fp
+        Args:
+            image (PIL.Image.Image): An RGB image
+            fp (BinaryIO): Where the encoded image is written
+        """
+        pass
+
+    def encodeRegion(self, image, box:tuple, fp) -> None:
+        """Encode part of image and write the result to fp as it is produced. Formats that can be written a few rows at
+        a time override this, so that large regions are never copied or held in memory whole once encoded.
+        Args:
+            image (PIL.Image.Image): An RGB image
+            box (tuple): (left, upper, right, lower) part of image to encode. None for all of it.
+            fp (BinaryIO): Where the encoded image is written
+        """
+        self.encode(image.crop(box) if box else image, fp)
+
+class PngEncoder(Encoder):
+    """Lossless PNG. Lower compression levels and the rle strategy trade file size for speed.
+    """
+    suffix = '.png'
+
+    def __init__(self, compressLevel:int=6, strategy:str='default'):
+        self.compressLevel = compressLevel
+        self.strategy = strategy
+
+    def encode(self, image, fp) -> None:
+        image.save(fp, 'PNG', compress_level=self.compressLevel, compress_type=PNG_STRATEGIES[self.strategy])
+
+    def encodeRegion(self, image, box:tuple, fp) -> None:
+        if image.mode != 'RGB':
+            return super().encodeRegion(image, box, fp)
+        try:
+            from scCore.StripWriter import writePngStrips
+            writePngStrips(image, box, fp, self.compressLevel, PNG_STRATEGIES[self.strategy])
+        except ImportError:
+            # numpy is needed to filter the rows fast enough
+            super().encodeRegion(image, box, fp)
+
+class WebpEncoder(Encoder):
+    """Lossless WebP. Quality is the compression effort: higher is smaller and slower.
+    """
+    suffix = '.webp'
+
+    def __init__(self, quality:int=90):
+        self.quality = quality
+
+    def encode(self, image, fp) -> None:
+        image.save(fp, 'WEBP', lossless=True, quality=self.quality)
+
+class JpegEncoder(Encoder):
+    """Lossy JPEG. Fast and small, but blurs text and sharp edges.
+    """
+    suffix = '.jpg'
+
+    def __init__(self, quality:int=90):
+        self.quality = quality
+
+    def encode(self, image, fp) -> None:
+        image.save(fp, 'JPEG', quality=self.quality)
+
+class QoiEncoder(Encoder):
+    """Lossless QOI, encoded by the qoi package. Pillow's own QOI encoder is not used, as it is many times slower than
+    PNG, and missing from older versions.
+    """
+    suffix = '.qoi'
+
+    def encode(self, image, fp) -> None:
+        import qoi
+        import numpy
+        fp.write(qoi.encode(numpy.asarray(image)))
+
+class RawEncoder(Encoder):
+    """Uncompressed pixels in a binary PPM file. Nothing to compute, so this is the fastest format, but also the largest.
+    """
+    suffix = '.ppm'
+
+    def encode(self, image, fp) -> None:
+        image.save(fp, 'PPM')
+
+    def encodeRegion(self, image, box:tuple, fp) -> None:
+        if image.mode != 'RGB':
+            return super().encodeRegion(image, box, fp)
+        from scCore.StripWriter import writePpmStrips
+        writePpmStrips(image, box, fp)
+
+FORMATS = ('png', 'webp', 'jpeg', 'qoi', 'raw')
+
+def missingPackages(format:str) -> list:
+    """
+    Returns:
+        list: Names of the packages format needs that can't be imported
+    """
+    return [name for name in FORMAT_PACKAGES.get(format, ()) if importlib.util.find_spec(name) is None]
+
+def createEncoder(format:str, compressLevel:int=6, pngStrategy:str='default', quality:int=90, preset:str='') -> Encoder:
+    """Create the encoder for a format
+    Args:
+        format (str): One of FORMATS
+        compressLevel (int, optional): PNG compression level, from 0 to 9. Defaults to 6.
+        pngStrategy (str, optional): PNG zlib strategy, one of PNG_STRATEGIES. Defaults to 'default'.
+        quality (int, optional): JPEG quality or WebP effort, from 0 to 100. Defaults to 90.
+        preset (str, optional): One of PRESETS. Overrides the other arguments when given. Defaults to ''.
+    Raises:
+        ValueError: If the format or preset is unknown
+    Returns:
+        Encoder: The encoder
+    """
+    if preset:
+        if preset not in PRESETS:
+            raise ValueError(f'Unknown preset: {preset}')
+        presetValues = PRESETS[preset]
+        format = presetValues[0]
+        compressLevel = compressLevel if presetValues[1] is None else presetValues[1]
+        pngStrategy = pngStrategy if presetValues[2] is None else presetValues[2]
+        quality = quality if presetValues[3] is None else presetValues[3]
+    if format == 'png':
+        return PngEncoder(compressLevel, pngStrategy)
+    if format == 'webp':
+        return WebpEncoder(quality)
+    if format == 'jpeg':
+        return JpegEncoder(quality)
+    if format == 'qoi':
+        return QoiEncoder()
+    if format == 'raw':
+        return RawEncoder()
+    raise ValueError(f'Unknown format: {format}')
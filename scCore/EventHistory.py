@@ -0,0 +1,196 @@
+from scCore.Broadcaster import Broadcaster, Subscriber, Subscription, Event, EventType
+from pathlib import Path
+from typing import List, Tuple
+import threading
+import logging
+import json
+import time
+
+logger = logging.getLogger(__name__)
+
+# Events kept by default. About 150 bytes each, text included.
+DEFAULT_CAPACITY = 10000
+# Seconds between two flushes of the event log, while events keep arriving
+FLUSH_INTERVAL = 1
+# Bytes of events buffered by the event log between two flushes
+BUFFER_SIZE = 64 * 1024
+# Undelivered events queued for the event log, more than a GUI needs, as the log keeps the full history
+LOG_QUEUE_SIZE = 20000
+# Seconds waited for the queued events to be written when the event log is closed
+EVENT_LOG_TIMEOUT = 5
+# Events written to the event log as soon as they arrive, rather than at the next flush
+FLUSHED_TYPES = (EventType.FAILURE, EventType.STOP_LISTENING)
+
+class EventRecord(object):
+    """What the history keeps of an event: its time, type and text. Data is dropped, to keep records small.
+    """
+    __slots__ = ('time', 'type', 'text')
+
+    def __init__(self, time:float, type:EventType, text:str):
+        """
+        Args:
+            time (float): Seconds since the epoch
+            type (EventType):
+            text (str):
+        """
+        self.time = time
+        self.type = type
+        self.text = text
+
+class EventHistory(object):
+    """The most recent events, in a ring buffer of fixed capacity: once full, each new event replaces the oldest.
+    Events are numbered in the order they are added, from 0, so that a view can keep its place while old events go.
+    Not thread safe, it is meant to be filled and read on the GUI's main loop.
+    """
+    def __init__(self, capacity:int=DEFAULT_CAPACITY):
+        """
+        Args:
+            capacity (int, optional): Events kept. Defaults to DEFAULT_CAPACITY.
+        """
+        self.capacity = max(1, capacity)
+        self._records = [None] * self.capacity
+        self._count = 0
+        # Number of events ever added, which is also the number of the next one
+        self.total = 0
+
+    def append(self, event:Event) -> None:
+        self._records[self.total % self.capacity] = EventRecord(event.time.timestamp(), event.type, event.text)
+        self.total += 1
+        self._count = min(self._count + 1, self.capacity)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def first(self) -> int:
+        """
+        Returns:
+            int: Number of the oldest event kept. Equal to total when there are none.
+        """
+        return self.total - self._count
+
+    def dropped(self) -> int:
+        """
+        Returns:
+            int: Number of events replaced by newer ones
+        """
+        return self.first()
+
+    def get(self, number:int) -> EventRecord:
+        """
+        Args:
+            number (int): Number of the event, from first() to total - 1
+        Raises:
+            IndexError: If the event was replaced, or hasn't happened yet
+        """
+        if not self.first() <= number < self.total:
+            raise IndexError(f'Event {number} is not in the history ({self.first()} to {self.total - 1})')
+        return self._records[number % self.capacity]
+
+    def records(self, start:int, stop:int) -> List[EventRecord]:
+        """
+        Returns:
+            List[EventRecord]: The events numbered from start to stop, excluded, that are still kept
+        """
+        start = max(start, self.first())
+        stop = min(stop, self.total)
+        return [self._records[number % self.capacity] for number in range(start, stop)]
+
+    def clear(self) -> None:
+        """Forget every event. Numbering carries on.
+        """
+        self._records = [None] * self.capacity
+        self._count = 0
+
+class EventLogWriter(Subscriber):
+    """Appends every event to a file, as one JSON object per line. Subscribe it with its own delivery thread, so
+    that events reach it in batches, and writing never holds up the GUI or the captures. Lines are buffered and
+    flushed at most once per FLUSH_INTERVAL, failures straight away, and the rest on close.
+    """
+    def __init__(self, path:Path, flushInterval:float=FLUSH_INTERVAL):
+        """
+        Args:
+            path (Path): The log file. Appended to if it exists.
+            flushInterval (float, optional): See FLUSH_INTERVAL. Defaults to FLUSH_INTERVAL.
+        Raises:
+            OSError: If the file can't be opened
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8', buffering=BUFFER_SIZE)
+        self._flushInterval = flushInterval
+        self._lastFlush = time.monotonic()
+        self._lock = threading.Lock()
+        self.written = 0
+
+    def trigger(self, event:Event) -> None:
+        self.triggerAll([event])
+
+    def triggerAll(self, events:List[Event]) -> None:
+        lines = ''.join(json.dumps(toJson(event), default=str) + '\n' for event in events)
+        with self._lock:
+            if not self._file:
+                return
+            try:
+                self._file.write(lines)
+                self.written += len(events)
+                now = time.monotonic()
+                if now - self._lastFlush >= self._flushInterval or any(event.type in FLUSHED_TYPES for event in events):
+                    self._file.flush()
+                    self._lastFlush = now
+            except OSError:
+                logger.exception(f'Failed to write to the event log {self.path}')
+
+    def close(self) -> None:
+        """Flush and close the file. Events arriving later are ignored.
+        """
+        with self._lock:
+            if not self._file:
+                return
+            try:
+                self._file.close()
+            except OSError:
+                logger.exception(f'Failed to write to the event log {self.path}')
+            self._file = None
+
+def openEventLog(broadcaster:Broadcaster, path:Path) -> Tuple[Subscription, EventLogWriter]:
+    """Append the events of broadcaster to the event log at path, delivered on a thread of their own
+    Returns:
+        Tuple[Subscription, EventLogWriter]: To hand to closeEventLog
+    Raises:
+        OSError: If the file can't be opened
+    """
+    writer = EventLogWriter(path)
+    return broadcaster.subscribe(writer, maxSize=LOG_QUEUE_SIZE), writer
+
+def closeEventLog(broadcaster:Broadcaster, subscription:Subscription, writer:EventLogWriter) -> None:
+    """Write the events still queued for the event log, and close it
+    """
+    broadcaster.unsubscribe(subscription)
+    subscription.join(EVENT_LOG_TIMEOUT)
+    writer.close()
+    if subscription.dropped:
+        logger.warning(f'{subscription.dropped} events were too many to be written to the event log {writer.path}')
+
+def toJson(event:Event) -> dict:
+    """
+    Returns:
+        dict: The event as written to the event log
+    """
+    record = {'time': event.time.isoformat(timespec='milliseconds'), 'type': event.type.name, 'text': event.text}
+    if event.data:
+        record['data'] = event.data
+    return record
+
+def readEventLog(path:Path) -> List[dict]:
+    """
+    Returns:
+        List[dict]: The events of an event log, oldest first. A last line cut short by a crash is skipped.
+    """
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                logger.warning(f'Ignoring bad line in event log: {line!r}')
+    return events
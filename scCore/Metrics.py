@@ -0,0 +1,145 @@
+from scCore.Broadcaster import Broadcaster, EventType
+from collections import deque
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Stages of a capture, in the order they happen. total is the time from trigger to file on disk. process is the time of
+# all the processing stages, each of which is also recorded under its own name, see Processing.
+STAGES = ('grab', 'queue', 'dedupe', 'name', 'process', 'encode', 'write', 'total')
+DEFAULT_WINDOW = 1000
+
+class RollingHistogram(object):
+    """The distribution of the most recent samples of a measurement
+    """
+    def __init__(self, window:int=DEFAULT_WINDOW):
+        """
+        Args:
+            window (int, optional): Number of samples kept. Older samples are forgotten. Defaults to DEFAULT_WINDOW.
+        """
+        self._samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, value:float) -> None:
+        self._samples.append(value)
+        self.count += 1
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            dict: count (all time), mean, p50, p95, p99 and max of the samples in the window
+        """
+        ordered = sorted(self._samples)
+        if not ordered:
+            return {'count': self.count}
+        def percentile(p):
+            return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+        return {
+            'count': self.count,
+            'mean': sum(ordered) / len(ordered),
+            'p50': percentile(50),
+            'p95': percentile(95),
+            'p99': percentile(99),
+            'max': ordered[-1]
+        }
+
+class Metrics(object):
+    """Times spent in each stage of a capture, in seconds. Safe to record from any thread.
+    """
+    enabled = True
+
+    def __init__(self, window:int=DEFAULT_WINDOW):
+        self._window = window
+        self._histograms = {stage: RollingHistogram(window) for stage in STAGES}
+        self._lock = threading.Lock()
+
+    def record(self, stage:str, seconds:float) -> None:
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = RollingHistogram(self._window)
+            histogram.add(seconds)
+
+    def count(self) -> int:
+        """
+        Returns:
+            int: Number of captures completed
+        """
+        with self._lock:
+            return self._histograms['total'].count
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            dict: Stage -> summary of its histogram, in milliseconds. Stages with no samples are left out.
+        """
+        with self._lock:
+            summaries = {stage: histogram.summary() for stage, histogram in self._histograms.items() if histogram.count}
+        for stats in summaries.values():
+            for key in stats:
+                if key != 'count':
+                    stats[key] *= 1000
+        return summaries
+
+    def summaryLine(self) -> str:
+        """
+        Returns:
+            str: The median time of each stage on a single line
+        """
+        summary = self.summary()
+        if not summary:
+            return 'No screenshots yet'
+        return ' | '.join(f"{stage} {stats['p50']:.1f}" for stage, stats in summary.items()) + ' ms (median)'
+
+    def summaryTable(self) -> str:
+        """
+        Returns:
+            str: A table with the distribution of each stage, one stage per line
+        """
+        summary = self.summary()
+        if not summary:
+            return 'No screenshots were taken'
+        lines = [f"{'stage':>10} {'count':>7} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)"]
+        for stage, stats in summary.items():
+            lines.append(f"{stage:>10} {stats['count']:>7} {stats['mean']:8.1f} {stats['p50']:8.1f} {stats['p95']:8.1f} {stats['p99']:8.1f} {stats['max']:8.1f}")
+        return '\n'.join(lines)
+
+class NullMetrics(Metrics):
+    """Used when metrics are disabled. Records nothing.
+    """
+    enabled = False
+
+    def __init__(self):
+        super().__init__(1)
+
+    def record(self, stage:str, seconds:float) -> None:
+        pass
+
+class MetricsReporter(object):
+    """Broadcasts a METRICS event at a regular interval, while new captures are completed
+    """
+    def __init__(self, metrics:Metrics, broadcaster:Broadcaster, interval:float):
+        self._metrics = metrics
+        self._broadcaster = broadcaster
+        self._interval = interval
+        self._lastCount = 0
+        self._stopEvent = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='MetricsReporter', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopEvent.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopEvent.wait(self._interval):
+            count = self._metrics.count()
+            if count == self._lastCount:
+                continue
+            self._lastCount = count
+            line = self._metrics.summaryLine()
+            logger.info(line)
+            self._broadcaster.report(EventType.METRICS, line, self._metrics.summary())
@@ -0,0 +1,257 @@
+from scCore.Broadcaster import Broadcaster, EventType
+from scCore.ScreenshotNamer import ScreenShotNamer
+from scCore.Metrics import Metrics, NullMetrics
+from collections import deque
+from pathlib import Path
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Copies waiting to be written to a mirror at most. Past this, the oldest is dropped, so that a slow or offline folder
+# can't take up more and more memory.
+MAX_PENDING = 32
+# Seconds between two reports of failed copies
+REPORT_INTERVAL = 1
+# Seconds stop waits for the waiting copies to be written
+DRAIN_TIMEOUT = 10
+
+class MirrorJob(object):
+    """A screenshot to copy to a mirror. Queued in capture order before the screenshot is encoded, so that copies are
+    named in the same order as the screenshots, and given the encoded bytes once they are ready.
+    """
+    def __init__(self, burstId:int=None, burstIdx:int=None, label:str=None, suffix:str=None):
+        self.burstId = burstId
+        self.burstIdx = burstIdx
+        self.label = label
+        self.suffix = suffix
+        self.data = None
+        self._ready = threading.Event()
+
+    def resolve(self, data:bytes=None) -> None:
+        """Hand over the encoded screenshot. Only the first call counts.
+        Args:
+            data (bytes, optional): The file contents, or None if the screenshot wasn't saved and nothing is copied
+        """
+        if not self._ready.is_set():
+            self.data = data
+            self._ready.set()
+
+    def wait(self) -> bytes:
+        """
+        Returns:
+            bytes: The file contents, or None if there is nothing to copy
+        """
+        self._ready.wait()
+        return self.data
+
+class MirrorWriter(object):
+    """Writes copies of the screenshots to another folder, on a thread of its own, so that a slow or offline folder
+    never delays the capture workers or the other folders. The screenshots are encoded once by the pipeline, and the
+    copies are named by the mirror's own namers, so each folder has its own numbering.
+    Failed copies are not retried. They are counted, and reported at most once per REPORT_INTERVAL.
+    """
+    def __init__(self, folder:Path, broadcaster:Broadcaster, sidecar:bool=False, metrics:Metrics=NullMetrics(), maxPending:int=MAX_PENDING):
+        """
+        Args:
+            folder (Path): The folder copies are written to. Created when the mirror starts.
+            broadcaster (Broadcaster): Informed of failed copies
+            sidecar (bool, optional): See ScreenShotNamer. Defaults to False.
+            metrics (Metrics, optional): Records the time to write each copy, as 'copy'. Defaults to recording nothing.
+            maxPending (int, optional): See MAX_PENDING. Defaults to MAX_PENDING.
+        """
+        self.folder = folder
+        self.broadcaster = broadcaster
+        self.sidecar = sidecar
+        self.metrics = metrics
+        self.maxPending = maxPending
+        # Suffix and sidecar -> namer. Only used by the mirror's thread, and closed when it exits.
+        self._namers = {}
+        self._pending = deque()
+        self._condition = threading.Condition()
+        # Set once no more copies are queued. The thread then writes the waiting copies and exits.
+        self._finishing = False
+        # True from start until the thread has no copies left and exits. Stays True while it is stuck after stop.
+        self._running = False
+        self._thread = None
+        self._writing = False
+        self._failing = False
+        self._lastReport = 0
+        self._reportedFailed = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        """Start writing copies. Does not block. A stopped mirror can be started again.
+        """
+        with self._condition:
+            self._finishing = False
+            if self._running:
+                # Only one thread writes to the folder: the one stop gave up on carries on with the new copies once unstuck
+                logger.warning(f'Still writing a copy to {self.folder} from before the last stop')
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name=f'MirrorWriter-{self.folder.name}', daemon=True)
+        self._thread.start()
+
+    def finish(self) -> None:
+        """Stop taking copies. The waiting copies are still written, in the background. Does not block.
+        """
+        with self._condition:
+            self._finishing = True
+            self._condition.notify_all()
+
+    def stop(self, timeout:float=DRAIN_TIMEOUT) -> int:
+        """Wait for the waiting copies to be written, up to timeout seconds, then stop
+        Returns:
+            int: Number of copies that were not written in time, and are dropped
+        """
+        self.finish()
+        if self._thread:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                # Stuck writing to the folder. The thread is left to finish on its own, and kept to be waited for by
+                # the next stop if the mirror is started again meanwhile.
+                logger.warning(f'Gave up waiting for copies to {self.folder}')
+            else:
+                self._thread = None
+        with self._condition:
+            left = len(self._pending) + (1 if self._writing else 0)
+            self._pending.clear()
+        if left:
+            self.report(EventType.FAILURE, f'{left} screenshots could not be copied to {self.folder} in time')
+        self._reportFailures(force=True)
+        return left
+
+    def reserve(self, burstId:int=None, burstIdx:int=None, label:str=None, suffix:str=None) -> MirrorJob:
+        """Queue a copy of a screenshot that is about to be encoded. Does not block. If MAX_PENDING copies are already
+        waiting, the oldest of them is dropped.
+        Args:
+            burstId (int, optional): See ScreenShotNamer.nextFreePath
+            burstIdx (int, optional): See ScreenShotNamer.nextFreePath
+            label (str, optional): See ScreenShotNamer.nextFreePath
+            suffix (str, optional): Extension of the file, matching the encoder
+        Returns:
+            MirrorJob: To resolve with the encoded screenshot
+        """
+        job = MirrorJob(burstId, burstIdx, label, suffix)
+        with self._condition:
+            if self._finishing:
+                return job
+            dropped = self._pending.popleft() if len(self._pending) >= self.maxPending else None
+            self._pending.append(job)
+            self._condition.notify_all()
+        if dropped:
+            self.dropped += 1
+            self._failed(f'Screenshot not copied to {self.folder}, {self.maxPending} copies already waiting')
+        return job
+
+    def pendingCount(self) -> int:
+        with self._condition:
+            return len(self._pending) + (1 if self._writing else 0)
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            dict: Copies written, failed (dropped ones included) and waiting
+        """
+        return {'written': self.written, 'failed': self.failed, 'pending': self.pendingCount()}
+
+    def _run(self) -> None:
+        """Writer loop: write the copies in the order they were queued, until finishing and none are left
+        """
+        try:
+            self.folder.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            # Reported, and tried again by each copy
+            self.report(EventType.FAILURE, f'Failed to create {self.folder}: {e}')
+        while True:
+            with self._condition:
+                while not self._pending and not self._finishing:
+                    self._condition.wait()
+                if not self._pending:
+                    self._running = False
+                    # Taken, so that a thread started meanwhile names its copies with namers of its own
+                    namers, self._namers = self._namers, {}
+                    break
+                job = self._pending.popleft()
+                self._writing = True
+            try:
+                data = job.wait()
+                if data is not None:
+                    self._write(job, data)
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+        for namer in namers.values():
+            namer.close()
+
+    def _write(self, job:MirrorJob, data:bytes) -> None:
+        start = time.perf_counter()
+        path = None
+        try:
+            if self._failing:
+                # The folder may be back, or may not have been created
+                self.folder.mkdir(parents=True, exist_ok=True)
+            path = self._namer(job.suffix).nextFreePath(job.burstId, job.burstIdx, job.label)
+            with open(path, 'wb') as f:
+                f.write(data)
+        except Exception as e:
+            # Logged quietly, as the failures of an offline folder are reported together
+            logger.info(f'Failed to copy screenshot to {self.folder}: {e}')
+            if path:
+                path.unlink(missing_ok=True)
+            self._failed(f'Failed to copy screenshot to {self.folder}: {e}')
+            return
+        self.metrics.record('copy', time.perf_counter() - start)
+        self.written += 1
+        logger.info(f'Screenshot copied to {path}')
+        if self._failing:
+            self._failing = False
+            self.report(EventType.SCREENSHOT, f'Copying screenshots to {self.folder} again')
+
+    def _namer(self, suffix:str) -> ScreenShotNamer:
+        key = (suffix, self.sidecar)
+        namer = self._namers.get(key)
+        if namer is None:
+            namer = self._namers[key] = ScreenShotNamer(self.folder, suffix, self.sidecar)
+        return namer
+
+    def _failed(self, text:str) -> None:
+        with self._condition:
+            self.failed += 1
+            self._failing = True
+        self._reportFailures(text)
+
+    def _reportFailures(self, text:str=None, force:bool=False) -> None:
+        """Broadcast the failed copies if there are new ones, at most once per REPORT_INTERVAL unless forced
+        """
+        now = time.monotonic()
+        with self._condition:
+            if self.failed == self._reportedFailed or (not force and now - self._lastReport < REPORT_INTERVAL):
+                return
+            self._lastReport = now
+            self._reportedFailed = failed = self.failed
+        self.report(EventType.FAILURE, f'{text or "Screenshots not copied"} ({failed} not copied to {self.folder} in total)', {'folder': str(self.folder), 'failed': failed})
+
+    def report(self, eventType:EventType, text:str, data:dict=None) -> None:
+        logger.warning(text)
+        self.broadcaster.report(eventType, text=text, data=data)
+
+def stopMirrors(mirrors:list, timeout:float=DRAIN_TIMEOUT) -> int:
+    """Stop several mirrors. They are finished together, so that the copies to every folder are written at the same
+    time, and given timeout seconds in total, so that several offline folders don't each hold up the stop.
+    Args:
+        mirrors (list): MirrorWriters
+        timeout (float, optional): Seconds to wait for all of them. Defaults to DRAIN_TIMEOUT.
+    Returns:
+        int: Number of copies that were not written in time, and are dropped
+    """
+    mirrors = list(mirrors)
+    for mirror in mirrors:
+        mirror.finish()
+    deadline = time.monotonic() + timeout
+    return sum(mirror.stop(max(0, deadline - time.monotonic())) for mirror in mirrors)
@@ -0,0 +1,126 @@
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds after which the layout is read again in the background, to notice monitors being added, removed or moved
+LAYOUT_MAX_AGE = 5
+
+class MonitorLayout(object):
+    """The rectangles of the monitors, read once and cached. Rectangles are (x offset, y offset, width, height) tuples
+    measured from the top left of the capturable area, like regions.
+    The cached layout is used straight away. Once it is older than maxAge, it is read again on a background thread,
+    so that grabs never wait for it.
+    """
+    def __init__(self, reader, maxAge:float=LAYOUT_MAX_AGE):
+        """
+        Args:
+            reader (Callable): Returns the position of the capturable area on the platform's virtual desktop as an
+                (x, y) tuple, and the list of monitor rectangles
+            maxAge (float, optional): Seconds the layout is used before being read again. Defaults to LAYOUT_MAX_AGE.
+        """
+        self._reader = reader
+        self.maxAge = maxAge
+        self._lock = threading.Lock()
+        self._origin = None
+        self._monitors = None
+        self._readTime = 0
+        self._refreshing = False
+
+    def origin(self) -> tuple:
+        """
+        Returns:
+            tuple: (x, y) position of the top left of the capturable area on the platform's virtual desktop
+        """
+        self._ensureFresh()
+        return self._origin
+
+    def monitors(self) -> list:
+        """
+        Returns:
+            list: The monitor rectangles
+        """
+        self._ensureFresh()
+        return self._monitors
+
+    def refresh(self) -> bool:
+        """Read the layout now
+        Returns:
+            bool: True if the layout changed
+        """
+        origin, monitors = self._reader()
+        monitors = list(dict.fromkeys(tuple(monitor) for monitor in monitors))
+        with self._lock:
+            changed = self._monitors is not None and (origin, monitors) != (self._origin, self._monitors)
+            self._origin = tuple(origin)
+            self._monitors = monitors
+            self._readTime = time.monotonic()
+        if changed:
+            logger.warning(f'Monitor layout changed: {monitors}')
+        return changed
+
+    def split(self, region:tuple) -> list:
+        """
+        Args:
+            region (tuple): (x offset, y offset, width, height)
+        Returns:
+            list: The parts of region on each monitor it intersects, as rectangles. Empty if it is outside every monitor.
+        """
+        parts = []
+        for monitor in self.monitors():
+            part = intersection(region, monitor)
+            if part:
+                parts.append(part)
+        return parts
+
+    def check(self, region:tuple, name:str='Area') -> None:
+        """
+        Raises:
+            ValueError: If region is outside every monitor
+        """
+        if not self.split(region):
+            x, y, width, height = region
+            raise ValueError(f'{name} ({x}, {y}, {width}x{height}) is outside every monitor. Monitors: ' + ', '.join(f'({mx}, {my}, {mw}x{mh})' for mx, my, mw, mh in self.monitors()))
+
+    def _ensureFresh(self) -> None:
+        if self._monitors is None:
+            self.refresh()
+            return
+        with self._lock:
+            if self._refreshing or time.monotonic() - self._readTime < self.maxAge:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refreshInBackground, name='MonitorLayout', daemon=True).start()
+
+    def _refreshInBackground(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception('Failed to read the monitor layout')
+        finally:
+            with self._lock:
+                self._refreshing = False
+                self._readTime = time.monotonic()
+
+def intersection(first:tuple, second:tuple) -> tuple:
+    """
+    Returns:
+        tuple: The rectangle covered by both rectangles, or None if they don't overlap
+    """
+    left = max(first[0], second[0])
+    top = max(first[1], second[1])
+    right = min(first[0] + first[2], second[0] + second[2])
+    bottom = min(first[1] + first[3], second[1] + second[3])
+    if right <= left or bottom <= top:
+        return None
+    return (left, top, right - left, bottom - top)
+
+def covers(parts:list, region:tuple) -> bool:
+    """
+    Args:
+        parts (list): Rectangles inside region which don't overlap, as returned by MonitorLayout.split
+    Returns:
+        bool: True if the parts cover all of region, so that it can be grabbed in one go
+    """
+    return sum(width * height for _, _, width, height in parts) == region[2] * region[3]
@@ -1,6 +1,11 @@
+from scCore.Encoders import FORMATS, PNG_STRATEGIES, PRESETS, missingPackages
+from scCore.Processing import createChain
 from pathlib import Path
 import logging
 import json
+import copy
+import os
+import re
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +19,54 @@ DEFAULT_Y=0
 DEFAULT_W=1920
 DEFAULT_H=1080
 DEFAULT_PATH='./Screenshots'
+DEFAULT_WORKERS=2
+DEFAULT_WORKER_TYPE='thread'
+DEFAULT_QUEUE_SIZE=8
+DEFAULT_BACKPRESSURE='block'
+DEFAULT_BACKEND='auto'
+DEFAULT_BURST_FPS=0
+DEFAULT_BURST_KEY=''
+DEFAULT_REPLAY_SECONDS=0
+DEFAULT_REPLAY_FPS=10
+DEFAULT_REPLAY_MEMORY=512
+DEFAULT_FORMAT='png'
+DEFAULT_COMPRESS_LEVEL=6
+DEFAULT_PNG_STRATEGY='default'
+DEFAULT_QUALITY=90
+DEFAULT_PRESET=''
+DEFAULT_INDEX_FILE=False
+DEFAULT_STATS=False
+DEFAULT_STATS_INTERVAL=5
+DEFAULT_WATCH_THRESHOLD=0
+DEFAULT_WATCH_RATE=2
+DEFAULT_WATCH_COOLDOWN=2
+DEFAULT_DEDUPE='off'
+DEFAULT_DEDUPE_DISTANCE=0
+DEFAULT_DEDUPE_HISTORY=8
+DEFAULT_REGIONS=()
+DEFAULT_PREWARM=True
+DEFAULT_SPOOL_PATH=''
+DEFAULT_SPOOL_MOVERS=2
+DEFAULT_CONTROL_PORT=0
+DEFAULT_RELOAD_OPTIONS=True
+DEFAULT_MIN_INTERVAL=0
+DEFAULT_CAPTURE_RATE=0
+DEFAULT_CAPTURE_BUCKET=0
+DEFAULT_OUTPUT='files'
+DEFAULT_KEYFRAME_INTERVAL=30
+DEFAULT_CATALOG=False
+DEFAULT_STAGES=()
+DEFAULT_EVENT_LOG=''
+
+WORKER_TYPES = ('thread', 'process')
+BACKPRESSURE_POLICIES = ('block', 'drop-oldest', 'drop-newest')
+BACKENDS = ('auto', 'mss', 'pyautogui', 'synthetic')
+# off: keep every screenshot. exact: skip screenshots identical to a recent one. perceptual: skip screenshots that look the same as a recent one.
+DEDUPE_MODES = ('off', 'exact', 'perceptual')
+# files: one file per screenshot. archive: a single session archive per listening session, see SessionArchive.
+OUTPUTS = ('files', 'archive')
+# Region names end up in file names, so they are kept simple
+REGION_NAME_REGEX = re.compile(r'[A-Za-z][\w-]*')
 
 X_OFFSET_KEY    = 'xOffset'
 Y_OFFSET_KEY    = 'yOffset'
@@ -21,23 +74,207 @@ WIDTH_KEY       = 'width'
 HEIGHT_KEY      = 'height'
 PATH_KEY        = 'path'
 LOG_LEVEL_KEY   = 'logLevel'
+WORKERS_KEY     = 'workers'
+WORKER_TYPE_KEY = 'workerType'
+QUEUE_SIZE_KEY  = 'queueSize'
+BACKPRESSURE_KEY = 'backpressure'
+BACKEND_KEY     = 'backend'
+BURST_FPS_KEY   = 'burstFps'
+BURST_KEY_KEY   = 'burstKey'
+REPLAY_SECONDS_KEY = 'replaySeconds'
+REPLAY_FPS_KEY  = 'replayFps'
+REPLAY_MEMORY_KEY = 'replayMemory'
+FORMAT_KEY      = 'format'
+COMPRESS_LEVEL_KEY = 'compressLevel'
+PNG_STRATEGY_KEY = 'pngStrategy'
+QUALITY_KEY     = 'quality'
+PRESET_KEY      = 'preset'
+INDEX_FILE_KEY  = 'indexFile'
+STATS_KEY       = 'stats'
+STATS_INTERVAL_KEY = 'statsInterval'
+WATCH_THRESHOLD_KEY = 'watchThreshold'
+WATCH_RATE_KEY  = 'watchRate'
+WATCH_COOLDOWN_KEY = 'watchCooldown'
+DEDUPE_KEY      = 'dedupe'
+DEDUPE_DISTANCE_KEY = 'dedupeDistance'
+DEDUPE_HISTORY_KEY = 'dedupeHistory'
+REGIONS_KEY     = 'regions'
+PREWARM_KEY     = 'prewarm'
+SPOOL_PATH_KEY  = 'spoolPath'
+SPOOL_MOVERS_KEY = 'spoolMovers'
+CONTROL_PORT_KEY = 'controlPort'
+RELOAD_OPTIONS_KEY = 'reloadOptions'
+MIN_INTERVAL_KEY = 'minInterval'
+CAPTURE_RATE_KEY = 'captureRate'
+CAPTURE_BUCKET_KEY = 'captureBucket'
+OUTPUT_KEY      = 'output'
+KEYFRAME_INTERVAL_KEY = 'keyframeInterval'
+CATALOG_KEY     = 'catalog'
+STAGES_KEY      = 'stages'
+EVENT_LOG_KEY   = 'eventLog'
+REGION_NAME_KEY = 'name'
+REGION_HOTKEY_KEY = 'hotkey'
+
+class Region(object):
+    """ A named part of the screen, captured to its own file
+    """
+    def __init__(self, name:str, xOffset:int, yOffset:int, width:int, height:int, hotkey:str=''):
+        """
+        Args:
+            name (str): Appears in the names of the region's screenshots
+            hotkey (str, optional): The key that captures this region. Regions without one are captured by F12. Defaults to ''.
+        """
+        self.name = name
+        self.xOffset = int(xOffset)
+        self.yOffset = int(yOffset)
+        self.width = int(width)
+        self.height = int(height)
+        self.hotkey = hotkey.lower() if hotkey else ''
+
+    def box(self) -> tuple:
+        return (self.xOffset, self.yOffset, self.width, self.height)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Region) and (self.name, self.box(), self.hotkey) == (other.name, other.box(), other.hotkey)
+
+    def toString(self) -> str:
+        return f'{self.name} ({self.xOffset}, {self.yOffset}, {self.width}x{self.height}' + (f', key {self.hotkey})' if self.hotkey else ')')
 
 class Options(object):  
     """ Hold program options
     """      
-    def __init__(self, path:str, xOffset:int, yOffset:int, width:int, height:int, logLevel:str):
+    def __init__(self, path, xOffset:int, yOffset:int, width:int, height:int, logLevel:str, 
+                 workers:int=DEFAULT_WORKERS, workerType:str=DEFAULT_WORKER_TYPE, queueSize:int=DEFAULT_QUEUE_SIZE, backpressure:str=DEFAULT_BACKPRESSURE,
+                 backend:str=DEFAULT_BACKEND, burstFps:float=DEFAULT_BURST_FPS, burstKey:str=DEFAULT_BURST_KEY,
+                 replaySeconds:float=DEFAULT_REPLAY_SECONDS, replayFps:float=DEFAULT_REPLAY_FPS, replayMemory:int=DEFAULT_REPLAY_MEMORY,
+                 format:str=DEFAULT_FORMAT, compressLevel:int=DEFAULT_COMPRESS_LEVEL, pngStrategy:str=DEFAULT_PNG_STRATEGY, quality:int=DEFAULT_QUALITY, preset:str=DEFAULT_PRESET,
+                 indexFile:bool=DEFAULT_INDEX_FILE, stats:bool=DEFAULT_STATS, statsInterval:float=DEFAULT_STATS_INTERVAL,
+                 watchThreshold:float=DEFAULT_WATCH_THRESHOLD, watchRate:float=DEFAULT_WATCH_RATE, watchCooldown:float=DEFAULT_WATCH_COOLDOWN,
+                 dedupe:str=DEFAULT_DEDUPE, dedupeDistance:int=DEFAULT_DEDUPE_DISTANCE, dedupeHistory:int=DEFAULT_DEDUPE_HISTORY,
+                 regions:list=DEFAULT_REGIONS, prewarm:bool=DEFAULT_PREWARM,
+                 spoolPath:str=DEFAULT_SPOOL_PATH, spoolMovers:int=DEFAULT_SPOOL_MOVERS, controlPort:int=DEFAULT_CONTROL_PORT,
+                 reloadOptions:bool=DEFAULT_RELOAD_OPTIONS, minInterval:float=DEFAULT_MIN_INTERVAL, captureRate:float=DEFAULT_CAPTURE_RATE, captureBucket:int=DEFAULT_CAPTURE_BUCKET,
+                 output:str=DEFAULT_OUTPUT, keyframeInterval:int=DEFAULT_KEYFRAME_INTERVAL, catalog:bool=DEFAULT_CATALOG,
+                 stages:list=DEFAULT_STAGES, eventLog:str=DEFAULT_EVENT_LOG):
         self.xOffset = int(xOffset)
         self.yOffset = int(yOffset)
         self.width = int(width)
         self.height = int(height)
-        self.path = Path(path)
+        # A single folder, or a list of them. Screenshots are saved to the first, and copied to the others, see MirrorWriter.
+        paths = [path] if isinstance(path, (str, Path)) else list(path)
+        if not paths:
+            raise ValueError('At least one screenshot folder is needed')
+        self.path = Path(paths[0])
+        self.mirrorPaths = [Path(mirror) for mirror in paths[1:]]
         self.logLevel = logLevel.upper()
+        self.workers = int(workers)
+        self.workerType = workerType.lower()
+        self.queueSize = int(queueSize)
+        self.backpressure = backpressure.lower()
+        self.backend = backend.lower()
+        self.burstFps = float(burstFps)
+        self.burstKey = burstKey.lower() if burstKey else ''
+        self.replaySeconds = float(replaySeconds)
+        self.replayFps = float(replayFps)
+        # In megabytes
+        self.replayMemory = int(replayMemory)
+        self.format = format.lower()
+        self.compressLevel = int(compressLevel)
+        self.pngStrategy = pngStrategy.lower()
+        self.quality = int(quality)
+        self.preset = preset.lower() if preset else ''
+        self.indexFile = bool(indexFile)
+        self.stats = bool(stats)
+        self.statsInterval = float(statsInterval)
+        self.watchThreshold = float(watchThreshold)
+        self.watchRate = float(watchRate)
+        self.watchCooldown = float(watchCooldown)
+        self.dedupe = dedupe
+        self.dedupeDistance = int(dedupeDistance)
+        self.dedupeHistory = int(dedupeHistory)
+        # Named regions captured instead of the main one. See Region.
+        self.regions = list(regions)
+        # Initialise the backend, encoder and namer when listening starts, rather than on the first screenshot
+        self.prewarm = bool(prewarm)
+        # Local folder screenshots are written to before being moved to path. Empty to write to path directly.
+        self.spoolPath = Path(spoolPath) if spoolPath else None
+        self.spoolMovers = int(spoolMovers)
+        # Port of the local control server, see ControlServer. 0 disables it.
+        self.controlPort = int(controlPort)
+        # Apply changes made to the options file while listening
+        self.reloadOptions = bool(reloadOptions)
+        # Limits on the captures triggered by keys, see CaptureTrigger. Seconds between two captures of the same key,
+        # captures per second on average (0 for no limit), and captures allowed in quick succession.
+        self.minInterval = float(minInterval)
+        self.captureRate = float(captureRate)
+        self.captureBucket = int(captureBucket)
+        # Where screenshots go, see OUTPUTS, and the most screenshots of a region an archive stores between two keyframes
+        self.output = output.lower()
+        self.keyframeInterval = int(keyframeInterval)
+        # Add saved screenshots to the catalog of their folder, see Catalog
+        self.catalog = bool(catalog)
+        # Processing applied to each screenshot before it is saved, in order, as dicts. See Processing.
+        self.stages = [dict(stage) for stage in stages]
+        # File every event is appended to, as JSON lines, see EventLogWriter. Empty to keep no event log.
+        self.eventLog = Path(eventLog) if eventLog else None
         
     def region(self) -> tuple:
         return (self.xOffset, self.yOffset, self.width, self.height)
+
+    def paths(self) -> list:
+        """
+        Returns:
+            list: Every folder screenshots are written to, the main one first
+        """
+        return [self.path] + self.mirrorPaths
+        
+    def copy(self):
+        """
+        Returns:
+            Options: A copy that can be changed without changing these options
+        """
+        options = copy.copy(self)
+        options.regions = list(self.regions)
+        options.mirrorPaths = list(self.mirrorPaths)
+        options.stages = [dict(stage) for stage in self.stages]
+        return options
         
     def toString(self) -> str:
-        return 'Folder path: '+ str(self.path) +', X Offset: ' + str(self.xOffset) + ', Y Offset: ' + str(self.yOffset) + ', width: ' + str(self.width) + ', height: ' + str(self.height) 
+        parts = [
+            f"Folder path: {', '.join(str(path) for path in self.paths())}",
+            f'X Offset: {self.xOffset}',
+            f'Y Offset: {self.yOffset}',
+            f'width: {self.width}',
+            f'height: {self.height}',
+            f'workers: {self.workers} {self.workerType}',
+            f'queue size: {self.queueSize}',
+            f'backpressure: {self.backpressure}',
+            f'backend: {self.backend}',
+            f'burst fps: {self.burstFps}',
+            f"burst key: {self.burstKey or 'none'}",
+            f'replay: {self.replaySeconds}s at {self.replayFps} fps, max {self.replayMemory} MB',
+            f'format: {self.format}',
+            f'compress level: {self.compressLevel}',
+            f'png strategy: {self.pngStrategy}',
+            f'quality: {self.quality}',
+            f"preset: {self.preset or 'none'}",
+            f'index file: {self.indexFile}',
+            f'stats: {self.stats} every {self.statsInterval}s',
+            f'watch threshold: {self.watchThreshold} at {self.watchRate} Hz, cooldown {self.watchCooldown}s',
+            f'dedupe: {self.dedupe} (distance {self.dedupeDistance}, history {self.dedupeHistory})',
+            f"regions: {', '.join(region.toString() for region in self.regions) or 'none'}",
+            f'prewarm: {self.prewarm}',
+            f"spool: {f'{self.spoolPath} with {self.spoolMovers} movers' if self.spoolPath else 'none'}",
+            f"control port: {self.controlPort or 'none'}",
+            f'reload options: {self.reloadOptions}',
+            f'min interval: {self.minInterval}s',
+            f"capture rate: {f'{self.captureRate}/s, bucket {self.captureBucket}' if self.captureRate else 'unlimited'}",
+            f'output: {self.output}' + (f' (keyframe every {self.keyframeInterval})' if self.output == 'archive' else ''),
+            f'catalog: {self.catalog}',
+            f"stages: {' > '.join(str(stage.get('stage')) for stage in self.stages) or 'none'}",
+            f"event log: {self.eventLog or 'none'}",
+            ]
+        return ', '.join(parts)
     
 # Functions for managing options
 
@@ -49,14 +286,108 @@ def toOptions(optsAsJson) -> Options:
         Options: The options contained in the json
     """
     return Options(
-        optsAsJson[PATH_KEY], 
-        optsAsJson[X_OFFSET_KEY], 
-        optsAsJson[Y_OFFSET_KEY], 
-        optsAsJson[WIDTH_KEY], 
-        optsAsJson[HEIGHT_KEY], 
-        optsAsJson[LOG_LEVEL_KEY]
+        path=optsAsJson[PATH_KEY],
+        xOffset=optsAsJson[X_OFFSET_KEY],
+        yOffset=optsAsJson[Y_OFFSET_KEY],
+        width=optsAsJson[WIDTH_KEY],
+        height=optsAsJson[HEIGHT_KEY],
+        logLevel=optsAsJson[LOG_LEVEL_KEY],
+        workers=optsAsJson.get(WORKERS_KEY, DEFAULT_WORKERS),
+        workerType=optsAsJson.get(WORKER_TYPE_KEY, DEFAULT_WORKER_TYPE),
+        queueSize=optsAsJson.get(QUEUE_SIZE_KEY, DEFAULT_QUEUE_SIZE),
+        backpressure=optsAsJson.get(BACKPRESSURE_KEY, DEFAULT_BACKPRESSURE),
+        backend=optsAsJson.get(BACKEND_KEY, DEFAULT_BACKEND),
+        burstFps=optsAsJson.get(BURST_FPS_KEY, DEFAULT_BURST_FPS),
+        burstKey=optsAsJson.get(BURST_KEY_KEY, DEFAULT_BURST_KEY),
+        replaySeconds=optsAsJson.get(REPLAY_SECONDS_KEY, DEFAULT_REPLAY_SECONDS),
+        replayFps=optsAsJson.get(REPLAY_FPS_KEY, DEFAULT_REPLAY_FPS),
+        replayMemory=optsAsJson.get(REPLAY_MEMORY_KEY, DEFAULT_REPLAY_MEMORY),
+        format=optsAsJson.get(FORMAT_KEY, DEFAULT_FORMAT),
+        compressLevel=optsAsJson.get(COMPRESS_LEVEL_KEY, DEFAULT_COMPRESS_LEVEL),
+        pngStrategy=optsAsJson.get(PNG_STRATEGY_KEY, DEFAULT_PNG_STRATEGY),
+        quality=optsAsJson.get(QUALITY_KEY, DEFAULT_QUALITY),
+        preset=optsAsJson.get(PRESET_KEY, DEFAULT_PRESET),
+        indexFile=optsAsJson.get(INDEX_FILE_KEY, DEFAULT_INDEX_FILE),
+        stats=optsAsJson.get(STATS_KEY, DEFAULT_STATS),
+        statsInterval=optsAsJson.get(STATS_INTERVAL_KEY, DEFAULT_STATS_INTERVAL),
+        watchThreshold=optsAsJson.get(WATCH_THRESHOLD_KEY, DEFAULT_WATCH_THRESHOLD),
+        watchRate=optsAsJson.get(WATCH_RATE_KEY, DEFAULT_WATCH_RATE),
+        watchCooldown=optsAsJson.get(WATCH_COOLDOWN_KEY, DEFAULT_WATCH_COOLDOWN),
+        dedupe=optsAsJson.get(DEDUPE_KEY, DEFAULT_DEDUPE),
+        dedupeDistance=optsAsJson.get(DEDUPE_DISTANCE_KEY, DEFAULT_DEDUPE_DISTANCE),
+        dedupeHistory=optsAsJson.get(DEDUPE_HISTORY_KEY, DEFAULT_DEDUPE_HISTORY),
+        regions=[toRegion(regionAsJson) for regionAsJson in optsAsJson.get(REGIONS_KEY, DEFAULT_REGIONS)],
+        prewarm=optsAsJson.get(PREWARM_KEY, DEFAULT_PREWARM),
+        spoolPath=optsAsJson.get(SPOOL_PATH_KEY, DEFAULT_SPOOL_PATH),
+        spoolMovers=optsAsJson.get(SPOOL_MOVERS_KEY, DEFAULT_SPOOL_MOVERS),
+        controlPort=optsAsJson.get(CONTROL_PORT_KEY, DEFAULT_CONTROL_PORT),
+        reloadOptions=optsAsJson.get(RELOAD_OPTIONS_KEY, DEFAULT_RELOAD_OPTIONS),
+        minInterval=optsAsJson.get(MIN_INTERVAL_KEY, DEFAULT_MIN_INTERVAL),
+        captureRate=optsAsJson.get(CAPTURE_RATE_KEY, DEFAULT_CAPTURE_RATE),
+        captureBucket=optsAsJson.get(CAPTURE_BUCKET_KEY, DEFAULT_CAPTURE_BUCKET),
+        output=optsAsJson.get(OUTPUT_KEY, DEFAULT_OUTPUT),
+        keyframeInterval=optsAsJson.get(KEYFRAME_INTERVAL_KEY, DEFAULT_KEYFRAME_INTERVAL),
+        catalog=optsAsJson.get(CATALOG_KEY, DEFAULT_CATALOG),
+        stages=optsAsJson.get(STAGES_KEY, DEFAULT_STAGES),
+        eventLog=optsAsJson.get(EVENT_LOG_KEY, DEFAULT_EVENT_LOG)
+        )
+
+def toRegion(regionAsJson) -> Region:
+    """Convert a json object into a Region
+    """
+    return Region(
+        regionAsJson[REGION_NAME_KEY],
+        regionAsJson[X_OFFSET_KEY],
+        regionAsJson[Y_OFFSET_KEY],
+        regionAsJson[WIDTH_KEY],
+        regionAsJson[HEIGHT_KEY],
+        regionAsJson.get(REGION_HOTKEY_KEY, '')
         )
 
+def fromRegion(region:Region) -> dict:
+    """Convert a Region into a json object
+    """
+    return {
+        REGION_NAME_KEY: region.name,
+        X_OFFSET_KEY: region.xOffset,
+        Y_OFFSET_KEY: region.yOffset,
+        WIDTH_KEY: region.width,
+        HEIGHT_KEY: region.height,
+        REGION_HOTKEY_KEY: region.hotkey
+        }
+
+def parseRegion(text:str) -> Region:
+    """Read a region given on the command line
+    Args:
+        text (str): name:x,y,width,height or name:x,y,width,height:hotkey
+    Raises:
+        ValueError: If text doesn't follow this format
+    """
+    parts = text.split(':')
+    if len(parts) not in (2, 3):
+        raise ValueError(f'Expected name:x,y,width,height[:hotkey], got {text}')
+    box = parts[1].split(',')
+    if len(box) != 4:
+        raise ValueError(f'Expected 4 numbers for the position and size of region {parts[0]}, got {parts[1]}')
+    return Region(parts[0], *box, parts[2] if len(parts) == 3 else '')
+
+def diffOptions(old:Options, new:Options) -> list:
+    """
+    Returns:
+        list: Names of the options whose values differ between old and new
+    """
+    return [name for name, value in vars(new).items() if getattr(old, name, None) != value]
+
+def readOptions(path:Path=OPTIONS_FILE_PATH) -> Options:
+    """ Read options from a save file
+    Raises:
+        OSError: If the file can't be read
+        ValueError: If the file isn't valid json
+        KeyError: If a required option is missing
+    """
+    with open(path, "r") as f:
+        return toOptions(json.load(f))
+
 def loadOptions() -> Options:
     """ Load options from save file
     Returns:
@@ -66,8 +397,7 @@ def loadOptions() -> Options:
         logger.info('No save file found, using defaults')
         return Options(DEFAULT_PATH, DEFAULT_X, DEFAULT_Y, DEFAULT_W, DEFAULT_H, DEFAULT_LOG_LEVEL)
     try:
-        with open(OPTIONS_FILE_PATH, "r") as f:
-            return json.load(f, object_hook=toOptions)
+        return readOptions()
     except Exception as ex:
         print("Error while loading options:", str(ex))
         logger.exception('Error while loading options')
@@ -79,16 +409,57 @@ def saveOptions(options: Options) -> bool:
         options (Options): The options we want to save
     """
     logger.warning('Saving options')
+    # Written under a temporary name and swapped in, so that a listening cropper reloading the file never reads half of it
+    tmpPath = OPTIONS_FILE_PATH.with_name(OPTIONS_FILE_PATH.name + '.tmp')
     try:
-        with open(OPTIONS_FILE_PATH, "w") as f:
+        with open(tmpPath, "w") as f:
             json.dump({
                 X_OFFSET_KEY: options.xOffset,
                 Y_OFFSET_KEY: options.yOffset,
                 WIDTH_KEY: options.width,
                 HEIGHT_KEY: options.height,
-                PATH_KEY: str(options.path),
-                LOG_LEVEL_KEY : options.logLevel
+                PATH_KEY: [str(path) for path in options.paths()] if options.mirrorPaths else str(options.path),
+                LOG_LEVEL_KEY : options.logLevel,
+                WORKERS_KEY: options.workers,
+                WORKER_TYPE_KEY: options.workerType,
+                QUEUE_SIZE_KEY: options.queueSize,
+                BACKPRESSURE_KEY: options.backpressure,
+                BACKEND_KEY: options.backend,
+                BURST_FPS_KEY: options.burstFps,
+                BURST_KEY_KEY: options.burstKey,
+                REPLAY_SECONDS_KEY: options.replaySeconds,
+                REPLAY_FPS_KEY: options.replayFps,
+                REPLAY_MEMORY_KEY: options.replayMemory,
+                FORMAT_KEY: options.format,
+                COMPRESS_LEVEL_KEY: options.compressLevel,
+                PNG_STRATEGY_KEY: options.pngStrategy,
+                QUALITY_KEY: options.quality,
+                PRESET_KEY: options.preset,
+                INDEX_FILE_KEY: options.indexFile,
+                STATS_KEY: options.stats,
+                STATS_INTERVAL_KEY: options.statsInterval,
+                WATCH_THRESHOLD_KEY: options.watchThreshold,
+                WATCH_RATE_KEY: options.watchRate,
+                WATCH_COOLDOWN_KEY: options.watchCooldown,
+                DEDUPE_KEY: options.dedupe,
+                DEDUPE_DISTANCE_KEY: options.dedupeDistance,
+                DEDUPE_HISTORY_KEY: options.dedupeHistory,
+                REGIONS_KEY: [fromRegion(region) for region in options.regions],
+                PREWARM_KEY: options.prewarm,
+                SPOOL_PATH_KEY: str(options.spoolPath) if options.spoolPath else '',
+                SPOOL_MOVERS_KEY: options.spoolMovers,
+                CONTROL_PORT_KEY: options.controlPort,
+                RELOAD_OPTIONS_KEY: options.reloadOptions,
+                MIN_INTERVAL_KEY: options.minInterval,
+                CAPTURE_RATE_KEY: options.captureRate,
+                CAPTURE_BUCKET_KEY: options.captureBucket,
+                OUTPUT_KEY: options.output,
+                KEYFRAME_INTERVAL_KEY: options.keyframeInterval,
+                CATALOG_KEY: options.catalog,
+                STAGES_KEY: options.stages,
+                EVENT_LOG_KEY: str(options.eventLog) if options.eventLog else ''
                 }, f, indent=4)
+        os.replace(tmpPath, OPTIONS_FILE_PATH)
         return True
     except Exception as ex:
         logger.error('Failed to save options! ', ex)
@@ -103,11 +474,100 @@ def validateOptions(options: Options) -> None:
     """
     if options.path.exists() and not options.path.is_dir():
         raise ValueError(f'File on provided path is not a Directory!')   
+    folders = set()
+    for path in options.paths():
+        # Resolved without checking that the folder exists, as a mirror may be an unplugged drive
+        folder = path.resolve()
+        if folder in folders:
+            raise ValueError(f'Screenshot folder given twice: {path}')
+        folders.add(folder)
+        if path is not options.path and path.exists() and not path.is_dir():
+            raise ValueError(f'File on provided path is not a Directory: {path}')
     validateInt('X Offset', options.xOffset)
     validateInt('Y Offset', options.yOffset)
     validateInt('Width', options.width)
     validateInt('Height', options.height)
+    validatePositive('Workers', options.workers)
+    validatePositive('Queue size', options.queueSize)
+    validateChoice('Worker type', options.workerType, WORKER_TYPES)
+    validateChoice('Backpressure', options.backpressure, BACKPRESSURE_POLICIES)
+    validateChoice('Backend', options.backend, BACKENDS)
+    validateInt('Burst fps', options.burstFps)
+    if options.burstKey and not options.burstFps:
+        raise ValueError('A burst key was given, but burst fps is 0')
+    validateInt('Replay seconds', options.replaySeconds)
+    if options.replaySeconds:
+        validatePositive('Replay fps', options.replayFps)
+        validatePositive('Replay memory', options.replayMemory)
+        # Replay frames are kept as raw RGB, see ReplayBuffer
+        frameBytes = options.width * options.height * 3
+        if frameBytes > options.replayMemory * 1024 * 1024:
+            raise ValueError(f'Replay memory of {options.replayMemory} MB is too small for a single frame of the {options.width}x{options.height} area, which needs {-(-frameBytes // (1024 * 1024))} MB')
+    validateChoice('Format', options.format, FORMATS)
+    validateChoice('PNG strategy', options.pngStrategy, tuple(PNG_STRATEGIES))
+    if options.preset:
+        validateChoice('Preset', options.preset, tuple(PRESETS))
+    format = PRESETS[options.preset][0] if options.preset else options.format
+    missing = missingPackages(format)
+    if missing:
+        raise ValueError(f'The {format} format needs these packages, which are not installed: {", ".join(missing)}')
+    if not 0 <= options.compressLevel <= 9:
+        raise ValueError(f'Compress level must be between 0 and 9: {options.compressLevel}')
+    if not 0 <= options.quality <= 100:
+        raise ValueError(f'Quality must be between 0 and 100: {options.quality}')
+    if options.statsInterval <= 0:
+        raise ValueError(f'Stats interval must be above 0: {options.statsInterval}')
+    if not 0 <= options.watchThreshold <= 1:
+        raise ValueError(f'Watch threshold must be between 0 and 1: {options.watchThreshold}')
+    if options.watchThreshold:
+        if options.watchRate <= 0:
+            raise ValueError(f'Watch rate must be above 0: {options.watchRate}')
+        validateInt('Watch cooldown', options.watchCooldown)
+    validateChoice('Dedupe', options.dedupe, DEDUPE_MODES)
+    validateInt('Dedupe distance', options.dedupeDistance)
+    validatePositive('Dedupe history', options.dedupeHistory)
+    names = set()
+    for region in options.regions:
+        if not REGION_NAME_REGEX.fullmatch(region.name):
+            raise ValueError(f'Region names must start with a letter, and contain only letters, digits, - and _: {region.name}')
+        if region.name in names:
+            raise ValueError(f'Region name used twice: {region.name}')
+        names.add(region.name)
+        validateInt(f'Region {region.name} X Offset', region.xOffset)
+        validateInt(f'Region {region.name} Y Offset', region.yOffset)
+        validatePositive(f'Region {region.name} width', region.width)
+        validatePositive(f'Region {region.name} height', region.height)
+        if region.hotkey and region.hotkey in ('f12', options.burstKey):
+            raise ValueError(f'Region {region.name} hotkey is already used: {region.hotkey}')
+    if options.spoolPath:
+        if options.spoolPath.exists() and not options.spoolPath.is_dir():
+            raise ValueError('File on provided spool path is not a Directory!')
+        if options.spoolPath.resolve() in folders:
+            raise ValueError(f'The spool must be a different folder from the destinations: {options.spoolPath}')
+        validatePositive('Spool movers', options.spoolMovers)
+    if not 0 <= options.controlPort <= 65535:
+        raise ValueError(f'Control port must be between 0 and 65535: {options.controlPort}')
+    validateInt('Min interval', options.minInterval)
+    validateInt('Capture rate', options.captureRate)
+    validateInt('Capture bucket', options.captureBucket)
+    validateChoice('Output', options.output, OUTPUTS)
+    validatePositive('Keyframe interval', options.keyframeInterval)
+    if options.output == 'archive' and options.spoolPath:
+        raise ValueError('A session archive is written to its folder directly, and can\'t be used with a spool')
+    if options.output == 'archive' and options.mirrorPaths:
+        raise ValueError('A session archive is written to a single folder, and can\'t be copied to other folders')
+    createChain(options.stages)
+    if options.eventLog and options.eventLog.is_dir():
+        raise ValueError(f'The event log must be a file, not a folder: {options.eventLog}')
     
 def validateInt(name: str, value: int) -> None:
     if value < 0:
-        raise ValueError(f'{name} has invalid value: {value}')
\ No newline at end of file
+        raise ValueError(f'{name} has invalid value: {value}')
+    
+def validatePositive(name: str, value: int) -> None:
+    if value < 1:
+        raise ValueError(f'{name} must be at least 1: {value}')
+    
+def validateChoice(name: str, value: str, choices: tuple) -> None:
+    if value not in choices:
+        raise ValueError(f'{name} has invalid value: {value}. Expected one of: {", ".join(choices)}')
\ No newline at end of file
@@ -0,0 +1,99 @@
+from scCore.Options import OPTIONS_FILE_PATH, readOptions, validateOptions, diffOptions
+from typing import Callable
+from pathlib import Path
+import threading
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two checks of the options file
+POLL_INTERVAL = 1
+
+class OptionsWatcher(object):
+    """Polls the modification time and size of the options file, and reads it again when they change.
+    onChange is only given the options that changed in the file since it was last read, so that options set another
+    way, such as on the command line, are kept until the same option is changed in the file.
+    """
+    def __init__(self, onChange:Callable, onError:Callable=None, path:Path=OPTIONS_FILE_PATH, interval:float=POLL_INTERVAL):
+        """
+        Args:
+            onChange (Callable): Called with the options read from the file (Options) and the names of the options
+                that changed (list)
+            onError (Callable, optional): Called with the error (Exception) when the changed file can't be read or
+                holds invalid options. Defaults to only logging it.
+            path (Path, optional): The options file. Defaults to OPTIONS_FILE_PATH.
+            interval (float, optional): Seconds between two checks. Defaults to POLL_INTERVAL.
+        """
+        self.path = path
+        self.interval = interval
+        self._onChange = onChange
+        self._onError = onError
+        self._stamp = None
+        self._options = None
+        self._stopEvent = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='OptionsWatcher', daemon=True)
+
+    def start(self) -> None:
+        """Read the file as it is now, to compare later versions with, and start polling. Does not block.
+        """
+        self._stamp = self._readStamp()
+        try:
+            self._options = readOptions(self.path) if self._stamp else None
+        except Exception as e:
+            # Every option in the file counts as changed once it can be read
+            logger.error(f'Failed to read {self.path}: {e}')
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop polling. Blocks until the current check is done, unless called by onChange.
+        """
+        self._stopEvent.set()
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def check(self) -> list:
+        """Read the file if it changed since the last check, and call onChange if options changed in it
+        Returns:
+            list: Names of the options that changed
+        """
+        stamp = self._readStamp()
+        if stamp == self._stamp:
+            return []
+        self._stamp = stamp
+        if stamp is None:
+            # Deleted, the options are kept as they are
+            return []
+        try:
+            options = readOptions(self.path)
+            validateOptions(options)
+        except Exception as e:
+            # A later change to the file is read again
+            logger.error(f'Ignoring the changes to {self.path}: {e}')
+            if self._onError:
+                self._onError(e)
+            return []
+        changed = diffOptions(self._options, options) if self._options else list(vars(options))
+        self._options = options
+        if changed:
+            logger.info(f'Options changed in {self.path}: {", ".join(changed)}')
+            self._onChange(options, changed)
+        return changed
+
+    def _run(self) -> None:
+        while not self._stopEvent.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception('Failed to apply the options file')
+
+    def _readStamp(self) -> tuple:
+        """
+        Returns:
+            tuple: Modification time in nanoseconds and size of the file, or None if there is no file
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
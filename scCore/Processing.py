@@ -0,0 +1,325 @@
+"""Processing stages, applied in order to every screenshot before it is encoded: downscaling, blanking out part of the
+screen, stamping the capture time. Stages work on the pixels as a numpy array, on the capture workers, so the thread
+grabbing the screen never waits on them.
+
+Stages are described by small dicts, as they are stored in options.json:
+    {"stage": "scale", "factor": 0.5}
+    {"stage": "redact", "xOffset": 0, "yOffset": 0, "width": 400, "height": 60, "color": "#000000"}
+    {"stage": "timestamp", "position": "bottom-right", "format": "%Y-%m-%d %H:%M:%S", "size": 16}
+Positions are in pixels of the screenshot as it is when the stage runs, so a redact stage after a scale stage uses
+scaled coordinates.
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable
+import importlib.util
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+STAGE_TYPES = ('scale', 'redact', 'timestamp')
+TIMESTAMP_POSITIONS = ('top-left', 'top-right', 'bottom-left', 'bottom-right')
+DEFAULT_REDACT_COLOR = '#000000'
+DEFAULT_TIMESTAMP_POSITION = 'bottom-right'
+DEFAULT_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+DEFAULT_TIMESTAMP_SIZE = 16
+# Pixels between the timestamp and the edge of its box, and between the box and the edge of the screenshot
+TIMESTAMP_PADDING = 4
+
+STAGE_KEY       = 'stage'
+FACTOR_KEY      = 'factor'
+X_OFFSET_KEY    = 'xOffset'
+Y_OFFSET_KEY    = 'yOffset'
+WIDTH_KEY       = 'width'
+HEIGHT_KEY      = 'height'
+COLOR_KEY       = 'color'
+POSITION_KEY    = 'position'
+FORMAT_KEY      = 'format'
+SIZE_KEY        = 'size'
+
+class Stage(ABC):
+    """A step applied to the pixels of every screenshot
+    """
+    name = ''
+
+    @abstractmethod
+    def apply(self, pixels, captured:datetime):
+        """
+        Args:
+            pixels (numpy.ndarray): The screenshot, as a height x width x 3 array of uint8. May be changed in place.
+            captured (datetime): When the screenshot was taken
+        Returns:
+            numpy.ndarray: The processed pixels, pixels itself or a new array
+        """
+        pass
+
+class ScaleStage(Stage):
+    """Shrinks the screenshot by factor. Each pixel of the result is the mean of the block of pixels it replaces,
+    which keeps text legible. Factors of the form 1/n, such as 0.5 or 0.25, give the sharpest results, other factors
+    are shrunk by whole blocks as far as possible and then resampled to the exact size.
+    """
+    name = 'scale'
+
+    def __init__(self, factor:float):
+        """
+        Raises:
+            ValueError: If factor isn't above 0 and at most 1
+        """
+        self.factor = float(factor)
+        if not 0 < self.factor <= 1:
+            raise ValueError(f'Scale factor must be above 0 and at most 1: {factor}')
+
+    def apply(self, pixels, captured:datetime):
+        import numpy
+        height, width = pixels.shape[:2]
+        targetHeight = max(1, round(height * self.factor))
+        targetWidth = max(1, round(width * self.factor))
+        block = min(int(1 / self.factor + 1e-6), height, width)
+        if block > 1:
+            pixels = blockMean(pixels, block)
+        if pixels.shape[:2] != (targetHeight, targetWidth):
+            rows = (numpy.arange(targetHeight) * pixels.shape[0] // targetHeight)
+            columns = (numpy.arange(targetWidth) * pixels.shape[1] // targetWidth)
+            pixels = pixels[rows[:, None], columns]
+        return pixels
+
+class RedactStage(Stage):
+    """Fills a rectangle with a flat colour, for instance to hide a HUD or a chat window. The part of the rectangle
+    outside the screenshot is ignored.
+    """
+    name = 'redact'
+
+    def __init__(self, xOffset:int, yOffset:int, width:int, height:int, color:str=DEFAULT_REDACT_COLOR):
+        """
+        Raises:
+            ValueError: If the rectangle is empty or the colour can't be read
+        """
+        from PIL import ImageColor
+        self.xOffset = int(xOffset)
+        self.yOffset = int(yOffset)
+        self.width = int(width)
+        self.height = int(height)
+        if self.xOffset < 0 or self.yOffset < 0 or self.width < 1 or self.height < 1:
+            raise ValueError(f'Redact rectangle must have a positive position and size: {xOffset},{yOffset},{width},{height}')
+        try:
+            self.color = ImageColor.getrgb(color)[:3]
+        except ValueError:
+            raise ValueError(f'Redact colour must be a colour name or #rrggbb: {color}')
+
+    def apply(self, pixels, captured:datetime):
+        pixels[self.yOffset:self.yOffset + self.height, self.xOffset:self.xOffset + self.width] = self.color
+        return pixels
+
+class TimestampStage(Stage):
+    """Writes the capture time in a corner, in white over a darkened box
+    """
+    name = 'timestamp'
+
+    def __init__(self, position:str=DEFAULT_TIMESTAMP_POSITION, format:str=DEFAULT_TIMESTAMP_FORMAT, size:int=DEFAULT_TIMESTAMP_SIZE):
+        """
+        Raises:
+            ValueError: If position is unknown, or size isn't at least 1
+        """
+        if position not in TIMESTAMP_POSITIONS:
+            raise ValueError(f'Timestamp position must be one of {", ".join(TIMESTAMP_POSITIONS)}: {position}')
+        self.position = position
+        self.format = format
+        self.size = int(size)
+        if self.size < 1:
+            raise ValueError(f'Timestamp size must be at least 1: {size}')
+        # The mask of the last text drawn, reused by the screenshots of the same second
+        self._mask = (None, None)
+
+    def apply(self, pixels, captured:datetime):
+        import numpy
+        mask = self._textMask(captured.strftime(self.format))
+        height = min(mask.shape[0], max(0, pixels.shape[0] - 2 * TIMESTAMP_PADDING))
+        width = min(mask.shape[1], max(0, pixels.shape[1] - 2 * TIMESTAMP_PADDING))
+        if not height or not width:
+            return pixels
+        top = TIMESTAMP_PADDING if self.position.startswith('top') else pixels.shape[0] - TIMESTAMP_PADDING - height
+        left = TIMESTAMP_PADDING if self.position.endswith('left') else pixels.shape[1] - TIMESTAMP_PADDING - width
+        box = pixels[top:top + height, left:left + width]
+        alpha = mask[:height, :width, None]
+        # Halve the background, then blend in white where the text is
+        background = box >> 1
+        box[:] = background + ((255 - background.astype(numpy.uint16)) * alpha // 255).astype(numpy.uint8)
+        return pixels
+
+    def _textMask(self, text:str):
+        """
+        Returns:
+            numpy.ndarray: height x width coverage of text and its padding, from 0 to 255
+        """
+        cachedText, mask = self._mask
+        if cachedText == text:
+            return mask
+        import numpy
+        from PIL import Image, ImageDraw
+        font = loadFont(self.size)
+        left, top, right, bottom = font.getbbox(text)
+        image = Image.new('L', (right - left + 2 * TIMESTAMP_PADDING, bottom - top + 2 * TIMESTAMP_PADDING))
+        ImageDraw.Draw(image).text((TIMESTAMP_PADDING - left, TIMESTAMP_PADDING - top), text, fill=255, font=font)
+        mask = numpy.asarray(image, dtype=numpy.uint16)
+        self._mask = (text, mask)
+        return mask
+
+class StageChain(object):
+    """The stages applied to every screenshot, in order. Safe to apply from several threads at once.
+    """
+    def __init__(self, stages:list):
+        """
+        Args:
+            stages (list): Stage objects
+        Raises:
+            ValueError: If numpy isn't installed
+        """
+        if importlib.util.find_spec('numpy') is None:
+            raise ValueError('Processing stages need numpy, install it with: pip install numpy')
+        self.stages = stages
+        # Names the time of each stage is recorded under. A stage used twice is numbered from its second use.
+        self.labels = []
+        for stage in stages:
+            uses = sum(1 for other in self.stages[:len(self.labels)] if other.name == stage.name)
+            self.labels.append(stage.name + (str(uses + 1) if uses else ''))
+
+    def apply(self, image, captured:datetime=None, record:Callable=None):
+        """Run every stage on image
+        Args:
+            image (PIL.Image.Image): The screenshot
+            captured (datetime, optional): When it was taken. Defaults to now.
+            record (Callable, optional): Called with the label and the duration in seconds of each stage
+        Returns:
+            PIL.Image.Image: The processed screenshot, as a new RGB image
+        """
+        import numpy
+        from PIL import Image
+        captured = captured or datetime.now()
+        pixels = numpy.array(image if image.mode == 'RGB' else image.convert('RGB'))
+        for label, stage in zip(self.labels, self.stages):
+            start = time.perf_counter()
+            pixels = stage.apply(pixels, captured)
+            if record:
+                record(label, time.perf_counter() - start)
+        return Image.fromarray(numpy.ascontiguousarray(pixels))
+
+    def describe(self) -> str:
+        return ' > '.join(describeStage(stage) for stage in self.stages)
+
+def createStage(spec:dict) -> Stage:
+    """
+    Args:
+        spec (dict): The stage as stored in options.json, see the module docstring
+    Raises:
+        ValueError: If the stage is unknown or has bad values
+    """
+    kind = spec.get(STAGE_KEY)
+    try:
+        if kind == 'scale':
+            return ScaleStage(spec[FACTOR_KEY])
+        if kind == 'redact':
+            return RedactStage(spec[X_OFFSET_KEY], spec[Y_OFFSET_KEY], spec[WIDTH_KEY], spec[HEIGHT_KEY], spec.get(COLOR_KEY, DEFAULT_REDACT_COLOR))
+        if kind == 'timestamp':
+            return TimestampStage(spec.get(POSITION_KEY, DEFAULT_TIMESTAMP_POSITION), spec.get(FORMAT_KEY, DEFAULT_TIMESTAMP_FORMAT), spec.get(SIZE_KEY, DEFAULT_TIMESTAMP_SIZE))
+    except KeyError as e:
+        raise ValueError(f'Processing stage {kind} is missing {e}')
+    except TypeError as e:
+        raise ValueError(f'Processing stage {kind} has a bad value: {e}')
+    raise ValueError(f'Processing stage must be one of {", ".join(STAGE_TYPES)}: {kind}')
+
+def createChain(specs:list) -> StageChain:
+    """
+    Args:
+        specs (list): Stages as stored in options.json
+    Returns:
+        StageChain: The chain, or None if there are no stages
+    Raises:
+        ValueError: If a stage is unknown or has bad values, or numpy isn't installed
+    """
+    if not specs:
+        return None
+    return StageChain([createStage(spec) for spec in specs])
+
+def parseStage(text:str) -> dict:
+    """Read a stage given on the command line
+    Args:
+        text (str): scale:factor, redact:x,y,width,height[:color] or timestamp[:position[:format]]
+    Returns:
+        dict: The stage as stored in options.json
+    Raises:
+        ValueError: If text doesn't follow one of these formats
+    """
+    kind, _, rest = text.partition(':')
+    if kind == 'scale':
+        try:
+            return {STAGE_KEY: kind, FACTOR_KEY: float(rest)}
+        except ValueError:
+            raise ValueError(f'Expected scale:factor, got {text}')
+    if kind == 'redact':
+        box, _, color = rest.partition(':')
+        box = box.split(',')
+        if len(box) != 4 or not all(value.strip().isdigit() for value in box):
+            raise ValueError(f'Expected redact:x,y,width,height[:color], got {text}')
+        spec = {STAGE_KEY: kind, X_OFFSET_KEY: int(box[0]), Y_OFFSET_KEY: int(box[1]), WIDTH_KEY: int(box[2]), HEIGHT_KEY: int(box[3])}
+        if color:
+            spec[COLOR_KEY] = color
+        return spec
+    if kind == 'timestamp':
+        # The format is last, as it may contain colons
+        position, _, format = rest.partition(':')
+        spec = {STAGE_KEY: kind}
+        if position:
+            spec[POSITION_KEY] = position
+        if format:
+            spec[FORMAT_KEY] = format
+        return spec
+    raise ValueError(f'Processing stage must be one of {", ".join(STAGE_TYPES)}: {text}')
+
+def describeStage(stage:Stage) -> str:
+    if isinstance(stage, ScaleStage):
+        return f'scale {stage.factor:g}'
+    if isinstance(stage, RedactStage):
+        return f'redact {stage.xOffset},{stage.yOffset},{stage.width},{stage.height}'
+    if isinstance(stage, TimestampStage):
+        return f'timestamp {stage.position}'
+    return stage.name
+
+def blockMean(pixels, block:int):
+    """Shrink pixels by a whole factor, each pixel of the result being the rounded mean of a block x block square.
+    Rows and columns that don't fill a whole block are dropped.
+    Args:
+        pixels (numpy.ndarray): height x width x channels array of uint8
+        block (int): Side of the squares averaged
+    Returns:
+        numpy.ndarray: The shrunk pixels
+    """
+    import numpy
+    height, width = pixels.shape[0] // block, pixels.shape[1] // block
+    pixels = pixels[:height * block, :width * block]
+    # Sums of up to 16 x 16 pixels fit in 16 bits. Rows are added first, as adding strided rows is fast.
+    dtype = numpy.uint16 if block <= 16 else numpy.uint32
+    rows = pixels[0::block].astype(dtype)
+    for i in range(1, block):
+        rows += pixels[i::block]
+    columns = rows.reshape(height, width, block, pixels.shape[2])
+    total = columns[:, :, 0].copy()
+    for i in range(1, block):
+        total += columns[:, :, i]
+    total += block * block // 2
+    total //= block * block
+    return total.astype(numpy.uint8)
+
+@lru_cache(maxsize=8)
+def loadFont(size:int):
+    """
+    Returns:
+        PIL.ImageFont.ImageFont: Pillow's default font, at size pixels if this Pillow can scale it
+    """
+    from PIL import ImageFont
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow before 10.1 only has a fixed size bitmap font
+        return ImageFont.load_default()
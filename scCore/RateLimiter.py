@@ -0,0 +1,34 @@
+import time
+
+class RateLimiter(object):
+    """Token bucket: allows up to bucket events in quick succession, and rate events per second on average.
+    Not thread safe, callers on several threads must hold a lock around tryAcquire.
+    """
+    def __init__(self, rate:float, bucket:int=1):
+        """
+        Args:
+            rate (float): Events allowed per second, on average. 0 allows every event.
+            bucket (int, optional): Events allowed at once after a quiet period. Defaults to 1.
+        """
+        self.rate = rate
+        self.bucket = max(1, bucket)
+        self._tokens = self.bucket
+        self._time = None
+
+    def tryAcquire(self, now:float=None) -> bool:
+        """Take a token if one is available
+        Args:
+            now (float, optional): time.monotonic() of the event. Defaults to now.
+        Returns:
+            bool: True if the event is allowed
+        """
+        if self.rate <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        if self._time is not None:
+            self._tokens = min(self.bucket, self._tokens + (now - self._time) * self.rate)
+        self._time = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
@@ -0,0 +1,121 @@
+from scCore.CaptureBackend import CaptureBackend
+from scCore.CapturePipeline import CapturePipeline
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+BYTES_PER_PIXEL = 3
+
+class ReplayBuffer(object):
+    """Keeps grabbing the region into a ring of raw RGB frames, so that the last few seconds can be saved after the fact.
+    The ring's slots are allocated once, so memory use is width x height x 3 x number of slots and never grows.
+    """
+    def __init__(self, backend:CaptureBackend, region:tuple, fps:float, seconds:float, memoryCap:int):
+        """
+        Args:
+            backend (CaptureBackend): Grabs the frames
+            region (tuple): The region to grab
+            fps (float): Number of frames grabbed per second
+            seconds (float): How many seconds of frames to keep
+            memoryCap (int): Maximum number of bytes the frames may use. Fewer seconds are kept if they don't fit.
+        Raises:
+            ValueError: If a single frame doesn't fit in memoryCap
+        """
+        self._backend = backend
+        self._region = region
+        self.fps = fps
+        self.size = (region[2], region[3])
+        self.frameBytes = region[2] * region[3] * BYTES_PER_PIXEL
+        wanted = max(1, round(fps * seconds))
+        capacity = min(wanted, memoryCap // self.frameBytes)
+        if capacity < 1:
+            raise ValueError(f'Replay memory cap of {memoryCap} bytes is too small for a single frame of {self.frameBytes} bytes')
+        if capacity < wanted:
+            logger.warning(f'Replay limited to {capacity} frames ({capacity / fps:.1f}s) by the memory cap')
+        self._slots = [bytearray(self.frameBytes) for i in range(capacity)]
+        self._next = 0
+        self._count = 0
+        self._flushing = False
+        self._lock = threading.Lock()
+        self._stopEvent = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='ReplayBuffer', daemon=True)
+
+    def capacity(self) -> int:
+        return len(self._slots)
+
+    def memoryUsage(self) -> int:
+        """
+        Returns:
+            int: Number of bytes held by the frames
+        """
+        return self.capacity() * self.frameBytes
+
+    def start(self) -> None:
+        """Start grabbing. Does not block.
+        """
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop grabbing. Blocks until the current grab is done.
+        """
+        self._stopEvent.set()
+        self._thread.join()
+
+    def flush(self, pipeline:CapturePipeline, burstId:int) -> int:
+        """Hand the buffered frames to pipeline, oldest first, then empty the buffer.
+        Grabbing is paused while flushing, so that frames aren't overwritten before they are saved.
+        Args:
+            pipeline (CapturePipeline): Receives the frames
+            burstId (int): Identifies the flushed frames, so that they share an index when named
+        Returns:
+            int: Number of frames flushed
+        """
+        from PIL import Image
+        with self._lock:
+            if self._flushing:
+                return 0
+            self._flushing = True
+            count = self._count
+            first = (self._next - count) % self.capacity()
+        try:
+            for i in range(count):
+                slot = self._slots[(first + i) % self.capacity()]
+                pipeline.submit(Image.frombytes('RGB', self.size, slot), burstId=burstId, burstIdx=i+1, wait=True)
+        finally:
+            with self._lock:
+                self._count = 0
+                self._flushing = False
+        return count
+
+    def _run(self) -> None:
+        """Grab frames on a fixed schedule, overwriting the oldest slot once the ring is full
+        """
+        interval = 1 / self.fps
+        nextTime = time.perf_counter()
+        while not self._stopEvent.is_set():
+            try:
+                if not self._flushing:
+                    self._store(self._backend.grab(self._region))
+            except Exception:
+                logger.exception('Replay grab failed')
+            nextTime += interval
+            delay = nextTime - time.perf_counter()
+            if delay > 0:
+                self._stopEvent.wait(delay)
+            else:
+                nextTime = time.perf_counter()
+
+    def _store(self, image) -> None:
+        if image.size != self.size:
+            logger.warning(f'Grabbed frame has size {image.size} instead of {self.size}, skipping')
+            return
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        with self._lock:
+            if self._flushing:
+                return
+            self._slots[self._next][:] = image.tobytes()
+            self._next = (self._next + 1) % self.capacity()
+            self._count = min(self._count + 1, self.capacity())
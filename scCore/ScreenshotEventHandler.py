@@ -1,50 +1,643 @@
-from scCore.Options import Options
+from scCore.Options import Options, diffOptions
 from scCore.ScreenshotNamer import ScreenShotNamer
 from scCore.Broadcaster import Broadcaster, EventType
-from pynput.keyboard import Key, Listener
-import pyautogui
+from scCore.CapturePipeline import CapturePipeline, Backpressure
+from scCore.CaptureBackend import createBackend
+from scCore.BurstCapture import BurstCapture
+from scCore.ReplayBuffer import ReplayBuffer
+from scCore.Encoders import createEncoder
+from scCore.Metrics import Metrics, NullMetrics, MetricsReporter
+from scCore.ChangeWatcher import ChangeWatcher
+from scCore.Deduplicator import Deduplicator
+from scCore.SpoolMover import SpoolMover
+from scCore.ControlServer import ControlServer
+from scCore.OptionsWatcher import OptionsWatcher
+from scCore.CaptureTrigger import CaptureTrigger
+from scCore.SessionArchive import SessionArchive, summaryText
+from scCore.Catalog import CatalogUpdater
+from scCore.Processing import createChain
+from scCore.MirrorWriter import MirrorWriter, stopMirrors
+from pynput.keyboard import Key, KeyCode, Listener
+import itertools
+import threading
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# How long F12 has to be held down before a burst starts
+BURST_HOLD_DELAY = 0.4
+# Options that are only read when the handler or the program starts. Changing them needs a new handler.
+RESTART_OPTIONS = ('logLevel', 'workers', 'workerType', 'queueSize', 'backpressure', 'backend', 'stats', 'statsInterval', 'spoolPath', 'spoolMovers', 'output', 'keyframeInterval', 'catalog', 'eventLog')
+# Options that change how screenshots are named and encoded
+OUTPUT_OPTIONS = ('path', 'format', 'compressLevel', 'pngStrategy', 'quality', 'preset', 'indexFile')
+DEDUPE_OPTIONS = ('dedupe', 'dedupeDistance', 'dedupeHistory')
+AREA_OPTIONS = ('xOffset', 'yOffset', 'width', 'height')
+# Options that restart the change watcher or the replay buffer when changed while listening
+WATCH_OPTIONS = AREA_OPTIONS + ('watchThreshold', 'watchRate', 'watchCooldown')
+REPLAY_OPTIONS = AREA_OPTIONS + ('replaySeconds', 'replayFps', 'replayMemory')
+TRIGGER_OPTIONS = ('minInterval', 'captureRate', 'captureBucket')
+
 class ScreenShotEventHandler(object):  
     """ Listens for F12 and takes screenshots
     """      
     def __init__(self, options:Options, broadcaster:Broadcaster=Broadcaster()):
+        # A copy, so that the caller changing its options doesn't change them here. See updateOptions.
+        self.options = options.copy()
         self.region = options.region()
-        self.namer = ScreenShotNamer(options.path) 
-        self.listener = Listener(on_release=self.on_release) 
+        # Key -> regions it captures, None being F12. Empty if no regions are configured, in which case F12 captures self.region.
+        self.regionGroups = groupRegions(options.regions)
+        self.encoder = createEncoder(options.format, options.compressLevel, options.pngStrategy, options.quality, options.preset)
+        # With a spool, screenshots are named and written in the spool, and moved to options.path in the background
+        self.spool = SpoolMover(options.spoolPath, options.path, broadcaster, options.spoolMovers) if options.spoolPath else None
+        # Namers by folder and format, kept when the options change so that their index doesn't need to be found again
+        self._namers = {}
+        self.namer = self._namer(options, self.encoder.suffix)
+        # With archive output, screenshots are appended to one archive per listening session instead of named files
+        self.archive = SessionArchive(options.path, options.keyframeInterval, options.compressLevel, options.pngStrategy) if options.output == 'archive' else None
+        # Adds saved files to the catalog of their folder. Archives are not catalogued.
+        self.catalog = CatalogUpdater() if options.catalog and not self.archive else None
+        # Created when listening starts, as a listener can only be started once
+        self.listener = None
         self.broadcaster = broadcaster
+        # Runs the captures triggered by keys, so that the listener never waits for a grab, and limits their rate
+        self.triggers = CaptureTrigger(self._capture, broadcaster, options.minInterval, options.captureRate, options.captureBucket)
+        self.burstFps = options.burstFps
+        self.burstKey = toKey(options.burstKey) if options.burstKey else None
+        self._burst = None
+        self._holdTimer = None
+        self._burstLock = threading.Lock()
+        self._burstIds = itertools.count(1)
+        self.replaySeconds = options.replaySeconds
+        self.replayFps = options.replayFps
+        self.replayMemory = options.replayMemory * 1024 * 1024
+        self.replay = None
+        self._flushThread = None
+        self.watchThreshold = options.watchThreshold
+        self.watchRate = options.watchRate
+        self.watchCooldown = options.watchCooldown
+        self.watcher = None
+        self.prewarm = options.prewarm
+        self.backend = createBackend(options.backend)
+        checkRegions(self.backend, options)
+        self.metrics = Metrics() if options.stats else NullMetrics()
+        # Write copies of the screenshots to the other folders, by folder
+        self.mirrors = {folder: MirrorWriter(folder, broadcaster, options.indexFile, self.metrics) for folder in options.mirrorPaths}
+        self.metricsReporter = None
+        self.deduplicator = createDeduplicator(options)
+        # Applied by the pipeline's workers to every screenshot before it is encoded
+        self.processing = createChain(options.stages)
+        self.controlPort = options.controlPort
+        self.controlServer = None
+        self.reloadOptions = options.reloadOptions
+        self.optionsWatcher = None
+        self.listening = False
+        # Held while options are applied, so that two updates don't interleave
+        self._optionsLock = threading.RLock()
+        self.pipeline = CapturePipeline(self.namer, broadcaster, options.workers, options.workerType, options.queueSize, Backpressure(options.backpressure), self.encoder, self.metrics, self.deduplicator, self.spool, archive=self.archive, catalog=self.catalog, processing=self.processing, mirrors=list(self.mirrors.values()))
     
-    def takeScreenshot(self) -> None:
-        """Takes a screenshot and stores it with an unused name
+    def takeScreenshot(self, key=None) -> list:
+        """Grabs the screen region and queues it to be stored with an unused name. 
+        Encoding and writing happen on the pipeline's workers.
+        Args:
+            key (optional): The key that triggered the screenshot, if it isn't F12. Decides which named regions are captured.
+        Returns:
+            list: A Future per queued screenshot, resolved with the path it was saved to. See CapturePipeline.submit.
         """
+        regions = self.regionGroups.get(key)
+        if regions:
+            return self.takeRegionScreenshots(regions)
         logger.warning('Taking screenshot')
-        nextPath = self.namer.nextFreePath()
-        pyautogui.screenshot(nextPath, region=self.region)
-        self.report(EventType.SCREENSHOT, f'Screenshot saved to {nextPath}')
+        triggerTime = time.perf_counter()
+        image = self.backend.grab(self.region)
+        self.metrics.record('grab', time.perf_counter() - triggerTime)
+        return [self.pipeline.submit(image, triggerTime=triggerTime)]
+        
+    def takeRegionScreenshots(self, regions:list) -> list:
+        """Grabs the bounding box of the regions once, and queues one screenshot per region. All of them share an index.
+        Each region is cropped out of the grabbed image by the worker that saves it.
+        Args:
+            regions (list): The Regions to capture
+        Returns:
+            list: A Future per region, resolved with the path it was saved to
+        """
+        logger.warning('Taking screenshot of ' + ', '.join(region.name for region in regions))
+        bounds = boundingBox(regions)
+        triggerTime = time.perf_counter()
+        image = self.backend.grab(bounds)
+        self.metrics.record('grab', time.perf_counter() - triggerTime)
+        groupId = next(self._burstIds)
+        return [self.pipeline.submit(image, burstId=groupId, triggerTime=triggerTime, box=box, label=label) for box, label in regionBoxes(regions, bounds)]
+        
+    def on_press(self, key):
+        """When F12 goes down, start timing how long it is held, so that a long press can start a burst
+        Args:
+            key (_type_): the pressed key
+        """
+        if key == Key.f12 and self.burstFps > 0:
+            with self._burstLock:
+                # Key repeat sends presses for as long as the key is held. Only the first one counts.
+                if self._holdTimer is None and self._burst is None:
+                    self._holdTimer = threading.Timer(BURST_HOLD_DELAY, self._startHoldBurst)
+                    self._holdTimer.start()
         
     def on_release(self, key):
-        """When a key is released, check whether it is the trigger for a screenshot
+        """When a key is released, check whether it is the trigger for a screenshot or a burst
         Args:
             key (_type_): the pressed key
         """
         if key == Key.f12:            
             logger.debug('F12 release detected')
-            self.takeScreenshot()      
+            if self._endHold():
+                return
+            self.triggers.fire()
+        elif self.burstKey and key == self.burstKey:
+            logger.debug('Burst key release detected')
+            self.toggleBurst()
+        elif key in self.regionGroups:
+            logger.debug(f'Region key release detected: {key}')
+            self.triggers.fire(key)
+
+    def _capture(self, key=None) -> None:
+        """Run by the capture trigger for each key release it lets through
+        Args:
+            key (optional): The region key released, None for F12
+        """
+        if key is None and self.replay:
+            self.saveReplay()
+        else:
+            self.takeScreenshot(key)
+            
+    def _onChange(self, image, fraction:float, sampleTime:float) -> None:
+        """Called by the change watcher when enough of the region changed. Saves the sample that showed the change.
+        """
+        self.report(EventType.SCREENSHOT, f'Change detected in {fraction:.0%} of the area, taking screenshot')
+        self.pipeline.submit(image, triggerTime=sampleTime)
+            
+    def saveReplay(self) -> None:
+        """Save the frames held in the replay buffer. Runs on its own thread, so that the listener isn't blocked 
+        while the frames are queued.
+        """
+        if self._flushThread and self._flushThread.is_alive():
+            logger.info('Replay is already being saved')
+            return
+        self._flushThread = threading.Thread(target=self._flushReplay, name='ReplayFlush', daemon=True)
+        self._flushThread.start()
+        
+    def _flushReplay(self) -> None:
+        count = self.replay.flush(self.pipeline, next(self._burstIds))
+        self.report(EventType.SCREENSHOT, f'Replay of {count} screenshots queued for saving')
+            
+    def toggleBurst(self) -> None:
+        """Start a burst if none is running, stop it otherwise
+        """
+        with self._burstLock:
+            if self._burst:
+                self._stopBurst()
+            else:
+                self._startBurst()
+                
+    def startBurst(self) -> bool:
+        """
+        Returns:
+            bool: False if a burst was already running
+        """
+        with self._burstLock:
+            if self._burst:
+                return False
+            self._startBurst()
+            return True
+        
+    def stopBurst(self) -> str:
+        """
+        Returns:
+            str: A summary of the stopped burst, or None if no burst was running
+        """
+        with self._burstLock:
+            if not self._burst:
+                return None
+            burst = self._burst
+            self._stopBurst()
+            return burst.summary()
+                
+    def _startHoldBurst(self) -> None:
+        """Called once F12 has been held long enough
+        """
+        with self._burstLock:
+            # F12 was released just as the timer fired
+            if self._holdTimer is None:
+                return
+            self._startBurst()
+            
+    def _endHold(self) -> bool:
+        """Called when F12 is released. Stops the burst if holding F12 started one.
+        Returns:
+            bool: True if a burst was stopped, False if F12 was only pressed briefly
+        """
+        with self._burstLock:
+            if self._holdTimer is None:
+                return False
+            self._holdTimer.cancel()
+            self._holdTimer = None
+            if self._burst is None:
+                return False
+            self._stopBurst()
+            return True
+        
+    def _startBurst(self) -> None:
+        """Must be called while holding _burstLock
+        """
+        # Bursts capture what F12 captures: the regions without a key of their own, or else the area
+        regions = self.regionGroups.get(None)
+        if regions:
+            bounds = boundingBox(regions)
+            self._burst = BurstCapture(self.backend, bounds, self.pipeline, self.burstFps, next(self._burstIds), regionBoxes(regions, bounds))
+        else:
+            self._burst = BurstCapture(self.backend, self.region, self.pipeline, self.burstFps, next(self._burstIds))
+        self._burst.start()
+        self.report(EventType.SCREENSHOT, f'Burst started at {self.burstFps:g} fps')
+        
+    def _stopBurst(self) -> None:
+        """Must be called while holding _burstLock
+        """
+        self._burst.stop()
+        self.report(EventType.SCREENSHOT, self._burst.summary())
+        self._burst = None
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: The state of the capture: stage timings in ms if stats are enabled, queue depth, and dropped, 
+                skipped and spooled screenshot counts, the number of key presses suppressed by the rate limits, the
+                session archive, the number of screenshots waiting to be added to the catalog, and the copies written
+                to each other folder
+        """
+        with self._burstLock:
+            burst = self._burst is not None
+        stats = {
+            'stages': self.metrics.summary(),
+            'queue': self.pipeline.queueDepth(),
+            'dropped': self.pipeline.droppedCount(),
+            'skipped': self.deduplicator.skipped if self.deduplicator else 0,
+            'burst': burst,
+            'suppressed': self.triggers.suppressedCount()
+            }
+        if self.spool:
+            stats['backlog'], stats['backlogBytes'] = self.spool.backlog()
+        if self.archive and self.listening:
+            stats['archive'] = self.archive.summary()
+        if self.catalog:
+            stats['catalogPending'] = self.catalog.pendingCount()
+        if self.mirrors:
+            stats['mirrors'] = {str(folder): mirror.summary() for folder, mirror in self.mirrors.items()}
+        return stats
 
     def startListening(self) -> None:   
-        """ Start listening for button presses. Does not block.
+        """ Start listening for button presses. Does not block. A handler that stopped listening can start again,
+        and keeps its namers and capture backend.
         """ 
+        with self._optionsLock:
+            if self.spool:
+                self.spool.start()
+            if self.archive:
+                self.report(EventType.SCREENSHOT, f'Saving screenshots to {self.archive.open()}')
+            if self.catalog:
+                self.catalog.start()
+            for mirror in self.mirrors.values():
+                mirror.start()
+            self.pipeline.start()
+            if self.prewarm:
+                self.prewarmCapture()
+            if self.options.stats:
+                self.metricsReporter = MetricsReporter(self.metrics, self.broadcaster, self.options.statsInterval)
+                self.metricsReporter.start()
+            self._startReplay()
+            self._startWatcher()
+            self._startControlServer()
+            if self.reloadOptions:
+                self._startOptionsWatcher()
+            self.triggers.start()
+            self.listening = True
         self.report(EventType.START_LISTENING, 'Listening...')
+        self.listener = Listener(on_press=self.on_press, on_release=self.on_release)
         self.listener.start()
         
+    def prewarmCapture(self) -> None:
+        """Initialise the backend, encoder, namer and workers now, so that the first screenshot is as fast as the next ones.
+        Failures are only logged, as the first screenshot will report them if they persist.
+        """
+        start = time.perf_counter()
+        try:
+            self.backend.prewarm(self.region)
+            self.pipeline.prewarm()
+            logger.info(f'Prewarmed capture in {(time.perf_counter() - start) * 1000:.0f} ms')
+        except Exception:
+            logger.exception('Prewarming failed')
+
     def stopListening(self) -> None:
-        """ Stop listening
+        """ Stop listening. Blocks until queued screenshots have been written.
         """
+        # Stopped first, so that options aren't applied while everything stops
+        self._stopOptionsWatcher()
+        with self._optionsLock:
+            self.listening = False
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+        self.triggers.stop()
+        self._stopControlServer()
+        with self._burstLock:
+            if self._holdTimer:
+                self._holdTimer.cancel()
+                self._holdTimer = None
+            if self._burst:
+                self._stopBurst()
+        self._stopWatcher()
+        self._stopReplay()
+        self.pipeline.stop()
+        # The pipeline closed the namer in use. Those used before the options changed also have sidecars to write.
+        for namer in self._namers.values():
+            if namer is not self.pipeline.namer:
+                namer.close()
+        stopMirrors(self.mirrors.values())
+        if self.catalog:
+            self.catalog.stop()
+        if self.spool:
+            self.spool.stop()
+        if self.archive:
+            self.reportArchive(self.archive.close())
+        if self.metricsReporter:
+            self.metricsReporter.stop()
+            self.metricsReporter = None
+        self.backend.close()
         self.report(EventType.STOP_LISTENING,'Stopped Listening')
-        self.listener.stop()
+
+    def updateOptions(self, options:Options) -> list:
+        """Apply new options in place, between two screenshots, without stopping the listener, the workers or the
+        capture backend. Screenshots already taken are saved as they would have been before.
+        Namers are kept per folder and format, so switching back to a folder doesn't scan it again.
+        Options in RESTART_OPTIONS are not applied, as they are only read when the handler is created.
+        Args:
+            options (Options): The new options. They are copied.
+        Returns:
+            list: Names of the changed options that were not applied, as they need a new handler
+        Raises:
+            ValueError: If an area is outside every monitor, or a key is unknown. No option is applied then.
+        """
+        with self._optionsLock:
+            changed = diffOptions(self.options, options)
+            pending = [name for name in changed if name in RESTART_OPTIONS]
+            live = [name for name in changed if name not in RESTART_OPTIONS]
+            if live:
+                self._applyOptions(options, live)
+                applied = options.copy()
+                for name in pending:
+                    setattr(applied, name, getattr(self.options, name))
+                self.options = applied
+        if live:
+            self.report(EventType.OPTIONS, 'Options updated: ' + ', '.join(live), {'changed': live, 'pending': pending})
+        if pending:
+            logger.warning('Options only applied on restart: ' + ', '.join(pending))
+        return pending
+
+    def _applyOptions(self, options:Options, live:list) -> None:
+        """Must be called while holding _optionsLock
+        Args:
+            options (Options): The new options
+            live (list): Names of the options that changed, and can be changed without a new handler
+        """
+        # Everything that can fail is done first, so that a bad update changes nothing
+        if any(name in AREA_OPTIONS or name == 'regions' for name in live):
+            checkRegions(self.backend, options)
+        regionGroups = groupRegions(options.regions)
+        burstKey = toKey(options.burstKey) if options.burstKey else None
+        encoder = self.encoder
+        namer = self.namer
+        if any(name in OUTPUT_OPTIONS for name in live):
+            options.path.mkdir(parents=True, exist_ok=True)
+            encoder = createEncoder(options.format, options.compressLevel, options.pngStrategy, options.quality, options.preset)
+            namer = self._namer(options, encoder.suffix)
+            # Scanned now, rather than when the next screenshot is named
+            namer.prewarm()
+        deduplicator = createDeduplicator(options) if any(name in DEDUPE_OPTIONS for name in live) else self.deduplicator
+        processing = createChain(options.stages) if 'stages' in live else self.processing
+        mirrors = self.mirrors
+        if 'mirrorPaths' in live or 'indexFile' in live:
+            # Mirrors of the folders kept carry on with their namers and waiting copies
+            mirrors = {folder: self.mirrors.get(folder) or MirrorWriter(folder, self.broadcaster, options.indexFile, self.metrics) for folder in options.mirrorPaths}
+            for folder, mirror in mirrors.items():
+                mirror.sidecar = options.indexFile
+                if self.listening and folder not in self.mirrors:
+                    mirror.start()
+
+        self.pipeline.reconfigure(namer, encoder, deduplicator, options.path if self.spool else None, processing, list(mirrors.values()))
+        self.encoder = encoder
+        self.namer = namer
+        self.deduplicator = deduplicator
+        self.processing = processing
+        # Mirrors of the folders removed write the copies already queued, then stop
+        for folder, mirror in self.mirrors.items():
+            if folder not in mirrors:
+                mirror.finish()
+        self.mirrors = mirrors
+        if self.spool:
+            self.spool.destination = options.path
+        if self.archive and self.listening and 'path' in live:
+            # Screenshots already queued may end up in either archive
+            self.reportArchive(self.archive.reopen(options.path))
+            self.report(EventType.SCREENSHOT, f'Saving screenshots to {self.archive.path}')
+        elif self.archive:
+            self.archive.folder = options.path
+        # The listener reads these for every key, so each is swapped in one assignment. A running burst keeps the
+        # area and rate it started with.
+        self.region = options.region()
+        self.regionGroups = regionGroups
+        self.burstFps = options.burstFps
+        self.burstKey = burstKey
+        self.replaySeconds = options.replaySeconds
+        self.replayFps = options.replayFps
+        self.replayMemory = options.replayMemory * 1024 * 1024
+        self.watchThreshold = options.watchThreshold
+        self.watchRate = options.watchRate
+        self.watchCooldown = options.watchCooldown
+        self.prewarm = options.prewarm
+        self.controlPort = options.controlPort
+        self.reloadOptions = options.reloadOptions
+        if any(name in TRIGGER_OPTIONS for name in live):
+            self.triggers.configure(options.minInterval, options.captureRate, options.captureBucket)
+        if not self.listening:
+            return
+        if any(name in WATCH_OPTIONS for name in live):
+            self._stopWatcher()
+            self._startWatcher()
+        if any(name in REPLAY_OPTIONS for name in live):
+            # The frames held so far are dropped, as they show the previous area
+            self._stopReplay()
+            self._startReplay()
+        if 'controlPort' in live:
+            self._stopControlServer()
+            self._startControlServer()
+        if 'reloadOptions' in live:
+            if self.reloadOptions:
+                self._startOptionsWatcher()
+            else:
+                self._stopOptionsWatcher()
+
+    def reportArchive(self, summary:dict) -> None:
+        """Report the size of a closed session archive, compared to the PNG files it replaces
+        """
+        if summary:
+            self.report(EventType.SCREENSHOT, summaryText(summary), summary)
+
+    def _onOptionsFileChanged(self, fileOptions:Options, changed:list) -> None:
+        """Called by the options watcher. Only the options changed in the file are applied, so that options given
+        another way, such as on the command line, are kept.
+        """
+        with self._optionsLock:
+            options = self.options.copy()
+            for name in changed:
+                setattr(options, name, getattr(fileOptions, name))
+            try:
+                pending = self.updateOptions(options)
+            except ValueError as e:
+                self._onOptionsFileError(e)
+                return
+        if pending:
+            self.report(EventType.OPTIONS, 'Restart to apply: ' + ', '.join(pending), {'changed': [], 'pending': pending})
+
+    def _onOptionsFileError(self, error:Exception) -> None:
+        self.report(EventType.OPTIONS, f'Options file not applied: {error}', {'changed': [], 'pending': [], 'error': str(error)})
+
+    def _namer(self, options:Options, suffix:str) -> ScreenShotNamer:
+        """
+        Returns:
+            ScreenShotNamer: The namer for the folder, format and index file of options, created the first time it is needed
+        """
+        key = (options.path, suffix, options.indexFile)
+        namer = self._namers.get(key)
+        if namer is None:
+            if self.spool:
+                namer = ScreenShotNamer(self.spool.spoolDir, suffix, options.indexFile, otherDirs=(options.path,))
+            else:
+                namer = ScreenShotNamer(options.path, suffix, options.indexFile)
+            self._namers[key] = namer
+        return namer
+
+    def _startReplay(self) -> None:
+        if self.replaySeconds > 0:
+            self.replay = ReplayBuffer(self.backend, self.region, self.replayFps, self.replaySeconds, self.replayMemory)
+            self.replay.start()
+            logger.info(f'Replay buffer holds {self.replay.capacity()} frames in {self.replay.memoryUsage() // (1024 * 1024)} MB')
+
+    def _stopReplay(self) -> None:
+        if self.replay:
+            self.replay.stop()
+            if self._flushThread:
+                self._flushThread.join()
+            self.replay = None
+
+    def _startWatcher(self) -> None:
+        if self.watchThreshold > 0:
+            self.watcher = ChangeWatcher(self.backend, self.region, self.watchThreshold, self.watchRate, self.watchCooldown, self._onChange)
+            self.watcher.start()
+
+    def _stopWatcher(self) -> None:
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+
+    def _startControlServer(self) -> None:
+        if self.controlPort:
+            self.controlServer = ControlServer(self, self.controlPort)
+            self.controlServer.start()
+
+    def _stopControlServer(self) -> None:
+        if self.controlServer:
+            self.controlServer.stop()
+            self.controlServer = None
+
+    def _startOptionsWatcher(self) -> None:
+        if not self.optionsWatcher:
+            self.optionsWatcher = OptionsWatcher(self._onOptionsFileChanged, self._onOptionsFileError)
+            self.optionsWatcher.start()
+
+    def _stopOptionsWatcher(self) -> None:
+        if self.optionsWatcher:
+            self.optionsWatcher.stop()
+            self.optionsWatcher = None
         
-    def report(self, eventType:EventType, text:str) -> None:
+    def report(self, eventType:EventType, text:str, data:dict=None) -> None:
         logger.warning(text)
-        self.broadcaster.report(eventType, text=text)
\ No newline at end of file
+        self.broadcaster.report(eventType, text=text, data=data)
+        
+def checkRegions(backend, options:Options) -> None:
+    """Check that the regions in options are on screen, so that mistakes are reported now rather than on the first capture
+    Raises:
+        ValueError: If a region is outside every monitor
+    """
+    if not options.regions:
+        backend.checkRegion(options.region())
+    for region in options.regions:
+        backend.checkRegion(region.box(), f'Region {region.name}')
+
+def createDeduplicator(options:Options) -> Deduplicator:
+    """
+    Returns:
+        Deduplicator: The deduplicator configured in options, or None if dedupe is off
+    """
+    return Deduplicator(options.dedupe, options.dedupeDistance, options.dedupeHistory) if options.dedupe != 'off' else None
+
+def groupRegions(regions:list) -> dict:
+    """Group regions by the key that captures them
+    Args:
+        regions (list): Regions, as configured in Options
+    Returns:
+        dict: pynput key -> list of Regions. Regions without a hotkey are under None, and captured by F12.
+    """
+    groups = {}
+    for region in regions:
+        key = toKey(region.hotkey) if region.hotkey else None
+        groups.setdefault(key, []).append(region)
+    return groups
+
+def boundingBox(regions:list) -> tuple:
+    """
+    Args:
+        regions (list): Regions
+    Returns:
+        tuple: (x, y, width, height) of the smallest area containing all of the regions
+    """
+    left = min(region.xOffset for region in regions)
+    top = min(region.yOffset for region in regions)
+    right = max(region.xOffset + region.width for region in regions)
+    bottom = max(region.yOffset + region.height for region in regions)
+    return (left, top, right - left, bottom - top)
+
+def regionBoxes(regions:list, bounds:tuple) -> list:
+    """
+    Args:
+        regions (list): Regions
+        bounds (tuple): (x, y, width, height) of the grabbed area, containing all of the regions
+    Returns:
+        list: (box, name) of each region, box being its (left, upper, right, lower) within the grabbed area
+    """
+    boxes = []
+    for region in regions:
+        left = region.xOffset - bounds[0]
+        upper = region.yOffset - bounds[1]
+        boxes.append(((left, upper, left + region.width, upper + region.height), region.name))
+    return boxes
+
+def toKey(name:str):
+    """Convert a key name, such as 'f11' or 'p', into a pynput key
+    Args:
+        name (str): The name of a special key in pynput.keyboard.Key, or a single character
+    Raises:
+        ValueError: If name is not a known key
+    """
+    if len(name) == 1:
+        return KeyCode.from_char(name)
+    try:
+        return Key[name]
+    except KeyError:
+        raise ValueError(f'Unknown key: {name}')
@@ -1,78 +1,169 @@
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, date
 import logging
+import json
+import os
 import re
 
 logger = logging.getLogger(__name__)
 PREFIX = 'Screenshot '
 SUFFIX = '.png'
+SIDECAR_NAME = '.screenshot-index.json'
+# Matches the names of screenshots of any date and format, with or without a burst sub-index and region name.
+# Group 1 is the date, group 2 the index, and group 3 the region name, if any.
+NAME_REGEX = re.compile(re.escape(PREFIX) + r'(\d{4}-\d{2}-\d{2})_(\d+)(?:_\d+)?(?:_([A-Za-z][\w-]*))?\.\w+')
+# How many taken names in a row are skipped over after a rescan, before giving up
+MAX_COLLISIONS = 100
+# How many bursts or region groups are remembered, so that their screenshots keep sharing an index when they are interleaved
+MAX_GROUPS = 16
 
-class ScreenShotNamer(object):  
-    """ Handles screenshot events
-    """      
-    def __init__(self, parentDir:Path):
-        self.parent = parentDir   
+class ScreenShotNamer(object):
+    """ Hands out unused screenshot paths.
+    The folder is scanned once to find the highest index of each date, after which names are allocated from memory.
+    Files are created exclusively when a name is handed out, so there is no need to check whether a path is free.
+    """
+    def __init__(self, parentDir:Path, suffix:str=SUFFIX, sidecar:bool=False, otherDirs:tuple=()):
+        """
+        Args:
+            parentDir (Path): The folder screenshots are saved in
+            suffix (str, optional): The extension of the screenshots, including the dot. Defaults to SUFFIX.
+            sidecar (bool, optional): Remember the last index in a file in parentDir, so that the folder doesn't have to
+                be scanned again on the next run. Defaults to False.
+            otherDirs (tuple, optional): Other folders whose screenshots must not be given the same names, such as the
+                destination of screenshots saved to a spool. They are scanned, but names are only created in parentDir.
+        """
+        self.parent = parentDir
+        self.otherDirs = tuple(otherDirs)
+        self.suffix = suffix
+        self.sidecar = sidecar
         self.date = None
-        
-        
-    def nextName(self) -> str:
-        """ Generate the next file name. 
+        # burstId -> index shared by the screenshots of a burst or region group, most recent last
+        self._groups = {}
+        # Date string -> highest index on disk. Built on first use.
+        self._index = None
+
+
+    def nextName(self, burstIdx:int=None, label:str=None, day:date=None) -> str:
+        """ Generate the next file name.
+        Args:
+            burstIdx (int, optional): Position of the screenshot in its burst, if it belongs to one
+            label (str, optional): Name of the region the screenshot shows, if any
+            day (date, optional): The date the screenshot was taken. Defaults to today.
         Returns:
-            str: The name 
+            str: The name
         """
-        today = datetime.today().date()
-        if self.date != today:
-            logger.info('New date detected, resettign counters')
-            self.date = today
-            self.dateStr = datetime.today().strftime('%Y-%m-%d')
-            self.nameIdx = 0
-        
+        day = day or datetime.today().date()
+        if self.date != day:
+            logger.info('New date detected, resetting counters')
+            if self.date is not None:
+                self._index[self.dateStr] = self.nameIdx
+            self.date = day
+            self.dateStr = day.strftime('%Y-%m-%d')
+            self.nameIdx = self._highestIndex(self.dateStr)
+
         self.nameIdx += 1
-        
-        return self.fileNamePattern(str(self.nameIdx))
-    
-    def nextFreePath(self) -> Path:
-        """Build a path to a non-existing file
+
+        return self.fileNamePattern(self.indexStr(str(self.nameIdx), burstIdx, label))
+
+    def nextFreePath(self, burstId:int=None, burstIdx:int=None, label:str=None, day:date=None) -> Path:
+        """Create an empty file with an unused name, and return its path
+        Args:
+            burstId (int, optional): Identifies the burst or region group the screenshot belongs to. All screenshots of
+                a burst share the same index, and are told apart by their burstIdx and label.
+            burstIdx (int, optional): Position of the screenshot in its burst
+            label (str, optional): Name of the region the screenshot shows, if any
+            day (date, optional): The date the screenshot was taken. Defaults to today.
         Raises:
             ValueError: If no path could be generated (shouldn't happen)
         Returns:
             Path: A new path for a screenshot to be saved at
         """
-        nextPath = self.parent / self.nextName()
-        if not nextPath.exists():
+        if burstId is not None and burstId in self._groups:
+            nextPath = self.parent / self.fileNamePattern(self.indexStr(self._groups[burstId], burstIdx, label))
+            try:
+                createExclusive(nextPath)
+            except FileExistsError:
+                raise ValueError('Unable to find free path for burst screenshot!')
             return nextPath
-        
-        # Preexisting files were found, so we want to update the index so that it is equal to highest index on disk.
-        # That way, we don't have to execute this fallback more than once in normal circumstances
-        
-        logger.info(f'File already exists. Searching for a free path. Path: {nextPath}')
-        pattern = self.fileNamePattern('*')
-        conflicts = self.parent.glob(pattern=pattern)
-        self.nameIdx = self.getHighestIndex(conflicts)
-        nextPath = self.parent / self.nextName()
-        if nextPath.exists():
-            raise ValueError('Unable to find free path for screenshot!')
+
+        nextPath = self.findFreePath(burstIdx, label, day)
+        if burstId is not None:
+            self._groups[burstId] = str(self.nameIdx)
+            if len(self._groups) > MAX_GROUPS:
+                del self._groups[next(iter(self._groups))]
         return nextPath
-        
-    def getHighestIndex(self, paths: list) -> int:
-        """ Find the highest index present in the list
+
+    def findFreePath(self, burstIdx:int=None, label:str=None, day:date=None) -> Path:
+        """Create an empty file with a new index, and return its path
         Args:
-            paths (list): A list of paths to screenshot files
+            burstIdx (int, optional): Position of the screenshot in its burst, if it belongs to one
+            label (str, optional): Name of the region the screenshot shows, if any
+            day (date, optional): The date the screenshot was taken. Defaults to today.
+        Raises:
+            ValueError: If no path could be generated (shouldn't happen)
         Returns:
-            int: The highest index encountered or self.nameIdx. Whichever is higher.
+            Path: A new path for a screenshot to be saved at
         """
-        pat = re.compile(self.fileNamePattern(r'(\d+)'))
-        maxIdx = self.nameIdx
-        for path in paths:
-            m = pat.match(path.name)
-            if m:
-                idx = int(m.group(1))
-                if idx > maxIdx:
-                    maxIdx = idx
-            else:
-                logger.debug(f'Failed to match file to expected screenshot format: {path.name}')
-        return maxIdx
-    
+        nextPath = self.parent / self.nextName(burstIdx, label, day)
+        try:
+            createExclusive(nextPath)
+            return nextPath
+        except FileExistsError:
+            pass
+
+        # Something other than this namer wrote to the folder, or the sidecar is out of date.
+        # Rescan so that we don't have to execute this fallback more than once in normal circumstances
+
+        logger.info(f'File already exists. Rescanning for a free path. Path: {nextPath}')
+        self._index = self.scanIndex()
+        self.nameIdx = max(self.nameIdx, self._index.get(self.dateStr, 0))
+        for i in range(MAX_COLLISIONS):
+            nextPath = self.parent / self.nextName(burstIdx, label, day)
+            try:
+                createExclusive(nextPath)
+                return nextPath
+            except FileExistsError:
+                logger.debug(f'File already exists: {nextPath}')
+        raise ValueError('Unable to find free path for screenshot!')
+
+    def prewarm(self) -> None:
+        """ Read the sidecar or scan the folder now, rather than when the first name is needed
+        """
+        self._highestIndex(datetime.today().strftime('%Y-%m-%d'))
+
+    def scanIndex(self) -> dict:
+        """ Scan the folder, and the other folders, for screenshots
+        Returns:
+            dict: The highest index found for each date string. Dates with no screenshots are absent.
+        """
+        index = {}
+        for folder in (self.parent,) + self.otherDirs:
+            if not folder.is_dir():
+                continue
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    m = NAME_REGEX.fullmatch(entry.name)
+                    if m:
+                        idx = int(m.group(2))
+                        if idx > index.get(m.group(1), 0):
+                            index[m.group(1)] = idx
+            logger.info(f'Scanned {folder} for screenshots')
+        return index
+
+    def close(self) -> None:
+        """ Write the sidecar, if enabled
+        """
+        if not self.sidecar or self.date is None:
+            return
+        sidecarPath = self.parent / SIDECAR_NAME
+        tmpPath = sidecarPath.with_name(SIDECAR_NAME + '.tmp')
+        try:
+            with open(tmpPath, 'w') as f:
+                json.dump({self.dateStr: self.nameIdx}, f)
+            os.replace(tmpPath, sidecarPath)
+        except OSError:
+            logger.exception('Failed to write screenshot index sidecar')
+
     def fileNamePattern(self, idxStr: str) -> str:
         """ Create a file name, swapping in idxStr where the index should be
         Args:
@@ -80,6 +171,51 @@ class ScreenShotNamer(object):
         Returns:
             str: A standard screenshot name with idxStr at the index position
         """
-        return PREFIX + self.dateStr + '_' + idxStr + SUFFIX
-        
-        
\ No newline at end of file
+        return PREFIX + self.dateStr + '_' + idxStr + self.suffix
+
+    def indexStr(self, idxStr: str, burstIdx: int=None, label: str=None) -> str:
+        """ Append the burst sub-index and the region name to idxStr, if there are any
+        Args:
+            idxStr (str): The screenshot's index
+            burstIdx (int, optional): Position of the screenshot in its burst
+            label (str, optional): Name of the region the screenshot shows
+        Returns:
+            str: idxStr for single screenshots, idxStr_burstIdx for screenshots in a burst, followed by _label for regions
+        """
+        if burstIdx is not None:
+            idxStr = f'{idxStr}_{burstIdx:03d}'
+        if label:
+            idxStr = f'{idxStr}_{label}'
+        return idxStr
+
+    def _highestIndex(self, dateStr: str) -> int:
+        """ The highest index used on dateStr, from the sidecar if there is one, from a scan of the folder otherwise
+        """
+        if self._index is None:
+            self._index = self._readSidecar()
+            if self._index is None:
+                self._index = self.scanIndex()
+        return self._index.get(dateStr, 0)
+
+    def _readSidecar(self) -> dict:
+        """
+        Returns:
+            dict: The sidecar's contents, or None if sidecars are disabled or it couldn't be read
+        """
+        if not self.sidecar:
+            return None
+        try:
+            with open(self.parent / SIDECAR_NAME, 'r') as f:
+                return {str(k): int(v) for k, v in json.load(f).items()}
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.exception('Failed to read screenshot index sidecar, scanning instead')
+            return None
+
+def createExclusive(path: Path) -> None:
+    """ Create an empty file at path
+    Raises:
+        FileExistsError: If there is already a file at path
+    """
+    os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
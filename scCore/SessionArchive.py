@@ -0,0 +1,523 @@
+"""A single file holding all the screenshots of a listening session, for sessions of many near-identical screenshots,
+such as bursts of a mostly static window.
+
+Every few screenshots, and whenever the size or region changes, a keyframe is stored as a complete PNG. The other
+screenshots are stored as a delta against the previous screenshot of the same region: the XOR of the two, of which
+only the rows that changed are kept, compressed with zlib. A screenshot whose delta would be bigger than its region's
+last keyframe, such as after a window is switched, is stored as a keyframe instead. An index at the end of the file gives the position
+of every screenshot, so that any of them can be rebuilt by reading its keyframe and the deltas since.
+
+Layout:
+    MAGIC
+    Records, one per screenshot: RECORD_HEADER (tag, kind, width, height, meta length, data length), meta as JSON, data
+    Index as JSON
+    TRAILER (index position, tag)
+If the program stopped before writing the index, it is rebuilt by reading the records.
+"""
+from scCore.Encoders import createEncoder
+from datetime import datetime
+from pathlib import Path
+import threading
+import logging
+import struct
+import json
+import zlib
+import io
+import os
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = '.scarc'
+ARCHIVE_PREFIX = 'Session '
+MAGIC = b'SCARC\x00\x01\n'
+RECORD_TAG = b'FRAM'
+INDEX_TAG = b'SCIX'
+# tag, kind, width, height, meta length, data length
+RECORD_HEADER = struct.Struct('>4sBIIII')
+# index position, tag
+TRAILER = struct.Struct('>Q4s')
+# Number of ranges of changed rows at the start of delta data, then the first and last row + 1 of each
+RANGE_COUNT = struct.Struct('>I')
+ROW_RANGE = struct.Struct('>II')
+KIND_KEYFRAME = 0
+KIND_DELTA = 1
+# A keyframe is stored at least once every this many screenshots of a region
+KEYFRAME_INTERVAL = 30
+
+class SessionArchive(object):
+    """Appends screenshots to a session archive. See the module documentation for the format.
+    Screenshots must be appended in the order they were taken. Thread safe: threads that prepare screenshots in
+    parallel keep their order by reserving a slot for each first, see reserve.
+    """
+    def __init__(self, folder:Path, keyframeInterval:int=KEYFRAME_INTERVAL, compressLevel:int=6, pngStrategy:str='default'):
+        """
+        Args:
+            folder (Path): Folder archives are created in
+            keyframeInterval (int, optional): Maximum number of screenshots of a region between two keyframes. Defaults to KEYFRAME_INTERVAL.
+            compressLevel (int, optional): zlib compression level of keyframes and deltas. Defaults to 6.
+            pngStrategy (str, optional): PNG compression strategy of keyframes. Defaults to 'default'.
+        """
+        self.folder = folder
+        self.keyframeInterval = keyframeInterval
+        self.compressLevel = compressLevel
+        self._keyframeEncoder = createEncoder('png', compressLevel, pngStrategy)
+        self._lock = threading.Lock()
+        # Notified each time a slot moves on, so that the screenshot of the next slot can take its turn
+        self._turn = threading.Condition(self._lock)
+        # Next slot handed out by reserve, slot of the next screenshot to be compared with the previous one, and slot
+        # of the next screenshot to be written. Screenshots are encoded in parallel between the two.
+        self._nextSlot = 0
+        self._slot = 0
+        self._writeSlot = 0
+        self.path = None
+        self._file = None
+        self._frames = []
+        # (label, width, height) -> slot, raw pixels, and number of screenshots since the keyframe of the last screenshot
+        self._chains = {}
+        # (label, width, height) -> slot and number of the last screenshot written, which the next delta refers to
+        self._written = {}
+        # Size of the PNG of each chain's last keyframe, which deltas are assumed to be about the same size as
+        self._keyframePngSize = {}
+        self.pngEstimate = 0
+
+    def open(self) -> Path:
+        """Create a new archive, named after the current time
+        Returns:
+            Path: The archive
+        """
+        with self._lock:
+            self._open()
+            return self.path
+
+    def reopen(self, folder:Path) -> dict:
+        """Close the current archive, and create a new one in folder. Screenshots appended meanwhile wait, rather
+        than fail.
+        Returns:
+            dict: Summary of the closed archive, see summary, or None if none was open
+        """
+        with self._lock:
+            summary = self._close() if self._file else None
+            self.folder = folder
+            self._open()
+            return summary
+
+    def reserve(self) -> int:
+        """Keep a place in the order of the archive for a screenshot that is still being prepared. Each slot must
+        then be given to append or skip, as the screenshots of later slots wait for it.
+        Returns:
+            int: The slot
+        """
+        with self._lock:
+            return self._reserve()
+
+    def skip(self, slot:int) -> None:
+        """Give up a slot from reserve, for a screenshot that won't be appended
+        """
+        with self._lock:
+            self._turn.wait_for(lambda: self._slot == slot)
+            self._endTurn()
+            self._turn.wait_for(lambda: self._writeSlot == slot)
+            self._endWrite()
+
+    def append(self, image, burstId:int=None, burstIdx:int=None, label:str=None, slot:int=None, captured:datetime=None) -> int:
+        """Add a screenshot to the archive. Only the comparison with the previous screenshot of the region waits for
+        the screenshots of earlier slots, the compression runs in parallel, and the screenshot is then written in
+        slot order.
+        Args:
+            image (PIL.Image.Image): The screenshot
+            burstId (int, optional): Identifies the burst or region group the screenshot belongs to, if any
+            burstIdx (int, optional): Position of the screenshot in its burst
+            label (str, optional): Name of the region the screenshot shows, if any
+            slot (int, optional): From reserve. Defaults to a new slot, after those already reserved.
+            captured (datetime, optional): When the screenshot was taken. Defaults to now.
+        Raises:
+            ValueError: If the archive isn't open
+        Returns:
+            int: Number of the screenshot in the archive, from 0
+        """
+        if slot is None:
+            slot = self.reserve()
+        meta = {'time': (captured or datetime.now()).isoformat(), 'burstId': burstId, 'burstIdx': burstIdx, 'label': label}
+        ref = data = chainKey = error = None
+        compared = False
+        try:
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            raw = image.tobytes()
+            chainKey = (label,) + image.size
+            with self._lock:
+                self._turn.wait_for(lambda: self._slot == slot)
+                try:
+                    ref, delta, keyframeSize = self._compare(chainKey, raw, slot)
+                finally:
+                    compared = True
+                    self._endTurn()
+            if delta is not None:
+                data = packDelta(delta[0], delta[1], self.compressLevel)
+                # The keyframe of the region may still be being written by another thread
+                if keyframeSize is not None and len(data) > keyframeSize:
+                    ref = data = None
+            if data is None:
+                data = self._encodeKeyframe(image)
+        except BaseException as e:
+            # Kept to be raised on the screenshot's turn to be written, so that later screenshots don't wait for it
+            error = e
+        with self._lock:
+            if not compared:
+                self._turn.wait_for(lambda: self._slot == slot)
+                self._endTurn()
+            self._turn.wait_for(lambda: self._writeSlot == slot)
+            try:
+                if error:
+                    raise error
+                return self._write(image, chainKey, slot, ref, data, meta)
+            finally:
+                self._endWrite()
+
+    def _reserve(self) -> int:
+        slot = self._nextSlot
+        self._nextSlot += 1
+        return slot
+
+    def _endTurn(self) -> None:
+        self._slot += 1
+        self._turn.notify_all()
+
+    def _endWrite(self) -> None:
+        self._writeSlot += 1
+        self._turn.notify_all()
+
+    def _compare(self, chainKey:tuple, raw:bytes, slot:int) -> tuple:
+        """Decide whether a screenshot is stored as a keyframe or as a delta, and take the delta. Must be called while
+        holding _lock, on the screenshot's turn.
+        Returns:
+            tuple: Slot of the screenshot the delta refers to, the ranges and rows of the delta as from xorRows, and
+                the size of the region's last keyframe. All None for a keyframe.
+        """
+        chain = self._chains.get(chainKey)
+        if chain is not None and chain[2] + 1 < self.keyframeInterval:
+            delta = xorRows(chain[1], raw, chainKey[1] * 3)
+            self._chains[chainKey] = (slot, raw, chain[2] + 1)
+            return chain[0], delta, self._keyframePngSize.get(chainKey)
+        self._chains[chainKey] = (slot, raw, 0)
+        return None, None, None
+
+    def _encodeKeyframe(self, image) -> bytes:
+        buffer = io.BytesIO()
+        self._keyframeEncoder.encode(image, buffer)
+        return buffer.getvalue()
+
+    def _write(self, image, chainKey:tuple, slot:int, ref:int, data:bytes, meta:dict) -> int:
+        """Write a screenshot's record. Must be called while holding _lock, on the screenshot's turn to be written.
+        Args:
+            ref (int): Slot of the screenshot the delta in data refers to, or None if data is a keyframe
+        Returns:
+            int: Number of the screenshot in the archive
+        """
+        if not self._file:
+            raise ValueError('The session archive is not open')
+        refNumber = None
+        if ref is not None:
+            written = self._written.get(chainKey)
+            if written is not None and written[0] == ref:
+                refNumber = written[1]
+            else:
+                # The screenshot the delta refers to failed, or went to the previous archive
+                data = self._encodeKeyframe(image)
+        number = len(self._frames)
+        if refNumber is None:
+            kind = KIND_KEYFRAME
+            self._keyframePngSize[chainKey] = len(data)
+        else:
+            kind = KIND_DELTA
+        self._written[chainKey] = (slot, number)
+        self.pngEstimate += self._keyframePngSize[chainKey]
+        meta = dict(meta, ref=refNumber)
+        width, height = image.size
+        metaBytes = json.dumps(meta).encode()
+        offset = self._file.tell()
+        self._file.write(RECORD_HEADER.pack(RECORD_TAG, kind, width, height, len(metaBytes), len(data)))
+        self._file.write(metaBytes)
+        self._file.write(data)
+        self._frames.append(dict(meta, kind=kind, width=width, height=height, offset=offset, size=RECORD_HEADER.size + len(metaBytes) + len(data)))
+        return number
+
+    def close(self) -> dict:
+        """Write the index and close the archive
+        Returns:
+            dict: See summary, or None if no archive was open
+        """
+        with self._lock:
+            if not self._file:
+                return None
+            return self._close()
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            dict: Path of the archive, number of screenshots and keyframes, size in bytes, the estimated size of the
+                screenshots as PNG files, and the ratio between the two
+        """
+        with self._lock:
+            return self._summary()
+
+    def _open(self) -> None:
+        self.folder.mkdir(parents=True, exist_ok=True)
+        stem = ARCHIVE_PREFIX + datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        path = self.folder / (stem + ARCHIVE_SUFFIX)
+        count = 1
+        while True:
+            try:
+                self._file = open(path, 'xb')
+                break
+            except FileExistsError:
+                count += 1
+                path = self.folder / f'{stem}_{count}{ARCHIVE_SUFFIX}'
+        self.path = path
+        self._file.write(MAGIC)
+        self._frames = []
+        self._chains = {}
+        self._written = {}
+        self._keyframePngSize = {}
+        self.pngEstimate = 0
+        logger.info(f'Session archive created: {path}')
+
+    def _close(self) -> dict:
+        indexOffset = self._file.tell()
+        self._file.write(json.dumps({'frames': self._frames}).encode())
+        self._file.write(TRAILER.pack(indexOffset, INDEX_TAG))
+        self._file.close()
+        self._file = None
+        # The pixels of the last screenshots are no longer needed
+        self._chains = {}
+        summary = self._summary()
+        logger.info(summaryText(summary))
+        return summary
+
+    def _summary(self) -> dict:
+        size = self._file.tell() if self._file else (self.path.stat().st_size if self.path else 0)
+        return {
+            'path': str(self.path),
+            'frames': len(self._frames),
+            'keyframes': sum(1 for frame in self._frames if frame['kind'] == KIND_KEYFRAME),
+            'bytes': size,
+            'pngBytes': self.pngEstimate,
+            'ratio': self.pngEstimate / size if size else 0.0
+            }
+
+class ArchiveReader(object):
+    """Reads the screenshots of a session archive, in any order
+    """
+    def __init__(self, path:Path):
+        """
+        Args:
+            path (Path): The archive
+        Raises:
+            ValueError: If path isn't a session archive
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        if self._file.read(len(MAGIC)) != MAGIC:
+            self._file.close()
+            raise ValueError(f'Not a session archive: {path}')
+        self.frames = self._readIndex()
+        # (label, width, height) -> number and raw pixels of the last screenshot rebuilt, so that reading in order
+        # only applies one delta per screenshot
+        self._cache = {}
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def image(self, number:int):
+        """Rebuild a screenshot
+        Args:
+            number (int): Its number in the archive, from 0
+        Returns:
+            PIL.Image.Image: The screenshot
+        """
+        from PIL import Image
+        frame = self.frames[number]
+        chainKey = (frame['label'], frame['width'], frame['height'])
+        cached = self._cache.get(chainKey)
+        # Numbers from the wanted screenshot back to its keyframe, or to the last screenshot rebuilt
+        chain = [number]
+        while self.frames[chain[-1]]['kind'] == KIND_DELTA and not (cached and chain[-1] == cached[0]):
+            chain.append(self.frames[chain[-1]]['ref'])
+        raw = None
+        for current in reversed(chain):
+            if cached and current == cached[0]:
+                # Copied, as the deltas are applied in place
+                raw = bytearray(cached[1])
+                continue
+            data = self._readData(current)
+            if self.frames[current]['kind'] == KIND_KEYFRAME:
+                with Image.open(io.BytesIO(data)) as keyframe:
+                    raw = bytearray(keyframe.convert('RGB').tobytes())
+            else:
+                applyDelta(raw, data, frame['width'] * 3)
+        self._cache[chainKey] = (number, raw)
+        return Image.frombytes('RGB', (frame['width'], frame['height']), bytes(raw))
+
+    def info(self, number:int) -> dict:
+        """
+        Returns:
+            dict: time, burstId, burstIdx, label, kind, width and height of a screenshot
+        """
+        return self.frames[number]
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _readData(self, number:int) -> bytes:
+        frame = self.frames[number]
+        self._file.seek(frame['offset'])
+        tag, kind, width, height, metaLength, dataLength = RECORD_HEADER.unpack(self._file.read(RECORD_HEADER.size))
+        self._file.seek(metaLength, os.SEEK_CUR)
+        return self._file.read(dataLength)
+
+    def _readIndex(self) -> list:
+        """Read the index at the end of the file, or rebuild it from the records if the archive wasn't closed
+        """
+        end = self._file.seek(0, os.SEEK_END)
+        if end >= len(MAGIC) + TRAILER.size:
+            self._file.seek(end - TRAILER.size)
+            indexOffset, tag = TRAILER.unpack(self._file.read(TRAILER.size))
+            if tag == INDEX_TAG and len(MAGIC) <= indexOffset < end:
+                self._file.seek(indexOffset)
+                return json.loads(self._file.read(end - TRAILER.size - indexOffset))['frames']
+        logger.warning(f'{self.path} has no index, it was not closed. Reading its screenshots one by one.')
+        frames = []
+        offset = len(MAGIC)
+        self._file.seek(offset)
+        while True:
+            header = self._file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            tag, kind, width, height, metaLength, dataLength = RECORD_HEADER.unpack(header)
+            if tag != RECORD_TAG:
+                break
+            meta = self._file.read(metaLength)
+            if len(meta) < metaLength or self._file.seek(dataLength, os.SEEK_CUR) > end:
+                # Cut off while being written
+                break
+            size = RECORD_HEADER.size + metaLength + dataLength
+            frames.append(dict(json.loads(meta), kind=kind, width=width, height=height, offset=offset, size=size))
+            offset += size
+        return frames
+
+def encodeDelta(previous:bytes, current:bytes, rowBytes:int, compressLevel:int=6) -> bytes:
+    """
+    Args:
+        rowBytes (int): Size of a row of pixels, in bytes
+    Returns:
+        bytes: The rows that differ between previous and current, XORed together and compressed, preceded by the
+            ranges of rows they come from
+    """
+    ranges, rows = xorRows(previous, current, rowBytes)
+    return packDelta(ranges, rows, compressLevel)
+
+def xorRows(previous:bytes, current:bytes, rowBytes:int) -> tuple:
+    """
+    Args:
+        rowBytes (int): Size of a row of pixels, in bytes
+    Returns:
+        tuple: The ranges of rows that differ between previous and current, as (first, last + 1) pairs, and those
+            rows XORed together
+    """
+    try:
+        import numpy
+        xor = numpy.bitwise_xor(numpy.frombuffer(previous, numpy.uint8), numpy.frombuffer(current, numpy.uint8)).reshape(-1, rowBytes)
+        changed = xor.any(axis=1)
+        # Rows where changed starts or stops, in pairs
+        edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(([0], changed.view(numpy.int8), [0]))))
+        ranges = edges.reshape(-1, 2).tolist()
+        rows = xor[changed].tobytes()
+    except ImportError:
+        ranges = [(0, len(current) // rowBytes)]
+        rows = xorBytes(previous, current)
+    return ranges, rows
+
+def packDelta(ranges:list, rows:bytes, compressLevel:int=6) -> bytes:
+    """
+    Returns:
+        bytes: Delta data, the ranges of rows from xorRows followed by the rows compressed
+    """
+    header = RANGE_COUNT.pack(len(ranges)) + b''.join(ROW_RANGE.pack(first, last) for first, last in ranges)
+    return header + zlib.compress(rows, compressLevel)
+
+def applyDelta(pixels:bytearray, data:bytes, rowBytes:int) -> None:
+    """Turn the screenshot data was encoded from by encodeDelta into the next one, in place
+    Args:
+        pixels (bytearray): The previous screenshot
+        data (bytes): The delta
+        rowBytes (int): Size of a row of pixels, in bytes
+    """
+    count, = RANGE_COUNT.unpack_from(data)
+    ranges = [ROW_RANGE.unpack_from(data, RANGE_COUNT.size + i * ROW_RANGE.size) for i in range(count)]
+    if not ranges:
+        return
+    rows = zlib.decompress(data[RANGE_COUNT.size + count * ROW_RANGE.size:])
+    offset = 0
+    try:
+        import numpy
+        target = numpy.frombuffer(pixels, numpy.uint8)
+        source = numpy.frombuffer(rows, numpy.uint8)
+        for first, last in ranges:
+            size = (last - first) * rowBytes
+            target[first * rowBytes:last * rowBytes] ^= source[offset:offset + size]
+            offset += size
+    except ImportError:
+        for first, last in ranges:
+            size = (last - first) * rowBytes
+            pixels[first * rowBytes:last * rowBytes] = xorBytes(pixels[first * rowBytes:last * rowBytes], rows[offset:offset + size])
+            offset += size
+
+def xorBytes(first:bytes, second:bytes) -> bytes:
+    return (int.from_bytes(first, 'little') ^ int.from_bytes(second, 'little')).to_bytes(len(first), 'little')
+
+def summaryText(summary:dict) -> str:
+    return (f"{summary['frames']} screenshots ({summary['keyframes']} keyframes) in {summary['path']}: "
+            f"{summary['bytes'] / (1024 * 1024):.1f} MB, where PNG files would take about {summary['pngBytes'] / (1024 * 1024):.1f} MB ({summary['ratio']:.1f}x)")
+
+def exportArchive(path:Path, namer, encoder, numbers:list=None, onProgress=None) -> dict:
+    """Rebuild screenshots of an archive as image files, named as if they had been saved when they were taken
+    Args:
+        path (Path): The archive
+        namer (ScreenShotNamer): Names the files. Its suffix should match the encoder's.
+        encoder (Encoder): The format of the files
+        numbers (list, optional): Numbers of the screenshots to export. Defaults to all of them.
+        onProgress (Callable, optional): Called with the number of screenshots exported so far, and the total
+    Returns:
+        dict: Number of files written, their total size in bytes, the size of the archive, and the ratio between the two
+    """
+    reader = ArchiveReader(path)
+    try:
+        numbers = range(len(reader)) if numbers is None else numbers
+        written = 0
+        for count, number in enumerate(numbers, 1):
+            info = reader.info(number)
+            day = datetime.fromisoformat(info['time']).date()
+            target = namer.nextFreePath(info['burstId'], info['burstIdx'], info['label'], day)
+            with open(target, 'wb') as f:
+                encoder.encode(reader.image(number), f)
+            written += target.stat().st_size
+            if onProgress:
+                onProgress(count, len(numbers))
+    finally:
+        reader.close()
+    namer.close()
+    size = path.stat().st_size
+    return {'files': len(numbers), 'bytes': written, 'archiveBytes': size, 'ratio': written / size if size else 0.0}
+
+def parseFrames(text:str) -> list:
+    """Read a list of screenshot numbers given on the command line
+    Args:
+        text (str): Numbers and ranges separated by commas, such as 0-9,15
+    Raises:
+        ValueError: If text doesn't follow this format
+    """
+    numbers = []
+    for part in text.split(','):
+        first, dash, last = part.strip().partition('-')
+        numbers.extend(range(int(first), int(last) + 1) if dash else [int(first)])
+    return numbers
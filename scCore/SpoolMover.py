@@ -0,0 +1,250 @@
+from scCore.Broadcaster import Broadcaster, EventType
+from scCore.ScreenshotNamer import NAME_REGEX
+from collections import deque
+from pathlib import Path
+import threading
+import logging
+import shutil
+import errno
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Suffix of files being written, in the spool or the destination. They are never moved.
+PART_SUFFIX = '.part'
+# Files a mover takes from the backlog at once
+BATCH_SIZE = 16
+# Seconds waited after a failed move, doubled after each further failure
+RETRY_DELAY = 1
+MAX_RETRY_DELAY = 60
+# Seconds between two backlog reports
+REPORT_INTERVAL = 1
+# Seconds stop waits for the backlog to be moved. Anything left is moved on the next start.
+DRAIN_TIMEOUT = 30
+
+class SpoolMover(object):
+    """Moves screenshots written to a fast local spool folder to their destination in the background, so that slow
+    or network destinations don't delay captures. Files keep the names they were given in the spool, and are moved
+    in the order they were added. A file only appears in the destination once it has been copied completely.
+    """
+    def __init__(self, spoolDir:Path, destination:Path, broadcaster:Broadcaster, movers:int=2):
+        """
+        Args:
+            spoolDir (Path): Local folder screenshots are written to first
+            destination (Path): Folder screenshots are moved to. Can be changed while moving, files already added
+                are still moved to the destination they were added with.
+            broadcaster (Broadcaster): Informed of the backlog and of failed moves
+            movers (int, optional): Number of files moved at the same time. Defaults to 2.
+        """
+        self.spoolDir = spoolDir
+        self.destination = destination
+        self.broadcaster = broadcaster
+        self._moverCount = movers
+        self._backlog = deque()
+        self._backlogBytes = 0
+        # Files taken by a mover but not moved yet, and their size in bytes
+        self._moving = 0
+        self._movingBytes = 0
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._threads = []
+        self._lastReport = 0
+        self._reportedBacklog = None
+        self.moved = 0
+
+    def start(self) -> None:
+        """Queue the screenshots left in the spool by a previous run, and start moving. Does not block.
+        """
+        self.spoolDir.mkdir(parents=True, exist_ok=True)
+        # Files left over by the previous stop of this mover keep their destination, the others go to the current one
+        with self._condition:
+            destinations = {path: destination for path, _, destination in self._backlog}
+            self._backlog.clear()
+            self._backlogBytes = 0
+        leftovers = self.recover()
+        if leftovers:
+            logger.warning(f'{len(leftovers)} screenshots left in the spool by a previous run, moving them to {self.destination}')
+        for path in leftovers:
+            self.add(path, destinations.get(path))
+        self._stopping = False
+        for i in range(self._moverCount):
+            thread = threading.Thread(target=self._run, name=f'SpoolMover-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout:float=DRAIN_TIMEOUT) -> int:
+        """Wait for the backlog to be moved, up to timeout seconds, then stop the movers
+        Returns:
+            int: Number of screenshots left in the spool
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while (self._backlog or self._moving) and time.monotonic() < deadline:
+                self._condition.wait(deadline - time.monotonic())
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        left = len(self._backlog)
+        if left:
+            logger.warning(f'{left} screenshots could not be moved to {self.destination} in time. They will be moved on the next start.')
+        self._report(force=True)
+        return left
+
+    def add(self, path:Path, destination:Path=None) -> None:
+        """Queue a complete screenshot of the spool to be moved
+        Args:
+            path (Path): The screenshot
+            destination (Path, optional): Folder it is moved to. Defaults to self.destination.
+        """
+        try:
+            size = path.stat().st_size
+        except OSError:
+            size = 0
+        with self._condition:
+            self._backlog.append((path, size, destination or self.destination))
+            self._backlogBytes += size
+            self._condition.notify()
+        self._report()
+
+    def backlog(self) -> tuple:
+        """
+        Returns:
+            tuple: Number of screenshots waiting to be moved, and their total size in bytes
+        """
+        with self._condition:
+            return (len(self._backlog) + self._moving, self._backlogBytes + self._movingBytes)
+
+    def recover(self) -> list:
+        """Clean up the spool after a previous run
+        Returns:
+            list: Paths of the complete screenshots found, in name order. Unfinished files and empty placeholders are deleted.
+        """
+        found = []
+        with os.scandir(self.spoolDir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith(PART_SUFFIX) or (NAME_REGEX.fullmatch(entry.name) and entry.stat().st_size == 0):
+                    logger.info(f'Deleting unfinished file from the spool: {entry.name}')
+                    os.unlink(entry.path)
+                elif NAME_REGEX.fullmatch(entry.name):
+                    found.append(Path(entry.path))
+        return sorted(found, key=nameOrder)
+
+    def _run(self) -> None:
+        """Mover loop: take batches off the backlog and move them, waiting longer after each failure
+        """
+        delay = RETRY_DELAY
+        while True:
+            with self._condition:
+                while not self._backlog and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                batch = [self._backlog.popleft() for i in range(min(BATCH_SIZE, len(self._backlog)))]
+                batchBytes = sum(size for _, size, _ in batch)
+                self._moving += len(batch)
+                self._backlogBytes -= batchBytes
+                self._movingBytes += batchBytes
+            failed = self._moveBatch(batch)
+            with self._condition:
+                self._moving -= len(batch)
+                self._movingBytes -= batchBytes
+                # Put failed files back at the front, so that they keep their place in the order
+                self._backlog.extendleft(reversed(failed))
+                self._backlogBytes += sum(size for _, size, _ in failed)
+                self._condition.notify_all()
+            self._report()
+            if failed:
+                self.report(EventType.FAILURE, f'Failed to move {len(failed)} screenshots to {failed[0][2]}, retrying in {delay}s')
+                with self._condition:
+                    self._condition.wait_for(lambda: self._stopping, delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+            else:
+                delay = RETRY_DELAY
+
+    def _moveBatch(self, batch:list) -> list:
+        """
+        Returns:
+            list: The entries of batch that could not be moved. Once a move fails, the rest of the batch isn't tried.
+        """
+        for i, (path, size, destination) in enumerate(batch):
+            try:
+                moveFile(path, destination / path.name)
+                self.moved += 1
+            except FileExistsError:
+                logger.error(f'Not moving {path.name}, a file with the same name is already in {destination}')
+                self.report(EventType.FAILURE, f'{path.name} already exists in {destination}, it was left in the spool')
+            except OSError:
+                logger.exception(f'Failed to move {path} to {destination}')
+                return batch[i:]
+        return []
+
+    def _report(self, force:bool=False) -> None:
+        """Broadcast the backlog when it changed, at most once per REPORT_INTERVAL unless forced
+        """
+        now = time.monotonic()
+        if not force and now - self._lastReport < REPORT_INTERVAL:
+            return
+        files, size = self.backlog()
+        if (files, size) == self._reportedBacklog:
+            return
+        self._lastReport = now
+        self._reportedBacklog = (files, size)
+        self.broadcaster.report(EventType.BACKLOG, f'Spool backlog: {files} screenshots, {size / (1024 * 1024):.1f} MB', {'files': files, 'bytes': size})
+
+    def report(self, eventType:EventType, text:str) -> None:
+        logger.warning(text)
+        self.broadcaster.report(eventType, text=text)
+
+def moveFile(source:Path, target:Path) -> None:
+    """Move source to target. target only appears once it is complete, even when it is on another drive.
+    Raises:
+        FileExistsError: If target already exists
+        OSError: If the move failed
+    """
+    try:
+        publishFile(source, target)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    partPath = target.with_name(target.name + PART_SUFFIX)
+    try:
+        shutil.copyfile(source, partPath)
+        publishFile(partPath, target)
+    except BaseException:
+        partPath.unlink(missing_ok=True)
+        raise
+    os.unlink(source)
+
+def publishFile(source:Path, target:Path) -> None:
+    """Rename source to target, on the same drive, without ever replacing a file already named target. A hard link
+    is made then the old name removed, as linking fails if target exists, where renaming replaces it on POSIX.
+    Raises:
+        FileExistsError: If target already exists
+        OSError: If the rename failed, with errno EXDEV if target is on another drive
+    """
+    try:
+        os.link(source, target)
+    except (FileExistsError, FileNotFoundError):
+        raise
+    except OSError as e:
+        if e.errno == errno.EXDEV:
+            raise
+        # No hard links on this drive, such as FAT or some network shares. Renaming never replaces a file on Windows,
+        # elsewhere a file appearing between the check and the rename would be replaced.
+        if os.path.lexists(target):
+            raise FileExistsError(errno.EEXIST, 'File exists', str(target))
+        os.rename(source, target)
+        return
+    os.unlink(source)
+
+def nameOrder(path:Path) -> tuple:
+    """Sort key putting screenshots in the order they were named
+    """
+    m = NAME_REGEX.fullmatch(path.name)
+    return (m.group(1), int(m.group(2)), path.name)
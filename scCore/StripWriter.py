@@ -0,0 +1,85 @@
+"""Encoders that read the image a strip of rows at a time and write each strip as soon as it is encoded, so that
+encoding a large region needs memory for a few rows rather than for a copy of the region and of the encoded file.
+"""
+import struct
+import zlib
+
+# Rows encoded at once. A strip of a 7680 pixel wide region holds about 350 KB of pixels.
+STRIP_ROWS = 16
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# PNG row filters tried on every row. Average and Paeth are left out, as they are much slower to compute with numpy
+# for little gain on screenshots.
+FILTER_NONE = 0
+FILTER_SUB = 1
+FILTER_UP = 2
+
+def writePngStrips(image, box:tuple, fp, compressLevel:int=6, strategy:int=0, rows:int=STRIP_ROWS) -> None:
+    """Write the box part of an RGB image to fp as a PNG, one strip at a time. Each row is filtered with whichever
+    of the none, sub and up filters gives the smallest values, as zlib compresses those best.
+    Args:
+        image (PIL.Image.Image): An RGB image
+        box (tuple): (left, upper, right, lower) part of image to write. None for all of it.
+        fp (BinaryIO): Where the PNG is written
+        compressLevel (int, optional): zlib compression level. Defaults to 6.
+        strategy (int, optional): zlib strategy, see Encoders.PNG_STRATEGIES. Defaults to 0.
+        rows (int, optional): Rows encoded at once. Defaults to STRIP_ROWS.
+    Raises:
+        ImportError: If numpy isn't installed
+    """
+    import numpy
+    left, upper, right, lower = box or (0, 0) + image.size
+    width = right - left
+    stride = width * 3
+    fp.write(PNG_SIGNATURE)
+    writeChunk(fp, b'IHDR', struct.pack('>IIBBBBB', width, lower - upper, 8, 2, 0, 0, 0))
+    compressor = zlib.compressobj(compressLevel, zlib.DEFLATED, 15, 9, strategy)
+    # Allocated once and reused for every strip
+    filtered = numpy.empty((3, rows, stride), numpy.uint8)
+    magnitudes = numpy.empty((rows, stride), numpy.uint8)
+    costs = numpy.empty((3, rows), numpy.uint64)
+    out = numpy.empty((rows, stride + 1), numpy.uint8)
+    previous = numpy.zeros(stride, numpy.uint8)
+    for top in range(upper, lower, rows):
+        count = min(rows, lower - top)
+        strip = numpy.asarray(image.crop((left, top, right, top + count))).reshape(count, stride)
+        none, sub, up = filtered[FILTER_NONE, :count], filtered[FILTER_SUB, :count], filtered[FILTER_UP, :count]
+        none[:] = strip
+        sub[:, :3] = strip[:, :3]
+        numpy.subtract(strip[:, 3:], strip[:, :-3], out=sub[:, 3:])
+        numpy.subtract(strip[0], previous, out=up[0])
+        numpy.subtract(strip[1:], strip[:-1], out=up[1:])
+        for rowFilter in (FILTER_NONE, FILTER_SUB, FILTER_UP):
+            # Filtered bytes are compared as signed values, so 255 counts as small as 1
+            numpy.negative(filtered[rowFilter, :count], out=magnitudes[:count])
+            numpy.minimum(filtered[rowFilter, :count], magnitudes[:count], out=magnitudes[:count])
+            magnitudes[:count].sum(axis=1, dtype=numpy.uint64, out=costs[rowFilter, :count])
+        best = costs[:, :count].argmin(axis=0)
+        out[:count, 0] = best
+        for rowFilter in (FILTER_NONE, FILTER_SUB, FILTER_UP):
+            chosen = best == rowFilter
+            out[:count, 1:][chosen] = filtered[rowFilter, :count][chosen]
+        data = compressor.compress(out[:count])
+        if data:
+            writeChunk(fp, b'IDAT', data)
+        previous[:] = strip[-1]
+    writeChunk(fp, b'IDAT', compressor.flush())
+    writeChunk(fp, b'IEND', b'')
+
+def writePpmStrips(image, box:tuple, fp, rows:int=STRIP_ROWS) -> None:
+    """Write the box part of an RGB image to fp as a binary PPM, one strip at a time
+    Args:
+        image (PIL.Image.Image): An RGB image
+        box (tuple): (left, upper, right, lower) part of image to write. None for all of it.
+        fp (BinaryIO): Where the PPM is written
+        rows (int, optional): Rows written at once. Defaults to STRIP_ROWS.
+    """
+    left, upper, right, lower = box or (0, 0) + image.size
+    fp.write(f'P6\n{right - left} {lower - upper}\n255\n'.encode())
+    for top in range(upper, lower, rows):
+        fp.write(image.crop((left, top, right, min(lower, top + rows))).tobytes())
+
+def writeChunk(fp, chunkType:bytes, data) -> None:
+    fp.write(struct.pack('>I', len(data)))
+    fp.write(chunkType)
+    fp.write(data)
+    fp.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunkType))))
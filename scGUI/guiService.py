@@ -5,33 +5,215 @@ from tkinter import filedialog as fd
 from tkinter import messagebox
 from pathlib import Path
 import logging
-import scCore.ScreenshotEventHandler as seh
+import base64
+import time
 import scCore.Broadcaster as bc
 import scCore.Options as opt
+from scCore.EventHistory import EventHistory
 
 logger = logging.getLogger(__name__)
 
+# Milliseconds between two deliveries of events to the GUI
+FRAME_INTERVAL = 50
+# Milliseconds after the last key typed in the catalog search before searching
+SEARCH_DELAY = 200
+# Screenshots listed at most by the catalog browser
+BROWSE_LIMIT = 500
+ALL_REGIONS = 'All regions'
+NO_REGION = 'No region'
+# Pixel height of a row of the event history, rows shown when the window opens, and rows scrolled per mouse wheel step
+HISTORY_ROW_HEIGHT = 16
+HISTORY_ROWS = 8
+HISTORY_WHEEL_ROWS = 3
+# Pixel width of the time column of the event history
+HISTORY_TIME_WIDTH = 90
+# Events left out of the event history, as they are shown on lines of their own
+HISTORY_HIDDEN_TYPES = (bc.EventType.METRICS, bc.EventType.BACKLOG)
+HISTORY_BACKGROUND = '#444444'
+HISTORY_COLOURS = {
+    bc.EventType.FAILURE: '#ff7777',
+    bc.EventType.SKIPPED: '#aaaaaa',
+    bc.EventType.SUPPRESSED: '#aaaaaa',
+    bc.EventType.OPTIONS: '#99ccff',
+    bc.EventType.START_LISTENING: '#99ff99',
+    bc.EventType.STOP_LISTENING: '#99ff99'
+}
+HISTORY_DEFAULT_COLOUR = '#ffffff'
+
 # Classes
 class GuiSubscriber(bc.Subscriber):
     """A subscriber that updates vars based on the events it receives
     """
-    def __init__(self, eventDateVar:tk.StringVar, lastEventVar:tk.StringVar):
+    def __init__(self, eventDateVar:tk.StringVar, lastEventVar:tk.StringVar, statsVar:tk.StringVar=None, backlogVar:tk.StringVar=None):
         self.eventDate = eventDateVar
         self.lastEvent = lastEventVar
+        self.stats = statsVar
+        self.backlog = backlogVar
     
     def trigger(self, event:bc.Event) -> None:
-        """Use event to update text and date information in vars
+        """Use event to update text and date information in vars. Metrics go to the stats var, and the spool backlog to the backlog var.
         """
+        if event.type == bc.EventType.METRICS:
+            if self.stats:
+                self.stats.set(event.text)
+            return
+        if event.type == bc.EventType.BACKLOG:
+            if self.backlog:
+                self.backlog.set(event.text if event.data and event.data['files'] else '')
+            return
         self.eventDate.set(event.time.strftime('%Y-%m-%d %H:%M:%S'))
         self.lastEvent.set(event.text)
+        
+    def triggerAll(self, events:list) -> None:
+        """Only the latest event, the latest metrics and the latest backlog are displayed, so skip straight to them
+        """
+        latestEvent = None
+        latestMetrics = None
+        latestBacklog = None
+        for event in events:
+            if event.type == bc.EventType.METRICS:
+                latestMetrics = event
+            elif event.type == bc.EventType.BACKLOG:
+                latestBacklog = event
+            else:
+                latestEvent = event
+        for event in (latestEvent, latestMetrics, latestBacklog):
+            if event:
+                self.trigger(event)
+            
+class EventHistoryPanel(bc.Subscriber):
+    """A scrollable list of the recent events, oldest at the top, that follows new events unless scrolled up.
+    Events are kept in an EventHistory, so memory stays bounded however long the session. Only the visible rows exist
+    as canvas items, and they are reused as the list scrolls, so a burst of events costs a single redraw per frame
+    interval, whatever its size. Subscribe it polled, and deliver its events with an EventPump.
+    """
+    def __init__(self, parent:tk.Misc, history:EventHistory=None):
+        """
+        Args:
+            parent (tk.Misc): Widget the panel's frame is created in. Pack or grid the frame to show the panel.
+            history (EventHistory, optional): Where events are kept. Defaults to an EventHistory of default capacity.
+        """
+        self._history = history if history is not None else EventHistory()
+        # Number of the event shown on the first row, and whether the last event is kept in view
+        self._top = 0
+        self._follow = True
+        # (time item, text item) of each visible row
+        self._rows = []
+        self.frame = tk.Frame(parent)
+        self._count = ttk.Label(self.frame, font=("none", 8))
+        self._count.pack(fill=tk.X)
+        self._canvas = tk.Canvas(self.frame, height=HISTORY_ROWS * HISTORY_ROW_HEIGHT, background=HISTORY_BACKGROUND, highlightthickness=0)
+        self._scrollbar = ttk.Scrollbar(self.frame, orient='vertical', command=self._scroll)
+        self._canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self._scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+        self._canvas.bind('<Configure>', lambda event: self._layout())
+        # Windows and macOS send wheel steps as deltas, X11 as buttons 4 and 5
+        self._canvas.bind('<MouseWheel>', lambda event: self._scrollTo(self._top + (-1 if event.delta > 0 else 1) * HISTORY_WHEEL_ROWS))
+        self._canvas.bind('<Button-4>', lambda event: self._scrollTo(self._top - HISTORY_WHEEL_ROWS))
+        self._canvas.bind('<Button-5>', lambda event: self._scrollTo(self._top + HISTORY_WHEEL_ROWS))
+        self._layout()
+
+    def trigger(self, event:bc.Event) -> None:
+        self.triggerAll([event])
+
+    def triggerAll(self, events:list) -> None:
+        """Add the events to the history, and redraw once
+        """
+        added = False
+        for event in events:
+            if event.type not in HISTORY_HIDDEN_TYPES:
+                self._history.append(event)
+                added = True
+        if added:
+            self.refresh()
+
+    def refresh(self) -> None:
+        """Show the events from the first visible one, and place the scrollbar
+        """
+        history = self._history
+        rows = len(self._rows)
+        if self._follow:
+            self._top = max(history.first(), history.total - rows)
+        else:
+            # The events scrolled to may have been replaced by newer ones
+            self._top = max(self._top, history.first())
+        records = history.records(self._top, self._top + rows)
+        for index, (timeItem, textItem) in enumerate(self._rows):
+            if index < len(records):
+                record = records[index]
+                colour = HISTORY_COLOURS.get(record.type, HISTORY_DEFAULT_COLOUR)
+                stamp = time.strftime('%H:%M:%S', time.localtime(record.time)) + f'.{int(record.time * 1000) % 1000:03d}'
+                self._canvas.itemconfigure(timeItem, text=stamp, fill=colour)
+                self._canvas.itemconfigure(textItem, text=record.text, fill=colour)
+            else:
+                self._canvas.itemconfigure(timeItem, text='')
+                self._canvas.itemconfigure(textItem, text='')
+        kept = len(history)
+        if kept:
+            offset = self._top - history.first()
+            self._scrollbar.set(offset / kept, min(1.0, (offset + rows) / kept))
+        else:
+            self._scrollbar.set(0.0, 1.0)
+        dropped = history.dropped()
+        self._count.configure(text=f'{kept} events' + (f', {dropped} older ones dropped' if dropped else ''))
+
+    def _layout(self) -> None:
+        """Create or delete rows to fill the height of the canvas
+        """
+        rows = max(1, self._canvas.winfo_height() // HISTORY_ROW_HEIGHT) if self._canvas.winfo_ismapped() else HISTORY_ROWS
+        while len(self._rows) < rows:
+            y = len(self._rows) * HISTORY_ROW_HEIGHT + HISTORY_ROW_HEIGHT // 2
+            self._rows.append((self._canvas.create_text(5, y, anchor='w', font='TkFixedFont'),
+                               self._canvas.create_text(HISTORY_TIME_WIDTH, y, anchor='w', font=("none", 9))))
+        while len(self._rows) > rows:
+            self._canvas.delete(*self._rows.pop())
+        self.refresh()
+
+    def _scroll(self, action:str, amount:str, unit:str=None) -> None:
+        """Scrollbar command: ('moveto', fraction) or ('scroll', steps, 'units' or 'pages')
+        """
+        history = self._history
+        if action == 'moveto':
+            self._scrollTo(history.first() + int(float(amount) * len(history)))
+        else:
+            self._scrollTo(self._top + int(amount) * (len(self._rows) if unit == 'pages' else 1))
+
+    def _scrollTo(self, top:int) -> None:
+        """Show the events from number top, following new events again once scrolled to the bottom
+        """
+        history = self._history
+        bottom = max(history.first(), history.total - len(self._rows))
+        self._top = min(max(top, history.first()), bottom)
+        self._follow = self._top >= bottom
+        self.refresh()
+
+class EventPump:
+    """Delivers the events of a polled subscription on the Tk main loop, as Tk variables must not be set from other threads.
+    Events that arrive between two polls are delivered together, so there is at most one update per frame interval.
+    """
+    def __init__(self, root:tk.Tk, subscription:bc.Subscription, interval:int=FRAME_INTERVAL):
+        self._root = root
+        self._subscription = subscription
+        self._interval = interval
+        
+    def start(self) -> None:
+        self._root.after(self._interval, self._poll)
+        
+    def _poll(self) -> None:
+        try:
+            self._subscription.deliver()
+        except Exception:
+            logger.exception('Failed to display events')
+        self._root.after(self._interval, self._poll)
      
 class OptionUpdater:
-    def __init__(self, destFolder:tk.StringVar, xOffset:tk.IntVar, yOffset:tk.IntVar, width:tk.IntVar, height:tk.IntVar, options:opt.Options):
+    def __init__(self, destFolder:tk.StringVar, xOffset:tk.IntVar, yOffset:tk.IntVar, width:tk.IntVar, height:tk.IntVar, options:opt.Options, stats:tk.BooleanVar=None):
         self._destFolder = destFolder
         self._xOffset = xOffset
         self._yOffset = yOffset
         self._width = width
         self._height = height
+        self._stats = stats
         self._options = options
         
     def _updateCurrentOptions(self) -> bool:
@@ -46,6 +228,8 @@ class OptionUpdater:
             self._options.yOffset = self._yOffset.get()
             self._options.width = self._width.get()
             self._options.height = self._height.get()
+            if self._stats:
+                self._options.stats = self._stats.get()
             logger.info("Options updated to: {" + self._options.toString() + "}")
             return True
         except Exception:
@@ -60,10 +244,12 @@ class OptionUpdater:
         
     
 class Executor:
-    """Starts and stops listening for screenshots
+    """Starts and stops listening for screenshots. The handler is kept when listening stops, so that starting again
+    keeps its namers and capture backend, unless an option it can't change in place was changed.
     """
     def __init__(self, broadcaster:bc.Broadcaster, updater:OptionUpdater, startBtn:ttk.Button=None):
-        self._listener = None
+        self._handler = None
+        self._listening = False
         self._broadcaster = broadcaster
         self._startBtn = startBtn
         self._updater = updater
@@ -72,13 +258,13 @@ class Executor:
         self._startBtn = button
      
     def toggle(self) -> None:
-        """ Toggles listening on or off. listener is set to None when listening is off. An new instance is created when listening is turned on.
+        """ Toggles listening on or off
         """
         if not self._startBtn:
             raise ValueError("Button not set!")
         
         # Start listening
-        if self._listener:
+        if self._listening:
             self._stop()
         else:
             self._start()
@@ -87,8 +273,8 @@ class Executor:
         """Stop listener and reset button
         """
         # Stop listening
-        self._listener.stopListening()
-        self._listener=None
+        self._handler.stopListening()
+        self._listening = False
         # Update button
         self._startBtn.config(text='Start')
         
@@ -98,27 +284,57 @@ class Executor:
         options = self._updater.updateOptions()
         if not options:
             return
-        try:            
-            self._listener = seh.ScreenShotEventHandler(options, self._broadcaster)
+        try:
+            opt.validateOptions(options)
             if not createOrCheckFolderPath(options.path):
                 return
-            self._listener.startListening()
+            # Imported on first start, so that the window shows up without waiting for the capture libraries
+            import scCore.ScreenshotEventHandler as seh
+            if self._handler and self._handler.updateOptions(options):
+                # Options such as the backend or the workers changed, which are only read by a new handler
+                self._handler = None
+            if not self._handler:
+                self._handler = seh.ScreenShotEventHandler(options, self._broadcaster)
+            self._handler.startListening()
+            self._listening = True
             # change label and command
             self._startBtn.config(text='Stop')
+        except ValueError as e:
+            # Bad options, such as an area outside every monitor
+            messagebox.showerror("Invalid parameters", str(e))
+            logger.error("Couldn't start listening!", exc_info=e)
         except Exception as e:
             messagebox.showerror("Error", "Couldn't start listening!")
             logger.error("Couldn't start listening!", exc_info=e) 
             # As a precaution if the startBtn.config somehow failed
-            if self._listener:
-                self._listener.stopListening()    
-                self._listener = None
+            if self._handler:
+                self._handler.stopListening()    
+                self._handler = None
+            self._listening = False
+
+    def applyOptions(self, options:opt.Options) -> None:
+        """Apply options to the handler while listening, without stopping. Shows a message to the user if they are
+        invalid, or if some of them only apply once listening is stopped and started again.
+        """
+        if not self._listening:
+            return
+        try:
+            opt.validateOptions(options)
+            pending = self._handler.updateOptions(options)
+        except ValueError as e:
+            messagebox.showerror("Invalid parameters", str(e))
+            logger.error("Couldn't apply options!", exc_info=e)
+            return
+        if pending:
+            messagebox.showinfo("Restart needed", "Stop and start listening to apply: " + ', '.join(pending))
                     
 class Saver:
-    """Updates and saves options
+    """Updates and saves options, and applies them if listening
     """
-    def __init__(self, updater:OptionUpdater, saveBtn:ttk.Button=None):
+    def __init__(self, updater:OptionUpdater, saveBtn:ttk.Button=None, executor:Executor=None):
         self._saveBtn = saveBtn
         self._updater = updater
+        self._executor = executor
         
     def setButton(self, button:ttk.Button) -> None:
         self._saveBtn = button
@@ -135,12 +351,123 @@ class Saver:
         if opt.saveOptions(options):
             self._saveBtn.config(text='Saved!')
             self._saveBtn.after(500, self._resetSaveLabel)
+            if self._executor:
+                self._executor.applyOptions(options)
         else:
             messagebox.showerror("Error", "Failed to save!")
             
     def _resetSaveLabel(self) -> None:
         self._saveBtn.config(text='Save')
                     
+class CatalogBrowser:
+    """A window listing the screenshots of the destination folder, with a search box and a thumbnail preview.
+    It only reads the folder's catalog, never the images themselves.
+    """
+    def __init__(self, root:tk.Tk, updater:OptionUpdater):
+        self._root = root
+        self._updater = updater
+        self._window = None
+        self._catalog = None
+        self._searchJob = None
+        # Kept, as Tk doesn't keep a reference to the image it displays
+        self._thumbnail = None
+
+    def open(self) -> None:
+        """Open the browser on the destination folder, or bring it to the front if it is already open
+        """
+        if self._window:
+            self._window.lift()
+            return
+        options = self._updater.updateOptions()
+        if not options:
+            return
+        # Imported here, as the catalog is only needed once the browser is opened
+        import scCore.Catalog as cat
+        try:
+            self._catalog = cat.Catalog(options.path, readOnly=True)
+        except FileNotFoundError:
+            messagebox.showinfo("No catalog", f"{options.path} has no catalog yet. With the catalog option on, screenshots are added to it as they are taken. "
+                                "To add the ones already there, run: screenshot-cropper index")
+            return
+        self._window = tk.Toplevel(self._root)
+        self._window.title(f"Screenshots in {options.path}")
+        self._window.geometry('800x400')
+        self._window.protocol('WM_DELETE_WINDOW', self.close)
+
+        searchFrame = tk.Frame(self._window)
+        searchFrame.pack(fill=tk.X, padx=10, pady=5)
+        self._text = tk.StringVar()
+        self._text.trace_add('write', lambda *args: self._scheduleSearch())
+        ttk.Label(searchFrame, text='Search').pack(side=tk.LEFT, padx=5)
+        entry = ttk.Entry(searchFrame, textvariable=self._text)
+        entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        entry.bind('<Return>', lambda event: self.search())
+        self._region = tk.StringVar(value=ALL_REGIONS)
+        regions = ttk.Combobox(searchFrame, textvariable=self._region, state='readonly', width=16,
+                               values=[ALL_REGIONS, NO_REGION] + self._catalog.regions())
+        regions.bind('<<ComboboxSelected>>', lambda event: self.search())
+        regions.pack(side=tk.LEFT, padx=5)
+        self._count = tk.StringVar()
+        ttk.Label(searchFrame, textvariable=self._count).pack(side=tk.LEFT, padx=5)
+
+        listFrame = tk.Frame(self._window)
+        listFrame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self._list = ttk.Treeview(listFrame, columns=('captured', 'region', 'size', 'bytes'), selectmode='browse')
+        for column, heading, width in (('#0', 'Name', 240), ('captured', 'Taken', 140), ('region', 'Region', 80), ('size', 'Size', 80), ('bytes', 'KB', 60)):
+            self._list.heading(column, text=heading)
+            self._list.column(column, width=width, stretch=column == '#0')
+        scrollbar = ttk.Scrollbar(listFrame, orient='vertical', command=self._list.yview)
+        self._list.configure(yscrollcommand=scrollbar.set)
+        self._list.bind('<<TreeviewSelect>>', lambda event: self._showThumbnail())
+        self._list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+        self._preview = ttk.Label(listFrame, anchor='center', width=24)
+        self._preview.pack(side=tk.LEFT, fill=tk.Y, padx=10)
+        self.search()
+
+    def search(self) -> None:
+        """List the screenshots matching the search box and the region, most recent first
+        """
+        self._searchJob = None
+        region = self._region.get()
+        region = None if region == ALL_REGIONS else '' if region == NO_REGION else region
+        text = self._text.get().strip()
+        try:
+            rows = self._catalog.search(text, region, BROWSE_LIMIT)
+            total = self._catalog.count(text, region) if len(rows) == BROWSE_LIMIT else len(rows)
+        except Exception:
+            logger.exception('Failed to search the catalog')
+            messagebox.showerror("Error", "Failed to read the catalog")
+            return
+        self._list.delete(*self._list.get_children())
+        for row in rows:
+            self._list.insert('', tk.END, iid=row['name'], text=row['name'],
+                              values=(row['captured'], row['region'] or '', f"{row['width']}x{row['height']}", f"{row['bytes'] / 1024:.1f}"))
+        self._count.set(f'{len(rows)} of {total}' if total > len(rows) else f'{total} screenshots')
+
+    def close(self) -> None:
+        if self._searchJob:
+            self._window.after_cancel(self._searchJob)
+            self._searchJob = None
+        self._catalog.close()
+        self._catalog = None
+        self._window.destroy()
+        self._window = None
+        self._thumbnail = None
+
+    def _scheduleSearch(self) -> None:
+        """Search once typing pauses, rather than on every key
+        """
+        if self._searchJob:
+            self._window.after_cancel(self._searchJob)
+        self._searchJob = self._window.after(SEARCH_DELAY, self.search)
+
+    def _showThumbnail(self) -> None:
+        selection = self._list.selection()
+        data = self._catalog.thumbnail(selection[0]) if selection else None
+        self._thumbnail = tk.PhotoImage(data=base64.b64encode(data)) if data else None
+        self._preview.configure(image=self._thumbnail or '')
+
 # Functions
         
 def parseArgs(options:opt.Options) -> argparse.Namespace:
@@ -150,6 +477,8 @@ def parseArgs(options:opt.Options) -> argparse.Namespace:
 Listen for screenshots, crop them to the desired format, and save them to disk
 ''')
     parser.add_argument("-l", "--log-level", dest="logLevel", help=f"Level of detail for logged events. Default: {options.logLevel}", default=options.logLevel)
+    # Used by the startup benchmark: quit as soon as the window is shown
+    parser.add_argument("--startup-probe", dest="startupProbe", action='store_true', help=argparse.SUPPRESS)
     return parser.parse_args()
 
 
@@ -0,0 +1,75 @@
+import logging
+import argparse
+import platform
+import datetime as dt
+import json
+import sys
+from pathlib import Path
+import scBench.CaptureBenchmark as captureBench
+import scBench.EncoderBenchmark as encoderBench
+import scBench.NamerBenchmark as namerBench
+import scBench.BroadcasterBenchmark as broadcasterBench
+import scBench.StartupBenchmark as startupBench
+import scBench.MemoryBenchmark as memoryBench
+import scBench.ArchiveBenchmark as archiveBench
+
+logger = logging.getLogger(__name__)
+
+BENCHMARKS = ('capture', 'encoders', 'namer', 'broadcaster', 'startup', 'memory', 'archive')
+NAMER_FOLDER_SIZES = (0, 1000, 10000, 100000)
+
+def initArgParser() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="screenshot-cropper-bench.py",
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     description='''\
+Benchmark the capture-to-disk path with generated frames. No display is needed.
+''')
+    parser.add_argument("-o", "--output", type=Path, help="File the results are written to as JSON. Default: bench-<date>.json", default=None)
+    parser.add_argument("-d", "--dir", type=Path, help="Folder screenshots are written to while benchmarking. Default: a temporary folder", default=None)
+    parser.add_argument("-b", "--benchmarks", nargs='+', choices=BENCHMARKS, help="Benchmarks to run. Default: all of them", default=BENCHMARKS)
+    parser.add_argument("--quick", action='store_true', help="Smaller runs, for a rough idea in a few seconds")
+    return parser.parse_args()
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    args = initArgParser()
+    now = dt.datetime.now()
+    output = args.output or Path(f"bench-{now.strftime('%Y-%m-%d_%H-%M-%S')}.json")
+    results = {
+        'time': now.isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'quick': args.quick,
+        'benchmarks': {}
+    }
+    benchmarks = results['benchmarks']
+    if 'capture' in args.benchmarks:
+        print('Capture latency and throughput...')
+        benchmarks['capture'] = captureBench.run(args.dir, args.quick)
+    if 'encoders' in args.benchmarks:
+        print('Encoders...')
+        benchmarks['encoders'] = encoderBench.run(frames=2 if args.quick else 5)
+    if 'namer' in args.benchmarks:
+        print('Namer...')
+        sizes = NAMER_FOLDER_SIZES[:-1] if args.quick else NAMER_FOLDER_SIZES
+        benchmarks['namer'] = [namerBench.run(size, 50 if args.quick else 200, args.dir) for size in sizes]
+    if 'broadcaster' in args.benchmarks:
+        print('Broadcaster fan-out...')
+        benchmarks['broadcaster'] = broadcasterBench.run(events=100 if args.quick else 1000)
+    if 'startup' in args.benchmarks:
+        print('Startup...')
+        benchmarks['startup'] = startupBench.run(2 if args.quick else 5)
+    if 'memory' in args.benchmarks:
+        print('Memory per shot...')
+        sizes = {name: size for name, size in memoryBench.REGION_SIZES.items() if name in ('1080p', '4K')} if args.quick else memoryBench.REGION_SIZES
+        benchmarks['memory'] = memoryBench.run(args.dir, sizes)
+    if 'archive' in args.benchmarks:
+        print('Session archive...')
+        benchmarks['archive'] = archiveBench.run(frames=20 if args.quick else 60, keyframeInterval=10 if args.quick else 30, folder=args.dir)
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f'Results written to {output}')
+
+if __name__ == "__main__":
+    main()
@@ -1,96 +1,140 @@
 import tkinter as tk
 from tkinter import ttk
 import logging
+import multiprocessing
 import scCore.Options as opt
 import scCore.Broadcaster as bc
 import scGUI.guiService as gs
-
-# Init logger
+from scCore.EventHistory import openEventLog, closeEventLog
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(format=opt.LOG_FORMAT, filename='ScreenshotCropper.log', level=opt.DEFAULT_LOG_LEVEL, filemode='w')
-options = opt.loadOptions()
 
-# Get args and adjust log level
+# Printed by --startup-probe once the window is shown
+STARTUP_PROBE_WINDOW = 'startup-probe: window'
+
+def main():
+    # Init logger
+
+    logging.basicConfig(format=opt.LOG_FORMAT, filename='ScreenshotCropper.log', level=opt.DEFAULT_LOG_LEVEL, filemode='w')
+    options = opt.loadOptions()
+
+    # Get args and adjust log level
+
+    args = gs.parseArgs(options)
+    logger.setLevel(args.logLevel)
+
+    # Create window
+
+    root = tk.Tk()
+    root.title("Screenshot Cropper - Take screenshots with F12")
+    root.geometry('700x480')
+
+    # Initialise field values
+
+    destFolder = tk.StringVar(value=options.path)
+    xOffset = tk.IntVar(value=options.xOffset)
+    yOffset = tk.IntVar(value=options.yOffset)
+    width  = tk.IntVar(value=options.width)
+    height = tk.IntVar(value=options.height)
+
+    showStats = tk.BooleanVar(value=options.stats)
+
+    lastEvent = tk.StringVar()
+    eventDate = tk.StringVar()
+    statsLine = tk.StringVar()
+    backlogLine = tk.StringVar()
 
-logger.setLevel(gs.parseArgs(options).logLevel)
+    # Init data handling objects
 
-# Create window
+    updater = gs.OptionUpdater(destFolder, xOffset, yOffset, width, height, options, showStats)
+    broadcaster = bc.Broadcaster()
+    subscription = broadcaster.subscribe(gs.GuiSubscriber(eventDate, lastEvent, statsLine, backlogLine), polled=True)
+    gs.EventPump(root, subscription).start()
+    eventLog = None
+    if options.eventLog:
+        try:
+            eventLog = openEventLog(broadcaster, options.eventLog)
+        except OSError:
+            logger.exception(f'Failed to open the event log {options.eventLog}')
+    executor = gs.Executor(broadcaster, updater)
+    saver = gs.Saver(updater, executor=executor)
+    browser = gs.CatalogBrowser(root, updater)
 
-root = tk.Tk()
-root.title("Screenshot Cropper - Take screenshots with F12")
-root.geometry('700x250')
+    # Event Log
+    BACKGROUND = "#444444"
+    NEUTRAL =   "#ffffff"
+    eventFrame = tk.Frame(root, background=BACKGROUND)
+    ttk.Label(eventFrame, textvariable=eventDate, font=("none", 10, "bold"), background=BACKGROUND, foreground=NEUTRAL).pack(side=tk.LEFT, padx=10, pady=5)
+    ttk.Label(eventFrame, textvariable=lastEvent, font=("none", 10, "bold"), background=BACKGROUND, foreground=NEUTRAL, anchor='center').pack(padx=10, pady=5, fill=tk.X, expand=True)
+    eventFrame.pack(fill=tk.X, pady=5, padx=10, expand=True)
+    ttk.Label(root, textvariable=statsLine, font=("none", 8)).pack(fill=tk.X, padx=20)
+    ttk.Label(root, textvariable=backlogLine, font=("none", 8)).pack(fill=tk.X, padx=20)
 
-# Initialise field values
+    # Event history
 
-destFolder = tk.StringVar(value=options.path)
-xOffset = tk.IntVar(value=options.xOffset)
-yOffset = tk.IntVar(value=options.yOffset)
-width  = tk.IntVar(value=options.width)
-height = tk.IntVar(value=options.height)
+    history = gs.EventHistoryPanel(root)
+    history.frame.pack(fill=tk.BOTH, pady=5, padx=10, expand=True)
+    gs.EventPump(root, broadcaster.subscribe(history, polled=True)).start()
 
-lastEvent = tk.StringVar()
-eventDate = tk.StringVar()
+    # Destination choice
 
-# Init data handling objects
+    destFrame = tk.Frame(root)
+    destFrame.pack(fill=tk.X, pady=5, padx=10, expand=True)
 
-updater = gs.OptionUpdater(destFolder, xOffset, yOffset, width, height, options)
-broadcaster = bc.Broadcaster()
-broadcaster.subscribe(gs.GuiSubscriber(eventDate, lastEvent))
-saver = gs.Saver(updater)
-executor = gs.Executor(broadcaster, updater)
+    ttk.Label(destFrame, text='Destination Folder').pack(side=tk.LEFT, padx=10, pady=5)
+    ttk.Entry(destFrame, textvariable=destFolder).pack(side=tk.LEFT, fill=tk.X, expand=True)
+    ttk.Button(destFrame, text='Browse', command=lambda:gs.selectFolder(destFolder)).pack(side=tk.LEFT, padx=10, pady=5)
 
-# Event Log
-BACKGROUND = "#444444"
-NEUTRAL =   "#ffffff"
-eventFrame = tk.Frame(root, background=BACKGROUND)
-ttk.Label(eventFrame, textvariable=eventDate, font=("none", 10, "bold"), background=BACKGROUND, foreground=NEUTRAL).pack(side=tk.LEFT, padx=10, pady=5)
-ttk.Label(eventFrame, textvariable=lastEvent, font=("none", 10, "bold"), background=BACKGROUND, foreground=NEUTRAL, anchor='center').pack(padx=10, pady=5, fill=tk.X, expand=True)
-eventFrame.pack(fill=tk.X, pady=5, padx=10, expand=True)
+    ttk.Separator(root, orient='horizontal').pack(fill=tk.X, padx=50, pady=5, expand=True)
 
-# Destination choice
+    # Screenshot area options
 
-destFrame = tk.Frame(root)
-destFrame.pack(fill=tk.X, pady=5, padx=10, expand=True)
+    areaFrame = tk.Frame(root)
+    areaFrame.pack(padx=50, pady=5, expand=True)
 
-ttk.Label(destFrame, text='Destination Folder').pack(side=tk.LEFT, padx=10, pady=5)
-ttk.Entry(destFrame, textvariable=destFolder).pack(side=tk.LEFT, fill=tk.X, expand=True)
-ttk.Button(destFrame, text='Browse', command=lambda:gs.selectFolder(destFolder)).pack(side=tk.LEFT, padx=10, pady=5)
+    ttk.Label(areaFrame, text='X Offset').grid(column=0, row=0, padx=5, pady=5)
+    ttk.Entry(areaFrame, textvariable=xOffset, width=8).grid(column=1, row=0, padx=5, pady=5)
+    ttk.Label(areaFrame, text='Width ').grid(column=2, row=0, padx=5, pady=5)
+    ttk.Entry(areaFrame, textvariable=width, width=8).grid(column=3, row=0, padx=5, pady=5)
 
-ttk.Separator(root, orient='horizontal').pack(fill=tk.X, padx=50, pady=5, expand=True)
+    ttk.Label(areaFrame, text='Y Offset').grid(column=0, row=1, padx=5, pady=5)
+    ttk.Entry(areaFrame, textvariable=yOffset, width=8).grid(column=1, row=1, padx=5, pady=5)
+    ttk.Label(areaFrame, text='Height').grid(column=2, row=1, padx=5, pady=5)
+    ttk.Entry(areaFrame, textvariable=height, width=8).grid(column=3, row=1, padx=5, pady=5)
 
-# Screenshot area options
+    ttk.Checkbutton(areaFrame, text='Show stats', variable=showStats).grid(column=0, row=2, columnspan=4, padx=5, pady=5)
 
-areaFrame = tk.Frame(root)
-areaFrame.pack(padx=50, pady=5, expand=True)
+    ttk.Separator(root, orient='horizontal').pack(fill=tk.X, padx=50, pady=5, expand=True)
 
-ttk.Label(areaFrame, text='X Offset').grid(column=0, row=0, padx=5, pady=5)
-ttk.Entry(areaFrame, textvariable=xOffset, width=8).grid(column=1, row=0, padx=5, pady=5)
-ttk.Label(areaFrame, text='Width ').grid(column=2, row=0, padx=5, pady=5)
-ttk.Entry(areaFrame, textvariable=width, width=8).grid(column=3, row=0, padx=5, pady=5)
+    # Buttons
 
-ttk.Label(areaFrame, text='Y Offset').grid(column=0, row=1, padx=5, pady=5)
-ttk.Entry(areaFrame, textvariable=yOffset, width=8).grid(column=1, row=1, padx=5, pady=5)
-ttk.Label(areaFrame, text='Height').grid(column=2, row=1, padx=5, pady=5)
-ttk.Entry(areaFrame, textvariable=height, width=8).grid(column=3, row=1, padx=5, pady=5)
+    buttonFrame = tk.Frame(root)
+    buttonFrame.pack(fill=tk.X, pady=5, expand=True)
 
-ttk.Separator(root, orient='horizontal').pack(fill=tk.X, padx=50, pady=5, expand=True)
+    saveBtn = ttk.Button(buttonFrame, text='Save', command=saver.saveOptions)
+    saver.setButton(saveBtn)
+    saveBtn.pack(side=tk.LEFT, padx=10, pady=5, expand=True)
 
-# Buttons
+    startBtn = ttk.Button(buttonFrame, text='Start', command=executor.toggle)
+    executor.setButton(startBtn)
+    startBtn.pack(side=tk.LEFT, padx=10, pady=5, expand=True)
 
-buttonFrame = tk.Frame(root)
-buttonFrame.pack(fill=tk.X, pady=5, expand=True)
+    ttk.Button(buttonFrame, text='Screenshots', command=browser.open).pack(side=tk.LEFT, padx=10, pady=5, expand=True)
 
-saveBtn = ttk.Button(buttonFrame, text='Save', command=saver.saveOptions)
-saver.setButton(saveBtn)
-saveBtn.pack(side=tk.LEFT, padx=10, pady=5, expand=True)
+    ttk.Button(buttonFrame, text='Close', command=lambda:root.quit()).pack(side=tk.LEFT, padx=10, pady=5, expand=True)
 
-startBtn = ttk.Button(buttonFrame, text='Start', command=executor.toggle)
-executor.setButton(startBtn)
-startBtn.pack(side=tk.LEFT, padx=10, pady=5, expand=True)
+    broadcaster.report(bc.EventType.WAITING, text='Waiting to start')
 
-ttk.Button(buttonFrame, text='Close', command=lambda:root.quit()).pack(side=tk.LEFT, padx=10, pady=5, expand=True)
+    if args.startupProbe:
+        root.update()
+        print(STARTUP_PROBE_WINDOW, flush=True)
+        root.destroy()
+    else:
+        root.mainloop()
 
-broadcaster.report(bc.EventType.WAITING, text='Waiting to start')
+    if eventLog:
+        closeEventLog(broadcaster, *eventLog)
 
-root.mainloop()
\ No newline at end of file
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -1,12 +1,23 @@
 import logging
 import argparse
-from scCore.ScreenshotEventHandler import *
+import json
+import multiprocessing
+from pathlib import Path
 from scCore.Options import *
+from scCore.Broadcaster import Subscriber, Event, EventType
+from scCore.SessionArchive import parseFrames, summaryText
+from scCore.Processing import parseStage, createChain
+from scCore.EventHistory import openEventLog, closeEventLog
 
 # TODO 
 # - GUI
 
 logger = logging.getLogger(__name__)
+
+# Printed by --startup-probe once listening, and after the first screenshot with its latency in ms
+STARTUP_PROBE_LISTENING = 'startup-probe: listening'
+STARTUP_PROBE_FIRST_SHOT = 'startup-probe: first-shot'
+CONTROL_ACTIONS = ('capture', 'burst-start', 'burst-stop', 'stats')
 logging.basicConfig(format=LOG_FORMAT, filename='ScreenshotCropper.log', level=DEFAULT_LOG_LEVEL, filemode='w')
 
 def initArgParser(options: Options) -> argparse.Namespace:
@@ -21,12 +32,78 @@ def initArgParser(options: Options) -> argparse.Namespace:
 Listen for screenshots, crop them to the desired format, and save them to disk
 ''')
     parser.add_argument("-l", "--log-level", dest="logLevel", help=f"Level of detail for logged events. Currently: {options.logLevel}", default=options.logLevel)
-    parser.add_argument("-p", "--path", help=f"Path to the folder where the screenshots will be saved. Currently: {options.path}.", default=options.path)
+    parser.add_argument("-p", "--path", type=Path, action='append', help=f"Path to the folder where the screenshots will be saved. Can be repeated: each screenshot is then encoded once and copied to the other folders, each numbered on its own, and a slow or unplugged folder doesn't delay the others. Currently: {', '.join(str(path) for path in options.paths())}.", default=None)
     parser.add_argument("-x", "--x-offset", dest="x", type=int,  help=f"x offset from the top left of the captured area. Currently: {options.xOffset}.", default=options.xOffset)
     parser.add_argument("-y", "--y-offset", dest='y', type=int, help=f"y offset from the top left of the captured area. Currently: {options.yOffset}.", default=options.yOffset)
     parser.add_argument("-W", "--width", type=int, help=f"Width of the captured area. Currently: {options.width}.", default=options.width)
     parser.add_argument("-H", "--height", type=int, help=f"Height of the captured area. Currently: {options.height}.", default=options.height)
+    parser.add_argument("--workers", type=int, help=f"Number of screenshots that can be encoded and written at the same time. Currently: {options.workers}.", default=options.workers)
+    parser.add_argument("--worker-type", dest="workerType", choices=WORKER_TYPES, help=f"Encode screenshots on threads or in separate processes. Currently: {options.workerType}.", default=options.workerType)
+    parser.add_argument("--queue-size", dest="queueSize", type=int, help=f"Maximum number of screenshots waiting to be written. Currently: {options.queueSize}.", default=options.queueSize)
+    parser.add_argument("--backpressure", choices=BACKPRESSURE_POLICIES, help=f"What to do with new screenshots when the queue is full. Currently: {options.backpressure}.", default=options.backpressure)
+    parser.add_argument("-b", "--backend", choices=BACKENDS, help=f"How the screen is grabbed. 'auto' uses mss if it is installed and pyautogui otherwise. 'synthetic' generates frames without a display. Currently: {options.backend}.", default=options.backend)
+    parser.add_argument("--burst-fps", dest="burstFps", type=float, help=f"Frames per second captured while F12 is held down or a burst is toggled on. 0 disables bursts. Currently: {options.burstFps:g}.", default=options.burstFps)
+    parser.add_argument("--burst-key", dest="burstKey", help=f"Key that toggles a burst on and off, such as f11. Currently: {options.burstKey or 'none'}.", default=options.burstKey)
+    parser.add_argument("--replay-seconds", dest="replaySeconds", type=float, help=f"Keep the last seconds of the captured area in memory, and save them when F12 is pressed. 0 disables the replay. Currently: {options.replaySeconds:g}.", default=options.replaySeconds)
+    parser.add_argument("--replay-fps", dest="replayFps", type=float, help=f"Frames per second kept in the replay. Currently: {options.replayFps:g}.", default=options.replayFps)
+    parser.add_argument("--replay-memory", dest="replayMemory", type=int, help=f"Maximum memory used by the replay, in MB. Currently: {options.replayMemory}.", default=options.replayMemory)
+    parser.add_argument("-f", "--format", choices=FORMATS, help=f"File format of the screenshots. 'raw' writes uncompressed PPM files, which is the fastest. Currently: {options.format}.", default=options.format)
+    parser.add_argument("--compress-level", dest="compressLevel", type=int, help=f"PNG compression level, from 0 (fastest) to 9 (smallest). Currently: {options.compressLevel}.", default=options.compressLevel)
+    parser.add_argument("--png-strategy", dest="pngStrategy", choices=tuple(PNG_STRATEGIES), help=f"PNG compression strategy. 'rle' is fast and works well on screenshots. Currently: {options.pngStrategy}.", default=options.pngStrategy)
+    parser.add_argument("-q", "--quality", type=int, help=f"JPEG quality or WebP compression effort, from 0 to 100. Currently: {options.quality}.", default=options.quality)
+    parser.add_argument("--preset", choices=tuple(PRESETS), help=f"Use predefined format settings, overriding the format options. 'fastest' minimises the time spent encoding each screenshot. Currently: {options.preset or 'none'}.", default=options.preset)
+    parser.add_argument("--index-file", dest="indexFile", action=argparse.BooleanOptionalAction, help=f"Remember the last screenshot index in a file in the destination folder, so that it doesn't need to be scanned on startup. Currently: {options.indexFile}.", default=options.indexFile)
+    parser.add_argument("--stats", action=argparse.BooleanOptionalAction, help=f"Time each stage of every capture, and print a summary when stopping. Currently: {options.stats}.", default=options.stats)
+    parser.add_argument("--stats-interval", dest="statsInterval", type=float, help=f"Seconds between stats updates in the log. Currently: {options.statsInterval:g}.", default=options.statsInterval)
+    parser.add_argument("--watch-threshold", dest="watchThreshold", type=float, help=f"Take a screenshot automatically when this fraction of the captured area changes, from 0 to 1. 0 disables watching. Currently: {options.watchThreshold:g}.", default=options.watchThreshold)
+    parser.add_argument("--watch-rate", dest="watchRate", type=float, help=f"Times per second the captured area is checked for changes. Currently: {options.watchRate:g}.", default=options.watchRate)
+    parser.add_argument("--watch-cooldown", dest="watchCooldown", type=float, help=f"Minimum seconds between two screenshots triggered by changes. Currently: {options.watchCooldown:g}.", default=options.watchCooldown)
+    parser.add_argument("--dedupe", choices=DEDUPE_MODES, help=f"Skip screenshots that are the same as a recent one. exact skips identical pixels, perceptual also skips near-identical ones. Currently: {options.dedupe}.", default=options.dedupe)
+    parser.add_argument("--dedupe-distance", dest="dedupeDistance", type=int, help=f"With perceptual dedupe, how many of the 64 bits of the image hash may differ for two screenshots to count as the same. Currently: {options.dedupeDistance}.", default=options.dedupeDistance)
+    parser.add_argument("--dedupe-history", dest="dedupeHistory", type=int, help=f"Number of recent screenshots of the same region each new one is compared with. Currently: {options.dedupeHistory}.", default=options.dedupeHistory)
+    currentRegions = ', '.join(region.toString() for region in options.regions) or 'none'
+    parser.add_argument("-r", "--region", dest="regions", type=parseRegion, action='append', metavar="NAME:X,Y,WIDTH,HEIGHT[:KEY]", help=f"A named region to capture to its own file, instead of the area above. Can be repeated. Regions with a key are captured when that key is pressed, the others with F12. Replaces the current regions: {currentRegions}.", default=None)
+    parser.add_argument("--no-regions", dest="noRegions", action='store_true', help="Forget the current regions, and capture the area above.")
+    parser.add_argument("--prewarm", action=argparse.BooleanOptionalAction, help=f"Initialise the capture when listening starts, so that the first screenshot is as fast as the next ones. Currently: {options.prewarm}.", default=options.prewarm)
+    parser.add_argument("--spool", dest="spoolPath", type=Path, help=f"Write screenshots to this local folder first, and move them to the screenshot folder in the background. Useful when the screenshot folder is slow, such as a network drive. Currently: {options.spoolPath or 'none'}.", default=options.spoolPath)
+    parser.add_argument("--no-spool", dest="noSpool", action='store_true', help="Write screenshots straight to the screenshot folder.")
+    parser.add_argument("--spool-movers", dest="spoolMovers", type=int, help=f"Number of screenshots moved out of the spool at the same time. Currently: {options.spoolMovers}.", default=options.spoolMovers)
+    parser.add_argument("--control-port", dest="controlPort", type=int, help=f"Accept capture and burst commands from local scripts on this port while listening. See the control command. 0 disables it. Currently: {options.controlPort or 'none'}.", default=options.controlPort)
+    parser.add_argument("--reload-options", dest="reloadOptions", action=argparse.BooleanOptionalAction, help=f"While listening, apply the changes made to the saved options, such as a new area or folder, without restarting. Options given on the command line are kept until they are changed in the saved options. Currently: {options.reloadOptions}.", default=options.reloadOptions)
+    parser.add_argument("--min-interval", dest="minInterval", type=float, help=f"Ignore F12 and region keys pressed again less than this many seconds after the previous screenshot of the same key. 0 disables the limit. Currently: {options.minInterval:g}.", default=options.minInterval)
+    parser.add_argument("--capture-rate", dest="captureRate", type=float, help=f"Maximum screenshots per second taken with keys, on average, so that a stuck key can't fill the disk. 0 disables the limit. Currently: {options.captureRate:g}.", default=options.captureRate)
+    parser.add_argument("--capture-bucket", dest="captureBucket", type=int, help=f"Screenshots that can be taken with keys in quick succession before the capture rate applies. 0 is the same as 1. Currently: {options.captureBucket}.", default=options.captureBucket)
+    parser.add_argument("--output", choices=OUTPUTS, help=f"files saves each screenshot to a file of its own. archive adds the screenshots of each listening session to a single session archive, much smaller when screenshots look alike. See the export command. Currently: {options.output}.", default=options.output)
+    parser.add_argument("--keyframe-interval", dest="keyframeInterval", type=int, help=f"With archive output, store a complete screenshot at least once every this many screenshots of the same area. Lower values make the archive bigger, but quicker to export from. Currently: {options.keyframeInterval}.", default=options.keyframeInterval)
+    parser.add_argument("--catalog", action=argparse.BooleanOptionalAction, help=f"Add saved screenshots to a catalog in the screenshot folder, with a thumbnail of each, so that they can be searched in the GUI. See the index command. Currently: {options.catalog}.", default=options.catalog)
+    currentStages = ' > '.join(str(stage.get('stage')) for stage in options.stages) or 'none'
+    parser.add_argument("--stage", dest="stages", type=parseStage, action='append', metavar="SPEC", help=f"A processing stage applied to every screenshot before it is saved, in the order given. Can be repeated. scale:FACTOR shrinks it, such as scale:0.5. redact:X,Y,WIDTH,HEIGHT[:COLOR] fills a rectangle, to hide a HUD or a chat. timestamp[:POSITION[:FORMAT]] writes the capture time in a corner, bottom-right by default. Replaces the current stages: {currentStages}.", default=None)
+    parser.add_argument("--no-stages", dest="noStages", action='store_true', help="Forget the current processing stages, and save screenshots as grabbed.")
+    parser.add_argument("--event-log", dest="eventLog", type=Path, help=f"Append every event, such as saved screenshots and failures, to this file as JSON lines, to keep the full history of a session. Currently: {options.eventLog or 'none'}.", default=options.eventLog)
+    parser.add_argument("--no-event-log", dest="noEventLog", action='store_true', help="Keep no event log.")
     parser.add_argument("-s", "--save", action='store_true', help=f"Save the provided options, so that they become the new defaults.")
+    # Used by the startup benchmark: take one screenshot as soon as listening starts, then quit
+    parser.add_argument("--startup-probe", dest="startupProbe", action='store_true', help=argparse.SUPPRESS)
+    subparsers = parser.add_subparsers(dest="command", title="commands", description="Without a command, listen for F12 and take screenshots.")
+    batch = subparsers.add_parser("batch", help="Crop existing images to the captured area or regions. No display is needed.",
+                                  description="Crop every image of a folder to the captured area, or to each region if regions are set, and save the results to the screenshot folder. Interrupted batches resume where they stopped.")
+    batch.add_argument("input", type=Path, help="Folder holding the images to crop")
+    batch.add_argument("-j", "--jobs", type=int, help="Number of processes cropping images. Default: the number of CPUs.", default=None)
+    batch.add_argument("--restart", action='store_true', help="Crop every image again, even those done by a previous batch into the same folder.")
+    batch.add_argument("--no-crop", dest="noCrop", action='store_true', help="Keep the whole images, and only apply the processing stages. Useful to compare stage chains on the same screenshots.")
+    control = subparsers.add_parser("control", help="Send a command to a screenshot cropper listening with a control port.",
+                                    description="Send a command to a screenshot cropper listening with a control port, and print its answer.")
+    control.add_argument("action", choices=CONTROL_ACTIONS, help="capture takes a screenshot and prints the saved paths. stats prints the capture timings and counters.")
+    control.add_argument("-P", "--port", type=int, help=f"Control port of the listening screenshot cropper. Default: {options.controlPort or 'none'}.", default=options.controlPort)
+    control.add_argument("-k", "--key", help="With capture, capture the regions of this key instead of the F12 ones.", default=None)
+    export = subparsers.add_parser("export", help="Save the screenshots of a session archive as image files. No display is needed.",
+                                   description="Save the screenshots of a session archive to the screenshot folder, in the screenshot format, named as they would have been without an archive.")
+    export.add_argument("archive", type=Path, help="The session archive")
+    export.add_argument("--frames", type=parseFrames, metavar="LIST", help="Screenshots to export, numbered from 0, such as 0-9,15. Default: all of them.", default=None)
+    index = subparsers.add_parser("index", help="Add the images already in the screenshot folder to its catalog. No display is needed.",
+                                  description="Add the images of the screenshot folder to its catalog, with their thumbnails, and remove the images that are gone. Interrupted runs resume where they stopped.")
+    index.add_argument("-j", "--jobs", type=int, help="Number of processes reading images. Default: the number of CPUs.", default=None)
+    index.add_argument("--restart", action='store_true', help="Index every image again, even those already in the catalog.")
     return parser.parse_args()
 
 def main():
@@ -38,14 +115,80 @@ def main():
     # Init
     
     logger.setLevel(args.logLevel.upper())
+    if args.command == 'control':
+        runControl(args)
+        return
     
     logger.warning('Initialising')
-    options = Options(args.path, args.x, args.y, args.width, args.height, args.logLevel)
+    options = Options(
+        path=args.path or savedOptions.paths(),
+        xOffset=args.x,
+        yOffset=args.y,
+        width=args.width,
+        height=args.height,
+        logLevel=args.logLevel,
+        workers=args.workers,
+        workerType=args.workerType,
+        queueSize=args.queueSize,
+        backpressure=args.backpressure,
+        backend=args.backend,
+        burstFps=args.burstFps,
+        burstKey=args.burstKey,
+        replaySeconds=args.replaySeconds,
+        replayFps=args.replayFps,
+        replayMemory=args.replayMemory,
+        format=args.format,
+        compressLevel=args.compressLevel,
+        pngStrategy=args.pngStrategy,
+        quality=args.quality,
+        preset=args.preset,
+        indexFile=args.indexFile,
+        stats=args.stats,
+        statsInterval=args.statsInterval,
+        watchThreshold=args.watchThreshold,
+        watchRate=args.watchRate,
+        watchCooldown=args.watchCooldown,
+        dedupe=args.dedupe,
+        dedupeDistance=args.dedupeDistance,
+        dedupeHistory=args.dedupeHistory,
+        regions=[] if args.noRegions else args.regions if args.regions is not None else savedOptions.regions,
+        prewarm=args.prewarm,
+        spoolPath=None if args.noSpool else args.spoolPath,
+        spoolMovers=args.spoolMovers,
+        controlPort=args.controlPort,
+        reloadOptions=args.reloadOptions,
+        minInterval=args.minInterval,
+        captureRate=args.captureRate,
+        captureBucket=args.captureBucket,
+        output=args.output,
+        keyframeInterval=args.keyframeInterval,
+        catalog=args.catalog,
+        stages=[] if args.noStages else args.stages if args.stages is not None else savedOptions.stages,
+        eventLog=None if args.noEventLog else args.eventLog)
     validateOptions(options)
     if args.save:
         saveOptions(options)
     options.path.mkdir(666, True, True)
+    if args.command == 'batch':
+        runBatch(options, args)
+        return
+    if args.command == 'export':
+        runExport(options, args)
+        return
+    if args.command == 'index':
+        runIndex(options, args)
+        return
+    if args.startupProbe:
+        options.stats = True
+    # Imported here so that batches don't need a display or keyboard access, and so that the heavy imports are only paid when listening
+    from scCore.ScreenshotEventHandler import ScreenShotEventHandler
     handler = ScreenShotEventHandler(options)
+    handler.broadcaster.subscribe(StatusPrinter())
+    if args.startupProbe:
+        runStartupProbe(handler)
+        return
+    
+    eventLog = openEventLog(handler.broadcaster, options.eventLog) if options.eventLog else None
     
     optionsReport = 'Using Options:{ ' + options.toString() +' }'
     print(optionsReport)
@@ -59,8 +202,122 @@ def main():
     finally:
         # Probably unecessary
         handler.stopListening()
+        if eventLog:
+            closeEventLog(handler.broadcaster, *eventLog)
+            print(f'{eventLog[1].written} events written to {options.eventLog}')
+        if options.stats:
+            print(handler.metrics.summaryTable())
+        if handler.spool:
+            files, size = handler.spool.backlog()
+            if files:
+                print(f'{files} screenshots ({size / (1024 * 1024):.1f} MB) are still in the spool. They will be moved to {options.path} on the next start.')
+        if handler.archive and handler.archive.path:
+            print(summaryText(handler.archive.summary()))
+
+class StatusPrinter(Subscriber):
+    """Prints the spool backlog whenever it changes, so that a slow destination is noticed while listening, the
+    options applied from the options file, and key presses suppressed by the capture limits
+    """
+    def trigger(self, event:Event) -> None:
+        if event.type in (EventType.BACKLOG, EventType.OPTIONS, EventType.SUPPRESSED):
+            print(event.text)
+
+def runStartupProbe(handler) -> None:
+    """Start listening, take a single screenshot, and report when each is done on stdout
+    """
+    try:
+        handler.startListening()
+        print(STARTUP_PROBE_LISTENING, flush=True)
+        handler.takeScreenshot()
+    finally:
+        handler.stopListening()
+    print(f"{STARTUP_PROBE_FIRST_SHOT} {handler.metrics.summary()['total']['max']:.2f}", flush=True)
+
+def runControl(args: argparse.Namespace) -> None:
+    """Send args.action to the control server of a listening screenshot cropper, and print the answer
+    """
+    from scCore.ControlClient import ControlClient
+    if not args.port:
+        raise ValueError('No control port given. Use --port, or save a control port.')
+    client = ControlClient(args.port)
+    try:
+        if args.action == 'capture':
+            result = client.capture(args.key)
+            for path in result['paths']:
+                print(path)
+            if result['skipped']:
+                print(f"{result['skipped']} screenshots skipped or dropped")
+        elif args.action == 'burst-start':
+            print(client.startBurst())
+        elif args.action == 'burst-stop':
+            print(client.stopBurst())
+        else:
+            print(json.dumps(client.stats(), indent=4))
+    finally:
+        client.close()
+
+def runBatch(options: Options, args: argparse.Namespace) -> None:
+    """Crop the images of args.input into options.path
+    """
+    from scCore.BatchCropper import BatchCropper
+    from scCore.Encoders import createEncoder
+    if not args.input.is_dir():
+        raise ValueError(f'Input folder not found: {args.input}')
+    if args.input.resolve() == options.path.resolve():
+        raise ValueError('The input folder must not be the screenshot folder')
+    if args.jobs is not None:
+        validatePositive('Jobs', args.jobs)
+    if args.noCrop:
+        regions = [(None, None)]
+    elif options.regions:
+        regions = [(region.name, region.box()) for region in options.regions]
+    else:
+        regions = [(None, options.region())]
+    encoder = createEncoder(options.format, options.compressLevel, options.pngStrategy, options.quality, options.preset)
+    processing = createChain(options.stages)
+    cropper = BatchCropper(args.input, options.path, regions, encoder, args.jobs, not args.restart, processing)
+    print(f'Cropping the images of {args.input} into {options.path} with {cropper.jobs} processes'
+          + (f', processing: {processing.describe()}' if processing else ''))
+    summary = cropper.run(print)
+    report = f"Done: {summary['done']} files cropped in {summary['seconds']:.1f}s ({summary['filesPerSecond']:.1f} files/s), {summary['skipped']} already done, {summary['failed']} failed"
+    if summary['stages'] and summary['done']:
+        report += '\nProcessing per file: ' + ', '.join(f"{label} {seconds / summary['done'] * 1000:.1f} ms" for label, seconds in summary['stages'].items())
+    print(report)
+    logger.warning(report)
+
+def runExport(options: Options, args: argparse.Namespace) -> None:
+    """Save the screenshots of args.archive into options.path
+    """
+    from scCore.SessionArchive import exportArchive
+    from scCore.ScreenshotNamer import ScreenShotNamer
+    from scCore.Encoders import createEncoder
+    if not args.archive.is_file():
+        raise ValueError(f'Session archive not found: {args.archive}')
+    encoder = createEncoder(options.format, options.compressLevel, options.pngStrategy, options.quality, options.preset)
+    namer = ScreenShotNamer(options.path, encoder.suffix, options.indexFile)
+    print(f'Exporting the screenshots of {args.archive} into {options.path}')
+    summary = exportArchive(args.archive, namer, encoder, args.frames, lambda done, total: print(f'{done}/{total}', end='\r'))
+    report = f"Done: {summary['files']} screenshots exported, {summary['bytes'] / (1024 * 1024):.1f} MB as {options.format} files."
+    if args.frames is None:
+        report += f" The archive is {summary['archiveBytes'] / (1024 * 1024):.1f} MB ({summary['ratio']:.1f}x)."
+    print(report)
+    logger.warning(report)
+
+def runIndex(options: Options, args: argparse.Namespace) -> None:
+    """Add the images of options.path to its catalog
+    """
+    from scCore.Catalog import CatalogIndexer
+    if args.jobs is not None:
+        validatePositive('Jobs', args.jobs)
+    indexer = CatalogIndexer(options.path, args.jobs, args.restart)
+    print(f'Indexing the images of {options.path} with {indexer.jobs} processes')
+    summary = indexer.run(print)
+    report = f"Done: {summary['done']} images indexed in {summary['seconds']:.1f}s ({summary['filesPerSecond']:.1f} images/s), {summary['skipped']} already done, {summary['removed']} removed, {summary['failed']} failed"
+    print(report)
+    logger.warning(report)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     try:
         main()
     except Exception as e:
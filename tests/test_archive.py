@@ -0,0 +1,205 @@
+"""Keyframes and deltas of session archives, reading them back in any order, reserved slots and frame lists
+Run with: python -m pytest tests
+"""
+from scCore.SessionArchive import SessionArchive, ArchiveReader, KIND_KEYFRAME, KIND_DELTA, exportArchive, parseFrames, packDelta
+from scCore.CaptureBackend import SyntheticBackend
+from scCore.ScreenshotNamer import ScreenShotNamer
+from scCore.Encoders import PngEncoder
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+from PIL import Image
+import tempfile
+import threading
+import unittest
+import random
+
+REGIONS = {'left': (0, 0, 96, 54), 'right': (40, 20, 64, 64)}
+
+class BrokenImage(object):
+    """Fails when its pixels are read, as an image whose processing went wrong would"""
+    mode = 'RGB'
+    size = (96, 54)
+
+    def tobytes(self):
+        raise OSError('Pixels could not be read')
+
+def failOnce(function):
+    """function, except that its first call fails"""
+    calls = []
+    def failFirst(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise OSError('Out of memory')
+        return function(*args)
+    return failFirst
+
+class TestSessionArchive(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.folder = Path(self._folder.name)
+        self.backend = SyntheticBackend()
+        self.random = random.Random(4)
+        self.backgrounds = {}
+        self.archive = SessionArchive(self.folder, keyframeInterval=4)
+        self.archive.open()
+
+    def tearDown(self):
+        self.archive.close()
+        self._folder.cleanup()
+
+    def grab(self, count:int) -> list:
+        """(label, image) of count screenshots, alternating between the regions. Each shows noise, which compresses
+        badly as a keyframe, with a small patch that changes from one screenshot to the next, so that deltas are small.
+        """
+        shots = []
+        for i in range(count):
+            label = list(REGIONS)[i % len(REGIONS)]
+            x, y, width, height = REGIONS[label]
+            if label not in self.backgrounds:
+                self.backgrounds[label] = Image.frombytes('RGB', (width, height), self.random.randbytes(width * height * 3))
+            image = self.backgrounds[label].copy()
+            image.paste(self.backend.grab((x, y, 16, 8)), (i % (width - 16), i % (height - 8)))
+            shots.append((label, image))
+        return shots
+
+    def reader(self) -> ArchiveReader:
+        self.archive.close()
+        reader = ArchiveReader(self.archive.path)
+        self.addCleanup(reader.close)
+        return reader
+
+    def testRoundTrip(self):
+        shots = self.grab(20)
+        captured = datetime(2026, 1, 2, 3, 4, 5)
+        numbers = [self.archive.append(image, label=label, captured=captured) for label, image in shots]
+        self.assertEqual(numbers, list(range(20)))
+        summary = self.archive.close()
+        self.assertEqual((summary['frames'], summary['keyframes']), (20, 6))
+        reader = self.reader()
+        self.assertEqual(len(reader), 20)
+        for number, (label, image) in enumerate(shots):
+            info = reader.info(number)
+            self.assertEqual((info['label'], info['time']), (label, captured.isoformat()))
+            # Each region has its own chain, with a keyframe every 4 screenshots
+            self.assertEqual(info['kind'], KIND_KEYFRAME if number // 2 % 4 == 0 else KIND_DELTA)
+            self.assertEqual(reader.image(number).tobytes(), image.tobytes())
+
+    def testConvertsToRgb(self):
+        image = self.grab(1)[0][1].convert('RGBA')
+        self.archive.append(image)
+        self.assertEqual(self.reader().image(0).tobytes(), image.convert('RGB').tobytes())
+
+    def testRandomAccess(self):
+        shots = self.grab(24)
+        for label, image in shots:
+            self.archive.append(image, label=label)
+        reader = self.reader()
+        numbers = list(range(len(shots))) * 2
+        self.random.shuffle(numbers)
+        for number in numbers:
+            self.assertEqual(reader.image(number).tobytes(), shots[number][1].tobytes())
+
+    def testSkippedSlot(self):
+        shots = self.grab(6)
+        slots = [self.archive.reserve() for shot in shots]
+        numbers = {}
+        def append(i):
+            label, image = shots[i]
+            numbers[i] = self.archive.append(image, label=label, slot=slots[i])
+        # Appended in reverse, so that each waits for the slots before it
+        threads = [threading.Thread(target=append, args=(i,)) for i in reversed(range(6)) if i != 2]
+        for thread in threads:
+            thread.start()
+        self.archive.skip(slots[2])
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(numbers, {0: 0, 1: 1, 3: 2, 4: 3, 5: 4})
+        kept = [shot for i, shot in enumerate(shots) if i != 2]
+        reader = self.reader()
+        self.assertEqual([reader.info(number)['label'] for number in range(len(kept))], [label for label, image in kept])
+        for number, (label, image) in enumerate(kept):
+            self.assertEqual(reader.image(number).tobytes(), image.tobytes())
+
+    def testFailedScreenshot(self):
+        first, second = (image for label, image in self.grab(3)[::2])
+        self.archive.append(first, label='left')
+        with self.assertRaises(OSError):
+            self.archive.append(BrokenImage(), label='left')
+        self.archive.append(second, label='left')
+        reader = self.reader()
+        self.assertEqual(len(reader), 2)
+        self.assertEqual((reader.info(1)['kind'], reader.info(1)['ref']), (KIND_DELTA, 0))
+        self.assertEqual(reader.image(1).tobytes(), second.tobytes())
+
+    def testFailedReference(self):
+        # The second screenshot fails once compared, so the third, a delta from it, has nothing to refer to
+        shots = [image for label, image in self.grab(5)[::2]]
+        with mock.patch('scCore.SessionArchive.packDelta', side_effect=failOnce(packDelta)):
+            self.archive.append(shots[0], label='left')
+            with self.assertRaises(OSError):
+                self.archive.append(shots[1], label='left')
+            self.archive.append(shots[2], label='left')
+        reader = self.reader()
+        self.assertEqual([reader.info(number)['kind'] for number in range(2)], [KIND_KEYFRAME, KIND_KEYFRAME])
+        self.assertEqual(reader.image(1).tobytes(), shots[2].tobytes())
+
+    def testLargeDelta(self):
+        # A bar sweeping across a gradient changes every row, and compresses worse as a delta than as a keyframe
+        images = [self.backend.grab(REGIONS['left']) for i in range(3)]
+        for image in images:
+            self.archive.append(image)
+        reader = self.reader()
+        self.assertEqual([reader.info(number)['kind'] for number in range(3)], [KIND_KEYFRAME] * 3)
+        self.assertEqual(reader.image(2).tobytes(), images[2].tobytes())
+
+    def testReopen(self):
+        shots = self.grab(4)
+        for label, image in shots[:2]:
+            self.archive.append(image, label=label)
+        first = self.archive.path
+        other = self.folder / 'other'
+        self.assertEqual(self.archive.reopen(other)['frames'], 2)
+        for label, image in shots[2:]:
+            self.archive.append(image, label=label)
+        reader = self.reader()
+        self.assertEqual(reader.path.parent, other)
+        # A new archive starts its regions over with keyframes
+        self.assertEqual([reader.info(number)['kind'] for number in range(2)], [KIND_KEYFRAME, KIND_KEYFRAME])
+        self.assertEqual(reader.image(1).tobytes(), shots[3][1].tobytes())
+        reader = ArchiveReader(first)
+        self.addCleanup(reader.close)
+        self.assertEqual(len(reader), 2)
+        self.assertEqual(reader.image(1).tobytes(), shots[1][1].tobytes())
+
+    def testExport(self):
+        shots = self.grab(3)
+        for label, image in shots:
+            self.archive.append(image, label=label, captured=datetime(2026, 1, 2, 12))
+        self.archive.close()
+        exported = self.folder / 'exported'
+        exported.mkdir()
+        result = exportArchive(self.archive.path, ScreenShotNamer(exported), PngEncoder(), [0, 2])
+        self.assertEqual(result['files'], 2)
+        names = sorted(path.name for path in exported.iterdir())
+        self.assertEqual(names, ['Screenshot 2026-01-02_1_left.png', 'Screenshot 2026-01-02_2_left.png'])
+        with Image.open(exported / names[1]) as image:
+            self.assertEqual(image.tobytes(), shots[2][1].tobytes())
+
+    def testNotAnArchive(self):
+        path = self.folder / 'notes.scarc'
+        path.write_bytes(b'not an archive')
+        with self.assertRaises(ValueError):
+            ArchiveReader(path)
+
+class TestParseFrames(unittest.TestCase):
+    def testNumbersAndRanges(self):
+        self.assertEqual(parseFrames('0-3,7, 9 ,12-12'), [0, 1, 2, 3, 7, 9, 12])
+
+    def testBadFormat(self):
+        for text in ('', 'a', '3-', '1,,2', '1-2-3'):
+            with self.assertRaises(ValueError, msg=text):
+                parseFrames(text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+"""Memory used to save one shot of a large area, measured as in scBench.MemoryBenchmark
+Run with: python -m pytest tests
+"""
+from scBench.MemoryBenchmark import peakPerShot, frameMb
+import importlib.util
+import unittest
+import os
+
+# Two 4K monitors side by side
+WIDTH, HEIGHT = 7680, 2160
+# MB a streamed shot may use on top of the grabbed frame
+BUDGET_MB = 16
+
+measurable = os.path.exists('/proc/self/clear_refs') or importlib.util.find_spec('psutil') is not None
+streamable = importlib.util.find_spec('numpy') is not None
+
+@unittest.skipUnless(measurable, 'Measuring memory needs Linux, or the psutil package')
+class TestShotMemory(unittest.TestCase):
+    @unittest.skipUnless(streamable, 'PNG strip encoding needs numpy')
+    def testStreamedPng(self):
+        self.assertLess(peakPerShot(WIDTH, HEIGHT, 'png', streamed=True), BUDGET_MB)
+
+    def testStreamedRaw(self):
+        self.assertLess(peakPerShot(WIDTH, HEIGHT, 'raw', streamed=True), BUDGET_MB)
+
+    def testBufferedIsMeasured(self):
+        # Encoding in memory holds about a whole encoded frame, which must show, or the budget checks prove nothing
+        self.assertGreater(peakPerShot(WIDTH, HEIGHT, 'raw', streamed=False), frameMb(WIDTH, HEIGHT) / 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+"""Copies to mirror folders: the limit on waiting copies, stopping stuck mirrors, and copies handed over by the pipeline
+Run with: python -m pytest tests
+"""
+from scCore.MirrorWriter import MirrorWriter, stopMirrors
+from scCore.CapturePipeline import CapturePipeline
+from scCore.ScreenshotNamer import ScreenShotNamer
+from scCore.CaptureBackend import SyntheticBackend
+from scCore.Encoders import PngEncoder
+from scCore.Broadcaster import Broadcaster
+from pathlib import Path
+from unittest import mock
+import tempfile
+import threading
+import unittest
+import time
+
+# Seconds stop is given for mirrors that are stuck
+SHORT_TIMEOUT = 0.3
+REGION = (0, 0, 160, 90)
+
+class StuckMirror(MirrorWriter):
+    """Hangs on copies of b'stuck' until the gate opens, like a folder on a drive that stopped answering"""
+    def __init__(self, folder:Path, gate:threading.Event):
+        super().__init__(folder, Broadcaster())
+        self.gate = gate
+        self.threads = set()
+
+    def _write(self, job, data:bytes) -> None:
+        self.threads.add(threading.current_thread())
+        if data == b'stuck':
+            self.gate.wait()
+        super()._write(job, data)
+
+class BrokenEncoder(PngEncoder):
+    def encode(self, image, fp) -> None:
+        raise OSError('Encoder failed')
+
+class MirrorTestCase(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.folder = Path(self._folder.name)
+        self.gate = threading.Event()
+        # Opened before the folder is removed, so that stuck threads finish
+        self.addCleanup(self._folder.cleanup)
+        self.addCleanup(self.gate.set)
+
+    def contents(self, folder:Path) -> list:
+        return [path.read_bytes() for path in sorted(folder.iterdir(), key=lambda path: int(path.stem.split('_')[1]))]
+
+    def copy(self, mirror:MirrorWriter, data:bytes) -> None:
+        mirror.reserve(suffix='.png').resolve(data)
+
+class TestMirrorWriter(MirrorTestCase):
+    def testWritesInOrder(self):
+        mirror = MirrorWriter(self.folder / 'mirror', Broadcaster())
+        mirror.start()
+        jobs = [mirror.reserve(suffix='.png') for i in range(5)]
+        # Resolved out of order, as workers finish encoding
+        for i in (3, 0, 4, 2, 1):
+            jobs[i].resolve(bytes([i]))
+        self.assertEqual(mirror.stop(5), 0)
+        self.assertEqual(self.contents(mirror.folder), [bytes([i]) for i in range(5)])
+        self.assertEqual(mirror.summary(), {'written': 5, 'failed': 0, 'pending': 0})
+
+    def testDropsOldestAtMaxPending(self):
+        mirror = MirrorWriter(self.folder / 'mirror', Broadcaster(), maxPending=3)
+        # Not started yet, so that every copy waits
+        jobs = [mirror.reserve(suffix='.png') for i in range(5)]
+        self.assertEqual((mirror.pendingCount(), mirror.dropped, mirror.failed), (3, 2, 2))
+        mirror.start()
+        for i, job in enumerate(jobs):
+            job.resolve(bytes([i]))
+        mirror.stop(5)
+        self.assertEqual(self.contents(mirror.folder), [bytes([2]), bytes([3]), bytes([4])])
+
+    def testUnresolvedCopySkipped(self):
+        mirror = MirrorWriter(self.folder / 'mirror', Broadcaster())
+        mirror.start()
+        self.copy(mirror, None)
+        self.copy(mirror, b'saved')
+        mirror.stop(5)
+        self.assertEqual(self.contents(mirror.folder), [b'saved'])
+
+    def testStopAllSharesDeadline(self):
+        mirrors = [StuckMirror(self.folder / f'mirror{i}', self.gate) for i in range(3)]
+        for mirror in mirrors:
+            mirror.start()
+            self.copy(mirror, b'stuck')
+            self.copy(mirror, b'waiting')
+        start = time.monotonic()
+        left = stopMirrors(mirrors, SHORT_TIMEOUT)
+        # Three stuck mirrors stopped one after the other would take three timeouts
+        self.assertLess(time.monotonic() - start, 2 * SHORT_TIMEOUT)
+        self.assertEqual(left, 6)
+
+    def testOneWriterAfterStuckStop(self):
+        mirror = StuckMirror(self.folder / 'mirror', self.gate)
+        mirror.start()
+        self.copy(mirror, b'stuck')
+        self.assertEqual(mirror.stop(SHORT_TIMEOUT), 1)
+        stuck = mirror._thread
+        self.assertTrue(stuck.is_alive())
+        # Started again while the old writer is still stuck: no second thread writes to the folder
+        mirror.start()
+        self.assertIs(mirror._thread, stuck)
+        self.copy(mirror, b'after')
+        self.gate.set()
+        self.assertEqual(mirror.stop(5), 0)
+        self.assertFalse(stuck.is_alive())
+        self.assertEqual(mirror.threads, {stuck})
+        self.assertEqual(self.contents(mirror.folder), [b'stuck', b'after'])
+        # A clean stop lets the next start make a new thread
+        mirror.start()
+        self.copy(mirror, b'again')
+        self.assertEqual(mirror.stop(5), 0)
+        self.assertEqual(len(mirror.threads), 2)
+        self.assertEqual(self.contents(mirror.folder), [b'stuck', b'after', b'again'])
+
+class TestPipelineCopies(MirrorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.backend = SyntheticBackend()
+        self.mirror = MirrorWriter(self.folder / 'mirror', Broadcaster())
+        self.mirror.start()
+
+    def save(self, encoder=PngEncoder(), namer:ScreenShotNamer=None):
+        pipeline = CapturePipeline(namer or ScreenShotNamer(self.folder), Broadcaster(), encoder=encoder, mirrors=[self.mirror])
+        pipeline.start()
+        future = pipeline.submit(self.backend.grab(REGION))
+        pipeline.stop()
+        return future
+
+    def testCopiesMatchFile(self):
+        path = self.save().result()
+        self.assertEqual(self.mirror.stop(5), 0)
+        self.assertEqual(self.contents(self.mirror.folder), [path.read_bytes()])
+
+    def testFailedEncodeResolvesCopies(self):
+        future = self.save(BrokenEncoder())
+        with self.assertRaises(OSError):
+            future.result()
+        # The copy was resolved with nothing, so stop doesn't wait for it
+        start = time.monotonic()
+        self.assertEqual(self.mirror.stop(5), 0)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(list(self.mirror.folder.iterdir()), [])
+
+    def testCopiedWhenNotNamed(self):
+        namer = ScreenShotNamer(self.folder)
+        with mock.patch.object(namer, 'nextFreePath', side_effect=ValueError('Unable to find free path for screenshot!')):
+            future = self.save(namer=namer)
+        with self.assertRaises(ValueError):
+            future.result()
+        self.assertEqual(self.mirror.stop(5), 0)
+        self.assertEqual(len(list(self.mirror.folder.iterdir())), 1)
+
+if __name__ == '__main__':
+    unittest.main()
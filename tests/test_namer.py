@@ -0,0 +1,167 @@
+"""Name reservation and index sidecar of the screenshot namer, and removal of the reserved file when saving fails
+Run with: python -m pytest tests
+"""
+from scCore.ScreenshotNamer import ScreenShotNamer, SIDECAR_NAME, createExclusive
+from scCore.CapturePipeline import CapturePipeline
+from scCore.SpoolMover import SpoolMover
+from scCore.Encoders import Encoder
+from scCore.Broadcaster import Broadcaster
+from datetime import date
+from pathlib import Path
+from unittest import mock
+from PIL import Image
+import tempfile
+import threading
+import unittest
+import json
+
+DAY = date(2026, 1, 2)
+
+def name(index:int) -> str:
+    return f'Screenshot 2026-01-02_{index}.png'
+
+class BrokenEncoder(Encoder):
+    """Writes the start of a file, then fails, like a full drive"""
+    suffix = '.png'
+
+    def encode(self, image, fp) -> None:
+        fp.write(b'\x89PNG')
+        raise OSError('No space left on device')
+
+class TestNameReservation(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.folder = Path(self._folder.name)
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def testCreateExclusive(self):
+        path = self.folder / name(1)
+        createExclusive(path)
+        self.assertEqual(path.stat().st_size, 0)
+        with self.assertRaises(FileExistsError):
+            createExclusive(path)
+
+    def testReservedPathExists(self):
+        path = ScreenShotNamer(self.folder).nextFreePath(day=DAY)
+        self.assertEqual(path, self.folder / name(1))
+        self.assertTrue(path.exists())
+
+    def testSkipsFileWrittenAfterScan(self):
+        namer = ScreenShotNamer(self.folder)
+        self.assertEqual(namer.nextFreePath(day=DAY).name, name(1))
+        # Another program takes the next name after the folder was scanned
+        (self.folder / name(2)).write_bytes(b'not ours')
+        self.assertEqual(namer.nextFreePath(day=DAY).name, name(3))
+        self.assertEqual((self.folder / name(2)).read_bytes(), b'not ours')
+
+    def testGroupsShareIndex(self):
+        namer = ScreenShotNamer(self.folder)
+        paths = [namer.nextFreePath(7, i, 'left', DAY) for i in range(2)] + [namer.nextFreePath(day=DAY)]
+        self.assertEqual([path.name for path in paths], ['Screenshot 2026-01-02_1_000_left.png', 'Screenshot 2026-01-02_1_001_left.png', name(2)])
+
+    def testConcurrentNamers(self):
+        # Namers of several programs saving to the same folder never hand out the same name
+        count = 50
+        results = [[] for i in range(4)]
+        def nameAll(paths):
+            namer = ScreenShotNamer(self.folder)
+            for i in range(count):
+                paths.append(namer.nextFreePath(day=DAY))
+        threads = [threading.Thread(target=nameAll, args=(paths,)) for paths in results]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        paths = [path for paths in results for path in paths]
+        self.assertEqual(len(paths), 4 * count)
+        self.assertEqual(len(set(paths)), len(paths))
+        self.assertEqual(len(list(self.folder.iterdir())), len(paths))
+        # Each namer's own names still go up
+        for namerPaths in results:
+            indexes = [int(path.stem.split('_')[1]) for path in namerPaths]
+            self.assertEqual(indexes, sorted(indexes))
+
+class TestSidecar(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.folder = Path(self._folder.name)
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def writeSidecar(self, text:str) -> None:
+        (self.folder / SIDECAR_NAME).write_text(text)
+
+    def testCloseWritesLastIndex(self):
+        namer = ScreenShotNamer(self.folder, sidecar=True)
+        for i in range(3):
+            namer.nextFreePath(day=DAY)
+        namer.close()
+        self.assertEqual(json.loads((self.folder / SIDECAR_NAME).read_text()), {'2026-01-02': 3})
+
+    def testSidecarAvoidsScan(self):
+        self.writeSidecar('{"2026-01-02": 5}')
+        namer = ScreenShotNamer(self.folder, sidecar=True)
+        with mock.patch.object(namer, 'scanIndex') as scanIndex:
+            self.assertEqual(namer.nextFreePath(day=DAY).name, name(6))
+        scanIndex.assert_not_called()
+
+    def testOutOfDateSidecar(self):
+        # Screenshots saved by a run that crashed before writing the sidecar
+        self.writeSidecar('{"2026-01-02": 1}')
+        for i in range(1, 5):
+            (self.folder / name(i)).write_bytes(b'saved')
+        namer = ScreenShotNamer(self.folder, sidecar=True)
+        self.assertEqual(namer.nextFreePath(day=DAY).name, name(5))
+        for i in range(1, 5):
+            self.assertEqual((self.folder / name(i)).read_bytes(), b'saved')
+
+    def testUnreadableSidecar(self):
+        self.writeSidecar('{"2026-01-02": ')
+        (self.folder / name(2)).write_bytes(b'saved')
+        namer = ScreenShotNamer(self.folder, sidecar=True)
+        self.assertEqual(namer.nextFreePath(day=DAY).name, name(3))
+
+    def testSidecarIgnoredWhenDisabled(self):
+        self.writeSidecar('{"2026-01-02": 5}')
+        namer = ScreenShotNamer(self.folder)
+        self.assertEqual(namer.nextFreePath(day=DAY).name, name(1))
+        namer.close()
+        self.assertEqual((self.folder / SIDECAR_NAME).read_text(), '{"2026-01-02": 5}')
+
+class TestFailedSave(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.folder = Path(self._folder.name)
+        self.image = Image.new('RGB', (64, 48), (20, 40, 60))
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def save(self, folder:Path, **kwargs) -> None:
+        pipeline = CapturePipeline(ScreenShotNamer(folder), Broadcaster(), encoder=BrokenEncoder(), **kwargs)
+        pipeline.start()
+        future = pipeline.submit(self.image)
+        pipeline.stop()
+        with self.assertRaises(OSError):
+            future.result()
+
+    def testEncodedInMemory(self):
+        self.save(self.folder)
+        self.assertEqual(list(self.folder.iterdir()), [])
+
+    def testStreamedToFile(self):
+        self.save(self.folder, streamMinPixels=0)
+        self.assertEqual(list(self.folder.iterdir()), [])
+
+    def testSpooled(self):
+        spoolDir = self.folder / 'spool'
+        spoolDir.mkdir()
+        spool = SpoolMover(spoolDir, self.folder / 'destination', Broadcaster())
+        self.save(spoolDir, spool=spool, streamMinPixels=0)
+        self.assertEqual(list(spoolDir.iterdir()), [])
+
+if __name__ == '__main__':
+    unittest.main()
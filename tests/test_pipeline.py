@@ -0,0 +1,153 @@
+"""Backpressure of the frame queue, and ordering and shutdown of the capture pipeline, on synthetic frames
+Run with: python -m pytest tests
+"""
+from scCore.CapturePipeline import CapturePipeline, FrameQueue, Frame, Backpressure
+from scCore.CaptureBackend import SyntheticBackend
+from scCore.ScreenshotNamer import ScreenShotNamer, NAME_REGEX
+from scCore.Broadcaster import Broadcaster, Subscriber, EventType
+from pathlib import Path
+from PIL import Image
+import tempfile
+import threading
+import unittest
+
+# Long enough for a thread that should be blocked to have run, if it wasn't
+BLOCKED_WAIT = 0.2
+REGION = (0, 0, 160, 90)
+
+class Recorder(Subscriber):
+    def __init__(self):
+        self.events = []
+
+    def trigger(self, event) -> None:
+        self.events.append(event)
+
+def frames(count:int) -> list:
+    return [Frame(Image.new('RGB', (4, 4), (i, 0, 0))) for i in range(count)]
+
+class TestFrameQueue(unittest.TestCase):
+    def testBlockWaitsForRoom(self):
+        queue = FrameQueue(1, Backpressure.BLOCK)
+        first, second = frames(2)
+        self.assertEqual(queue.put(first), (True, None))
+        done = threading.Event()
+        thread = threading.Thread(target=lambda: (queue.put(second), done.set()))
+        thread.start()
+        self.assertFalse(done.wait(BLOCKED_WAIT))
+        self.assertIs(queue.get(), first)
+        thread.join(5)
+        self.assertTrue(done.is_set())
+        self.assertIs(queue.get(), second)
+        self.assertEqual(queue.dropped, 0)
+
+    def testDropOldest(self):
+        queue = FrameQueue(2, Backpressure.DROP_OLDEST)
+        first, second, third = frames(3)
+        queue.put(first)
+        queue.put(second)
+        self.assertEqual(queue.put(third), (True, first))
+        self.assertEqual([queue.get(), queue.get()], [second, third])
+        self.assertEqual(queue.dropped, 1)
+
+    def testDropNewest(self):
+        queue = FrameQueue(2, Backpressure.DROP_NEWEST)
+        first, second, third = frames(3)
+        queue.put(first)
+        queue.put(second)
+        self.assertEqual(queue.put(third), (True, third))
+        self.assertEqual([queue.get(), queue.get()], [first, second])
+        self.assertEqual(queue.dropped, 1)
+
+    def testWaitOverridesDropPolicy(self):
+        queue = FrameQueue(1, Backpressure.DROP_OLDEST)
+        first, second = frames(2)
+        queue.put(first)
+        thread = threading.Thread(target=queue.put, args=(second, True))
+        thread.start()
+        thread.join(BLOCKED_WAIT)
+        self.assertTrue(thread.is_alive())
+        self.assertIs(queue.get(), first)
+        thread.join(5)
+        self.assertIs(queue.get(), second)
+
+    def testClosedQueueRefusesFrames(self):
+        queue = FrameQueue(2, Backpressure.BLOCK)
+        first, second = frames(2)
+        queue.put(first)
+        queue.close()
+        self.assertEqual(queue.put(second), (False, None))
+        self.assertEqual(queue.dropped, 0)
+        # Frames queued before closing can still be taken
+        self.assertIs(queue.get(), first)
+        self.assertIsNone(queue.get())
+
+    def testCloseReleasesBlockedPut(self):
+        queue = FrameQueue(1, Backpressure.BLOCK)
+        first, second = frames(2)
+        queue.put(first)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(queue.put(second)))
+        thread.start()
+        thread.join(BLOCKED_WAIT)
+        queue.close()
+        thread.join(5)
+        self.assertEqual(results, [(False, None)])
+
+class TestCapturePipeline(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.folder = Path(self._folder.name)
+        self.backend = SyntheticBackend()
+        self.broadcaster = Broadcaster()
+        self.recorder = Recorder()
+        self.subscription = self.broadcaster.subscribe(self.recorder, polled=True)
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def pipeline(self, **kwargs) -> CapturePipeline:
+        pipeline = CapturePipeline(ScreenShotNamer(self.folder), self.broadcaster, **kwargs)
+        pipeline.start()
+        return pipeline
+
+    def testNamesFollowSubmitOrder(self):
+        pipeline = self.pipeline(workers=4, queueSize=32)
+        images = [self.backend.grab(REGION) for i in range(24)]
+        futures = [pipeline.submit(image) for image in images]
+        pipeline.stop()
+        paths = [future.result(5) for future in futures]
+        indexes = [int(NAME_REGEX.fullmatch(path.name).group(2)) for path in paths]
+        self.assertEqual(indexes, list(range(1, len(images) + 1)))
+        for path, image in zip(paths, images):
+            with Image.open(path) as saved:
+                self.assertEqual(saved.tobytes(), image.tobytes())
+
+    def testStopWritesQueuedFrames(self):
+        pipeline = self.pipeline(workers=2, queueSize=16)
+        futures = [pipeline.submit(self.backend.grab(REGION)) for i in range(16)]
+        pipeline.stop()
+        for future in futures:
+            self.assertTrue(future.done())
+            self.assertTrue(future.result().stat().st_size > 0)
+        self.assertEqual(len(list(self.folder.glob('*.png'))), 16)
+
+    def testSubmitAfterStop(self):
+        pipeline = self.pipeline()
+        pipeline.stop()
+        future = pipeline.submit(self.backend.grab(REGION))
+        self.assertIsNone(future.result(5))
+        self.assertEqual(pipeline.droppedCount(), 0)
+        self.subscription.deliver()
+        texts = [event.text for event in self.recorder.events if event.type == EventType.FAILURE]
+        self.assertEqual(texts, ['Screenshot dropped, pipeline stopped'])
+
+    def testRestartAfterStop(self):
+        pipeline = self.pipeline()
+        pipeline.stop()
+        pipeline.start()
+        path = pipeline.submit(self.backend.grab(REGION)).result(5)
+        pipeline.stop()
+        self.assertTrue(path.exists())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+"""Processing stages: the order of a chain, the Stage contract, the stages themselves, and running without numpy
+Run with: python -m pytest tests
+"""
+from scCore.Processing import (Stage, StageChain, ScaleStage, RedactStage, TimestampStage, createChain, createStage,
+                               parseStage, TIMESTAMP_PADDING)
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+from PIL import Image, ImageOps
+import importlib.util
+import subprocess
+import unittest
+import sys
+
+streamable = importlib.util.find_spec('numpy') is not None
+
+class Recording(Stage):
+    """Appends its name to a shared list, and paints its colour over the first pixel"""
+    def __init__(self, name:str, calls:list, color:tuple):
+        self.name = name
+        self.calls = calls
+        self.color = color
+
+    def apply(self, pixels, captured:datetime):
+        self.calls.append(self.name)
+        pixels[0, 0] = self.color
+        return pixels
+
+def gradient(width:int, height:int):
+    return Image.linear_gradient('L').resize((width, height)).convert('RGB')
+
+class TestStageContract(unittest.TestCase):
+    def testStageIsAbstract(self):
+        with self.assertRaises(TypeError):
+            Stage()
+
+    def testApplyIsRequired(self):
+        class Incomplete(Stage):
+            name = 'incomplete'
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    @unittest.skipUnless(streamable, 'Processing stages need numpy')
+    def testStageMayReturnNewArray(self):
+        class Crop(Stage):
+            name = 'crop'
+            def apply(self, pixels, captured):
+                return pixels[:10, :20]
+        self.assertEqual(StageChain([Crop()]).apply(gradient(64, 48)).size, (20, 10))
+
+@unittest.skipUnless(streamable, 'Processing stages need numpy')
+class TestStageChain(unittest.TestCase):
+    def testOrder(self):
+        calls = []
+        chain = StageChain([Recording('first', calls, (255, 0, 0)), Recording('second', calls, (0, 255, 0))])
+        image = chain.apply(gradient(8, 8))
+        self.assertEqual(calls, ['first', 'second'])
+        # The last stage's paint is the one left
+        self.assertEqual(image.getpixel((0, 0)), (0, 255, 0))
+
+    def testOrderChangesResult(self):
+        image = Image.new('RGB', (64, 48), (255, 255, 255))
+        scaleFirst = createChain([{'stage': 'scale', 'factor': 0.5}, {'stage': 'redact', 'xOffset': 0, 'yOffset': 0, 'width': 16, 'height': 16}])
+        redactFirst = createChain([{'stage': 'redact', 'xOffset': 0, 'yOffset': 0, 'width': 16, 'height': 16}, {'stage': 'scale', 'factor': 0.5}])
+        # Positions are in pixels of the screenshot as it is when the stage runs
+        self.assertEqual(ImageOps.invert(scaleFirst.apply(image)).getbbox(), (0, 0, 16, 16))
+        self.assertEqual(ImageOps.invert(redactFirst.apply(image)).getbbox(), (0, 0, 8, 8))
+
+    def testRecordLabels(self):
+        chain = createChain([{'stage': 'scale', 'factor': 0.5}, {'stage': 'redact', 'xOffset': 0, 'yOffset': 0, 'width': 1, 'height': 1}, {'stage': 'scale', 'factor': 0.5}])
+        recorded = []
+        chain.apply(gradient(64, 48), record=lambda label, seconds: recorded.append(label))
+        self.assertEqual(recorded, ['scale', 'redact', 'scale2'])
+        self.assertEqual(chain.describe(), 'scale 0.5 > redact 0,0,1,1 > scale 0.5')
+
+    def testConvertsToRgb(self):
+        image = StageChain([]).apply(gradient(8, 8).convert('RGBA'))
+        self.assertEqual(image.mode, 'RGB')
+
+    def testScale(self):
+        image = Image.new('RGB', (4, 2))
+        image.putdata([(0, 0, 0), (2, 2, 2), (10, 10, 10), (20, 20, 20), (4, 4, 4), (6, 6, 6), (30, 30, 30), (40, 40, 40)])
+        scaled = StageChain([ScaleStage(0.5)]).apply(image)
+        self.assertEqual(scaled.tobytes(), bytes([3] * 3 + [25] * 3))
+        self.assertEqual(StageChain([ScaleStage(0.3)]).apply(gradient(100, 50)).size, (30, 15))
+
+    def testRedactOutsideScreenshot(self):
+        image = StageChain([RedactStage(60, 40, 100, 100, '#ff0000')]).apply(gradient(64, 48))
+        self.assertEqual(image.getpixel((63, 47)), (255, 0, 0))
+        self.assertNotEqual(image.getpixel((59, 47)), (255, 0, 0))
+
+    def testTimestampStaysInCorner(self):
+        image = Image.new('RGB', (400, 200), (100, 100, 100))
+        stamped = StageChain([TimestampStage('top-left')]).apply(image, datetime(2026, 1, 2, 3, 4, 5))
+        left, top, right, bottom = Image.frombytes('L', image.size, bytes(a != b for a, b in zip(image.convert('L').tobytes(), stamped.convert('L').tobytes()))).getbbox()
+        self.assertEqual((left, top), (TIMESTAMP_PADDING, TIMESTAMP_PADDING))
+        self.assertLess(right, 200)
+        self.assertLess(bottom, 100)
+
+class TestStageSpecs(unittest.TestCase):
+    def testNoStages(self):
+        self.assertIsNone(createChain([]))
+
+    def testBadStages(self):
+        for spec in ({'stage': 'blur'}, {'stage': 'scale'}, {'stage': 'scale', 'factor': 2}, {'stage': 'redact', 'xOffset': 0, 'yOffset': 0, 'width': 0, 'height': 1},
+                     {'stage': 'redact', 'xOffset': 0, 'yOffset': 0, 'width': 1, 'height': 1, 'color': 'nope'}, {'stage': 'timestamp', 'position': 'middle'}):
+            with self.assertRaises(ValueError, msg=spec):
+                createStage(spec)
+
+    def testParseStage(self):
+        self.assertEqual(parseStage('scale:0.5'), {'stage': 'scale', 'factor': 0.5})
+        self.assertEqual(parseStage('redact:1,2,3,4:red'), {'stage': 'redact', 'xOffset': 1, 'yOffset': 2, 'width': 3, 'height': 4, 'color': 'red'})
+        self.assertEqual(parseStage('timestamp:top-left:%H:%M'), {'stage': 'timestamp', 'position': 'top-left', 'format': '%H:%M'})
+        for text in ('scale:half', 'redact:1,2,3', 'blur:2'):
+            with self.assertRaises(ValueError, msg=text):
+                parseStage(text)
+
+class TestWithoutNumpy(unittest.TestCase):
+    def testImportDoesNotLoadNumpy(self):
+        # numpy takes a while to import, and is only needed once a chain is applied
+        result = subprocess.run([sys.executable, '-c', 'import sys, scCore.Processing; print("numpy" in sys.modules)'], capture_output=True, text=True, check=True, cwd=Path(__file__).parent.parent)
+        self.assertEqual(result.stdout.strip(), 'False')
+
+    def testChainNeedsNumpy(self):
+        with mock.patch('importlib.util.find_spec', return_value=None) as findSpec:
+            with self.assertRaisesRegex(ValueError, 'pip install numpy'):
+                createChain([{'stage': 'scale', 'factor': 0.5}])
+        findSpec.assert_called_with('numpy')
+
+    def testNoStagesWithoutNumpy(self):
+        with mock.patch('importlib.util.find_spec', return_value=None):
+            self.assertIsNone(createChain([]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""Moving screenshots out of the spool without replacing files, and recovering a spool left by a previous run
+Run with: python -m pytest tests
+"""
+from scCore.SpoolMover import SpoolMover, moveFile, PART_SUFFIX
+from scCore.Broadcaster import Broadcaster
+from pathlib import Path
+from unittest import mock
+import tempfile
+import unittest
+import errno
+import os
+
+def name(index:int) -> str:
+    return f'Screenshot 2026-01-02_{index}.png'
+
+class TestMoveFile(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.folder = Path(self._folder.name)
+        self.source = self.folder / 'source.png'
+        self.source.write_bytes(b'new')
+        self.target = self.folder / 'target.png'
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def assertNotReplaced(self):
+        self.target.write_bytes(b'old')
+        with self.assertRaises(FileExistsError):
+            moveFile(self.source, self.target)
+        self.assertEqual(self.target.read_bytes(), b'old')
+        self.assertEqual(self.source.read_bytes(), b'new')
+
+    def testMoves(self):
+        moveFile(self.source, self.target)
+        self.assertFalse(self.source.exists())
+        self.assertEqual(self.target.read_bytes(), b'new')
+
+    def testRefusesToReplace(self):
+        self.assertNotReplaced()
+
+    def testRefusesToReplaceWithoutHardLinks(self):
+        with mock.patch('os.link', side_effect=OSError(errno.EPERM, 'Operation not permitted')):
+            self.assertNotReplaced()
+            self.target.unlink()
+            moveFile(self.source, self.target)
+        self.assertEqual(self.target.read_bytes(), b'new')
+
+    def testAcrossDrives(self):
+        link = os.link
+        def linkAcrossDrives(source, target):
+            # Only the first link, from the source, crosses drives. The .part copy is on the destination drive.
+            if Path(source) == self.source:
+                raise OSError(errno.EXDEV, 'Invalid cross-device link')
+            link(source, target)
+        with mock.patch('os.link', side_effect=linkAcrossDrives):
+            self.assertNotReplaced()
+            self.assertFalse(self.target.with_name(self.target.name + PART_SUFFIX).exists())
+            self.target.unlink()
+            moveFile(self.source, self.target)
+        self.assertFalse(self.source.exists())
+        self.assertEqual(self.target.read_bytes(), b'new')
+
+class TestSpoolMover(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.spoolDir = Path(self._folder.name) / 'spool'
+        self.destination = Path(self._folder.name) / 'destination'
+        self.spoolDir.mkdir()
+        self.destination.mkdir()
+        self.mover = SpoolMover(self.spoolDir, self.destination, Broadcaster(), movers=2)
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def testRecover(self):
+        (self.spoolDir / name(1)).write_bytes(b'complete')
+        (self.spoolDir / name(10)).write_bytes(b'complete')
+        (self.spoolDir / name(2)).write_bytes(b'complete')
+        # Placeholder of a screenshot that was never written, and a screenshot cut short
+        (self.spoolDir / name(3)).touch()
+        (self.spoolDir / (name(4) + PART_SUFFIX)).write_bytes(b'cut')
+        (self.spoolDir / 'notes.txt').write_bytes(b'not a screenshot')
+        found = self.mover.recover()
+        self.assertEqual([path.name for path in found], [name(1), name(2), name(10)])
+        self.assertEqual(sorted(path.name for path in self.spoolDir.iterdir()), sorted([name(1), name(2), name(10), 'notes.txt']))
+
+    def testStartMovesLeftovers(self):
+        for i in range(1, 6):
+            (self.spoolDir / name(i)).write_bytes(b'complete')
+        (self.spoolDir / name(6)).touch()
+        self.mover.start()
+        self.assertEqual(self.mover.stop(timeout=10), 0)
+        self.assertEqual(sorted(path.name for path in self.destination.iterdir()), sorted(name(i) for i in range(1, 6)))
+        self.assertEqual(list(self.spoolDir.iterdir()), [])
+        self.assertEqual(self.mover.moved, 5)
+
+    def testMovesAddedFiles(self):
+        self.mover.start()
+        other = Path(self._folder.name) / 'other'
+        other.mkdir()
+        for i in range(1, 4):
+            path = self.spoolDir / name(i)
+            path.write_bytes(b'complete')
+            self.mover.add(path, other if i == 2 else None)
+        self.assertEqual(self.mover.stop(timeout=10), 0)
+        self.assertEqual(sorted(path.name for path in self.destination.iterdir()), [name(1), name(3)])
+        self.assertEqual([path.name for path in other.iterdir()], [name(2)])
+
+    def testNameTakenInDestination(self):
+        (self.destination / name(1)).write_bytes(b'old')
+        self.mover.start()
+        for i in range(1, 3):
+            path = self.spoolDir / name(i)
+            path.write_bytes(b'new')
+            self.mover.add(path)
+        self.mover.stop(timeout=10)
+        self.assertEqual((self.destination / name(1)).read_bytes(), b'old')
+        self.assertEqual((self.spoolDir / name(1)).read_bytes(), b'new')
+        self.assertEqual((self.destination / name(2)).read_bytes(), b'new')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""Token bucket of the rate limiter, and the limits capture triggers apply to key presses
+Run with: python -m pytest tests
+"""
+from scCore.RateLimiter import RateLimiter
+from scCore.CaptureTrigger import CaptureTrigger, SUPPRESSED_INTERVAL, SUPPRESSED_RATE, SUPPRESSED_COALESCED
+from scCore.Options import toOptions, validateOptions, PATH_KEY, X_OFFSET_KEY, Y_OFFSET_KEY, WIDTH_KEY, HEIGHT_KEY, LOG_LEVEL_KEY
+from scCore.Broadcaster import Broadcaster
+from unittest import mock
+import threading
+import tempfile
+import unittest
+
+class Clock(object):
+    """Stands in for the time module, so that triggers can be fired at chosen times"""
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+class TestRateLimiter(unittest.TestCase):
+    def testUnlimited(self):
+        limiter = RateLimiter(0)
+        self.assertTrue(all(limiter.tryAcquire(0) for i in range(1000)))
+
+    def testBucketThenRate(self):
+        limiter = RateLimiter(5, bucket=10)
+        self.assertEqual(sum(limiter.tryAcquire(0) for i in range(20)), 10)
+        # One token every 0.2s
+        self.assertFalse(limiter.tryAcquire(0.1))
+        self.assertTrue(limiter.tryAcquire(0.2))
+        self.assertFalse(limiter.tryAcquire(0.3))
+        self.assertTrue(limiter.tryAcquire(0.4))
+
+    def testRefillStopsAtBucket(self):
+        limiter = RateLimiter(5, bucket=3)
+        for i in range(3):
+            limiter.tryAcquire(0)
+        # An hour of quiet only refills the bucket
+        self.assertEqual(sum(limiter.tryAcquire(3600) for i in range(10)), 3)
+
+    def testSustainedRate(self):
+        limiter = RateLimiter(4, bucket=1)
+        # A stuck key repeating 64 times a second for 10 seconds
+        allowed = sum(limiter.tryAcquire(i / 64) for i in range(640))
+        self.assertEqual(allowed, 40)
+
+    def testBucketOfZero(self):
+        limiter = RateLimiter(2, bucket=0)
+        self.assertEqual(limiter.bucket, 1)
+        self.assertEqual([limiter.tryAcquire(t) for t in (0, 0, 0.5)], [True, False, True])
+
+class TestCaptureTrigger(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch('scCore.CaptureTrigger.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def trigger(self, **kwargs) -> CaptureTrigger:
+        # Not started, so that fired captures stay waiting
+        return CaptureTrigger(lambda key: None, Broadcaster(), **kwargs)
+
+    def testMinInterval(self):
+        trigger = self.trigger(minInterval=0.25)
+        self.assertTrue(trigger.fire('a'))
+        trigger._pending.clear()
+        self.clock.now += 0.125
+        self.assertFalse(trigger.fire('a'))
+        # Other keys have intervals of their own
+        self.assertTrue(trigger.fire('b'))
+        self.clock.now += 0.125
+        self.assertTrue(trigger.fire('a'))
+        self.assertEqual(trigger.suppressed()[SUPPRESSED_INTERVAL], 1)
+
+    def testRate(self):
+        trigger = self.trigger(rate=2, bucket=2)
+        self.assertEqual([trigger.fire(key) for key in 'abc'], [True, True, False])
+        self.clock.now += 0.5
+        self.assertTrue(trigger.fire('c'))
+        self.assertEqual(trigger.suppressed()[SUPPRESSED_RATE], 1)
+
+    def testCoalesced(self):
+        trigger = self.trigger()
+        self.assertTrue(trigger.fire('a'))
+        self.assertFalse(trigger.fire('a'))
+        self.assertTrue(trigger.fire('b'))
+        self.assertEqual(trigger.suppressed(), {SUPPRESSED_INTERVAL: 0, SUPPRESSED_RATE: 0, SUPPRESSED_COALESCED: 1})
+
+    def testConfigure(self):
+        trigger = self.trigger()
+        trigger.configure(0, 1, 1)
+        self.assertEqual([trigger.fire(key) for key in 'ab'], [True, False])
+
+class TestDefaultLimits(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.options = toOptions({PATH_KEY: self._folder.name, X_OFFSET_KEY: 0, Y_OFFSET_KEY: 0, WIDTH_KEY: 100, HEIGHT_KEY: 100, LOG_LEVEL_KEY: 'INFO'})
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def testOffByDefault(self):
+        self.assertEqual((self.options.minInterval, self.options.captureRate, self.options.captureBucket), (0, 0, 0))
+        validateOptions(self.options)
+
+    def testEveryPressCaptured(self):
+        # Presses as fast as the captures run, as a key held down or a macro tool sends them
+        captured = []
+        done = threading.Event()
+        def capture(key):
+            captured.append(key)
+            done.set()
+        options = self.options
+        trigger = CaptureTrigger(capture, Broadcaster(), options.minInterval, options.captureRate, options.captureBucket)
+        trigger.start()
+        try:
+            for i in range(50):
+                done.clear()
+                self.assertTrue(trigger.fire('f12'))
+                self.assertTrue(done.wait(5))
+        finally:
+            trigger.stop()
+        self.assertEqual(len(captured), 50)
+        self.assertEqual(trigger.suppressedCount(), 0)
+
+if __name__ == '__main__':
+    unittest.main()